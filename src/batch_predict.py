@@ -0,0 +1,178 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Streaming helpers for scoring screening files larger than memory. Only the
+# columns a model needs are parsed, the file is read in fixed-size chunks and
+# predictions are appended to the output as each chunk is scored, so memory
+# depends on the chunk size and not on the number of peptides.
+#
+# Files can also be split into line-aligned byte ranges read by separate
+# worker processes, and TopK keeps the best rows of a stream by one column.
+# Every reader also takes a feature store directory (feature_store.py) in place
+# of a CSV, its columns are then read from the memory-mapped arrays and shards
+# are row ranges.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import io
+import os
+import heapq
+import numpy as np
+import pandas as pd
+from feature_store import FeatureStore, is_store
+from timing import tracer
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def csv_columns(filename):
+    """Column names of a CSV as pandas reads them (a repeated 'PI' becomes 'PI.1')."""
+    if is_store(filename):
+        return list(FeatureStore(filename).columns)
+    return pd.read_csv(filename, nrows=0).columns.tolist()
+
+
+def _usecols(filename, header, columns):
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise ValueError('%s is missing %d column(s): %s' % (filename, len(missing), ', '.join(missing)))
+    return [header.index(c) for c in columns]
+
+
+def _traced(chunks):
+    """The chunks of a reader with the time spent reading each one in a 'load' span."""
+    if not tracer.enabled:
+        yield from chunks
+        return
+    chunks = iter(chunks)
+    while True:
+        with tracer.span('load'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        tracer.count('rows read', len(chunk))
+        yield chunk
+
+
+def read_columns(filename, columns, chunk_size=50000):
+    """Yield DataFrames of chunk_size rows holding only the given columns.
+
+    Raises a ValueError when the file lacks one of the columns.
+    """
+    columns = list(dict.fromkeys(columns))
+    usecols = _usecols(filename, csv_columns(filename), columns)
+    if is_store(filename):
+        yield from _traced(FeatureStore(filename).iter_frames(columns, chunk_size))
+        return
+    yield from _traced(chunk[columns] for chunk in pd.read_csv(filename, usecols=usecols, chunksize=chunk_size))
+
+
+def shard_ranges(filename, n_shards):
+    """Split the rows of a CSV into at most n_shards line-aligned byte ranges [start, end).
+
+    The ranges of a feature store are row ranges.
+    """
+    if is_store(filename):
+        rows = len(FeatureStore(filename))
+        bounds = [rows * i // n_shards for i in range(n_shards + 1)]
+        return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        f.readline()
+        bounds = [f.tell()]
+        for i in range(1, n_shards):
+            # Seeking one byte back lands on a line start when the offset already is one
+            offset = bounds[0] + (size - bounds[0]) * i // n_shards
+            f.seek(max(offset - 1, bounds[0]))
+            f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+        bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def read_shard(filename, columns, start, end, chunk_size=50000):
+    """read_columns() restricted to the rows in the byte range [start, end)."""
+    yield from _traced(_read_shard(filename, columns, start, end, chunk_size))
+
+
+def _read_shard(filename, columns, start, end, chunk_size):
+    columns = list(dict.fromkeys(columns))
+    header = csv_columns(filename)
+    usecols = _usecols(filename, header, columns)
+    if is_store(filename):
+        yield from FeatureStore(filename).iter_frames(columns, chunk_size, start, end)
+        return
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            lines = []
+            while len(lines) < chunk_size and pos < end:
+                line = f.readline()
+                if not line:
+                    break
+                lines.append(line)
+                pos += len(line)
+            if not lines:
+                break
+            chunk = pd.read_csv(io.BytesIO(b''.join(lines)), header=None, names=header, usecols=usecols)
+            yield chunk[columns]
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class CSVAppender:
+    """Appends DataFrames with the given columns to a CSV, starting a new file."""
+
+    def __init__(self, filename, columns):
+        self.filename = filename
+        self.columns = list(columns)
+        self.rows = 0
+        pd.DataFrame(columns=self.columns).to_csv(filename, index=False)
+
+    def write(self, df):
+        with tracer.span('write'):
+            df.to_csv(self.filename, mode='a', header=False, index=False, columns=self.columns)
+        self.rows += len(df)
+
+
+class TopK:
+    """The k best rows of a stream of DataFrames by one column.
+
+    Rows with a larger value rank first, or a smaller one with largest=False;
+    rows without a value are skipped and ties go to the row seen first.
+    Every push keeps at most k rows in a heap, and merge() combines the heaps
+    of several streams (e.g. worker shards) into the exact overall top k.
+    """
+
+    def __init__(self, k, column, largest=True):
+        self.k = k
+        self.column = column
+        self.largest = largest
+        self.heap = []  # (score, -order, row), the worst kept row first
+
+    def push(self, df, order=0):
+        """Offer the rows of df, order is the stream position of its first row."""
+        values = df[self.column].to_numpy(dtype=np.float64)
+        scores = values if self.largest else -values
+        index = np.flatnonzero(~np.isnan(scores))
+        if len(index) > self.k:
+            # Rows below the k-th best score of the chunk can not make it into the heap
+            kth = np.partition(scores[index], len(index) - self.k)[len(index) - self.k]
+            index = index[scores[index] >= kth]
+        rows = df.iloc[index].itertuples(index=False, name=None)
+        for i, row in zip(index, rows):
+            item = (scores[i], -(order + int(i)), row)
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, item)
+            elif item > self.heap[0]:
+                heapq.heapreplace(self.heap, item)
+
+    @staticmethod
+    def merge(heaps, k, columns):
+        """DataFrame of the k best rows of several heaps, best first."""
+        best = heapq.nlargest(k, (item for heap in heaps for item in heap))
+        return pd.DataFrame([row for _, _, row in best], columns=columns)
+
+    def result(self, columns):
+        return TopK.merge([self.heap], self.k, columns)
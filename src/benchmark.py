@@ -0,0 +1,351 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Benchmark suite for the training and prediction scripts. Synthetic peptide
+# files are generated with the column schema of the real data (random
+# sequences featurized by peptide_features.py plus the id and response
+# columns of each file) and cached in a work directory. Each case imports the
+# script it measures, points its file names at the synthetic data and runs it
+# in a fresh process, so the peak RSS recorded is the one of that case alone:
+#
+#   sweep    forward selection inner loop of mbic_svm_train.py, mbic_svr_train.py
+#            and mbec_train.py, fits per second and seconds per sweep cell
+#   cv       the cross validation of mbic_full_model.py
+#   mbic     mbic_test_predictions.py scoring, milliseconds per 1k peptides
+#   mbec     mbec_test.py scoring, milliseconds per 1k peptides
+#
+# Results are written as JSON together with the host, library versions and git
+# commit, and two result files are compared with the compare command.
+#
+# Usage: python benchmark.py run [--cases sweep cv mbic mbec] [--sizes 10000 100000 1000000]
+#                                [--work-dir DIR] [--output benchmark_results.json] [--seed 0]
+#        python benchmark.py compare <baseline.json> <results.json>
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import contextlib
+import subprocess
+import importlib.util
+import multiprocessing
+import numpy as np
+import pandas as pd
+import sklearn
+from peptide_features import AA_LETTERS, featurize
+from forward_selection import FeatureMatrix
+from sweep import SweepExecutor
+from checkpoint import atomic_write_json
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+FORMAT_VERSION = 1
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+CASES = ('sweep', 'cv', 'mbic', 'mbec')
+SIZES = (10000, 100000, 1000000)
+
+# Rows of the real training files, the synthetic ones have the same size
+TRAINING_ROWS = {'mbic': 178, 'mbec': 42}
+PATHOGENS = ['Pseudomonas aeruginosa', 'Staphylococcus aureus', 'Escherichia coli', 'Acinetobacter baumannii']
+
+# Forward selection scripts and the kind of their training file
+SWEEP_SCRIPTS = [('mbic/mbic_svm_train.py', 'mbic'), ('mbic/mbic_svr_train.py', 'mbic'), ('mbec/mbec_train.py', 'mbec')]
+sweep_features = 2      # Features of each candidate subset, PCA n runs from 1 to this
+sweep_candidates = 1    # Candidate subsets scored per script
+sweep_grid_step = 5     # Every 5th C and gamma of the script grid, from the smallest to the largest
+generate_chunk = 100000 # Synthetic peptides featurized at a time
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def random_sequences(n, rng):
+    """Random peptides with lengths spread like the training peptides (median 16, 4 to 80)."""
+    lengths = np.clip(rng.lognormal(np.log(16), 0.45, n).astype(int), 4, 80)
+    letters = np.array(list(AA_LETTERS))
+    return [''.join(letters[rng.integers(0, len(letters), length)]) for length in lengths]
+
+
+def synthetic_peptides(n, kind, seed=0, start=0):
+    """DataFrame of n synthetic peptides with the columns of a real file of the given kind.
+
+    kind is 'mbic' or 'mbec' (training files) or 'screen' (a screening file
+    like test_peptide_data.csv). Responses depend on a few descriptors plus
+    noise, so the models have something to learn. start numbers the peptides
+    and seeds the generator, chunks of a large file are independent of each other.
+    """
+    rng = np.random.default_rng([seed, start])
+    sequences = random_sequences(n, rng)
+    peptides = featurize(sequences, ['syn%d' % i for i in range(start, start + n)])
+    z = (peptides['K'] + peptides['R'] - peptides['D'] - peptides['E']) / 10.0 - peptides['PI'] / 20.0
+    z = (z - z.mean()) / max(z.std(), 1e-9) + rng.normal(0, 0.5, n)
+    if kind == 'mbic':
+        # About a tenth of the peptides above the 64uM cut and listed last, as in the
+        # training data (mbic_full_model.py relies on that order)
+        peptides.insert(1, 'Pathogen', rng.choice(PATHOGENS, n))
+        peptides.insert(2, 'MBIC', np.round(np.clip(64 * 2 ** (2 * (z - 1.4)), 1, 640), 1))
+        peptides.insert(3, 'Type', 1)
+        peptides = peptides.sort_values('MBIC', key=lambda mbic: mbic > 64, kind='stable', ignore_index=True)
+    elif kind == 'mbec':
+        peptides.insert(1, 'MBEC(uM)', np.round(np.clip(24 * 2 ** z, 1, 64), 2))
+    else:
+        peptides = peptides.drop(columns=['Seq'])
+        peptides.insert(1, 'Decision Fn', rng.normal(0, 1, n))
+    return peptides
+
+
+def dataset(work_dir, kind, n, seed=0):
+    """Path of a cached synthetic CSV, generated chunk by chunk on first use."""
+    filename = os.path.join(work_dir, 'synthetic_%s_%d_seed%d.csv' % (kind, n, seed))
+    if os.path.exists(filename):
+        return filename
+    tmp_filename = filename + '.tmp'
+    for start in range(0, n, generate_chunk):
+        peptides = synthetic_peptides(min(generate_chunk, n - start), kind, seed, start)
+        # The dipeptide 'PI' is written as 'PI' like the real files, pandas reads it as 'PI.1'
+        header = ['PI' if c == 'PI.1' else c for c in peptides.columns]
+        peptides.to_csv(tmp_filename, mode='w' if start == 0 else 'a', header=header if start == 0 else False,
+                        index=False)
+    os.replace(tmp_filename, filename)
+    return filename
+
+
+def load_script(relative_path):
+    """Import one of the training or prediction scripts as a module, without running main()."""
+    path = os.path.join(SRC_DIR, relative_path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=SRC_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_sweep(work_dir, seed, script, kind):
+    """Fits per second of the forward selection inner loop of one training script.
+
+    Scores sweep_candidates subsets of sweep_features features over every
+    sweep_grid_step-th C and gamma of the script grid and every PCA n, in this
+    process and without the score cache, like a forward selection step on one
+    worker. A cell costs about a second, so the full 240 cell grid is left out.
+    """
+    module = load_script(script)
+    peptides = pd.read_csv(dataset(work_dir, kind, TRAINING_ROWS[kind], seed))
+    if kind == 'mbic':
+        if 'svm' in script:
+            y = (peptides['MBIC'] <= 64).astype(int).to_numpy()
+        else:
+            peptides = peptides[peptides['MBIC'] <= 64]
+            y = peptides['MBIC'].to_numpy()
+        peptides = peptides.drop(columns=['MBIC', 'Name', 'Pathogen', 'Type', 'Seq'])
+    else:
+        y = peptides['MBEC(uM)'].to_numpy()
+        peptides = peptides.drop(columns=['MBEC(uM)', 'Name', 'Seq'])
+    matrix = FeatureMatrix.from_dataframe(peptides)
+
+    # Candidates extend the same base subset, as within a forward selection step
+    base = list(range(sweep_features - 1))
+    subsets = [base + [j] for j in range(sweep_features - 1, sweep_features - 1 + sweep_candidates)]
+    maximize = 'svm' in script
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            SweepExecutor(module.score_folds, matrix, y, module.C[::sweep_grid_step],
+                          module.gamma[::sweep_grid_step], maximize=maximize,
+                          cv_seed=module.cv_seed, workers=1, n_splits=module.n_splits,
+                          n_repeats=module.n_repeats) as sweep:
+        cells = sum(len(sweep.grid(cols)) for cols in subsets)
+        start = time.perf_counter()
+        sweep.score_candidates(subsets, sweep_features)
+        seconds = time.perf_counter() - start
+    fits = cells * module.n_splits * module.n_repeats
+    return {'script': os.path.basename(script), 'rows': len(y), 'cells': cells, 'fits': fits,
+            'seconds': seconds, 'fits_per_second': fits / seconds, 'seconds_per_cell': seconds / cells}
+
+
+def bench_cv(work_dir, seed):
+    """Wall time of the full MBIC cascade cross validation of mbic_full_model.py."""
+    module = load_script('mbic/mbic_full_model.py')
+    module.training_filename = dataset(work_dir, 'mbic', TRAINING_ROWS['mbic'], seed)
+    module.svm_features_filename = os.path.join(SRC_DIR, 'mbic', module.svm_features_filename)
+    module.svr_features_filename = os.path.join(SRC_DIR, 'mbic', module.svr_features_filename)
+    module.svr_svm_results = os.path.join(work_dir, 'full_model_results.json')
+    if os.path.exists(module.svr_svm_results):
+        os.remove(module.svr_svm_results)
+    folds = module.n_splits * module.n_repeats
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        module.main()
+        seconds = time.perf_counter() - start
+    return {'script': 'mbic_full_model.py', 'rows': TRAINING_ROWS['mbic'], 'folds': folds,
+            'seconds': seconds, 'folds_per_second': folds / seconds}
+
+
+def _prediction_script(work_dir, seed, case):
+    if case == 'mbic':
+        module = load_script('mbic/mbic_test_predictions.py')
+        module.svm_features_filename = os.path.join(SRC_DIR, 'mbic', module.svm_features_filename)
+        module.svr_features_filename = os.path.join(SRC_DIR, 'mbic', module.svr_features_filename)
+        module.svm_artifact_path = os.path.join(work_dir, 'mbic_svm_model')
+        module.svr_artifact_path = os.path.join(work_dir, 'mbic_svr_model')
+    else:
+        module = load_script('mbec/mbec_test.py')
+        module.fs_filename = os.path.join(SRC_DIR, 'mbec', module.fs_filename)
+        module.artifact_path = os.path.join(work_dir, 'mbec_model')
+    module.training_filename = dataset(work_dir, case, TRAINING_ROWS[case], seed)
+    module.pred_filename = os.path.join(work_dir, '%s_predictions.csv' % case)
+    return module
+
+
+def bench_scoring(work_dir, seed, case, rows):
+    """Latency per 1k peptides of mbic_test_predictions.py or mbec_test.py on a file of rows peptides.
+
+    The models are fitted on a small file first, the timed run loads them
+    and measures reading, scoring and writing the predictions.
+    """
+    module = _prediction_script(work_dir, seed, case)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        module.test_filename = dataset(work_dir, 'screen', 1000, seed)
+        module.main()
+        module.test_filename = dataset(work_dir, 'screen', rows, seed)
+        start = time.perf_counter()
+        module.main()
+        seconds = time.perf_counter() - start
+    script = 'mbic_test_predictions.py' if case == 'mbic' else 'mbec_test.py'
+    return {'script': script, 'rows': rows, 'seconds': seconds,
+            'ms_per_1k': 1e6 * seconds / rows, 'peptides_per_second': rows / seconds}
+
+
+def _run_child(conn, target, work_dir, args):
+    os.chdir(work_dir)
+    conn.send(target(*args))
+    conn.close()
+
+
+def in_child(target, work_dir, *args):
+    """target(*args) run in a fresh process with work_dir as its working directory.
+
+    The process is spawned rather than forked, so its peak RSS does not start
+    from the one of this process.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    receiver, sender = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_child, args=(sender, target, work_dir, args))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError('%s%s failed with exit code %s' % (target.__name__, args[1:], process.exitcode))
+    return result
+
+
+def measure(bench, *args):
+    """Result of one benchmark with its wall time and the peak RSS of the process."""
+    start = time.perf_counter()
+    result = bench(*args)
+    result['wall_seconds'] = time.perf_counter() - start
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def run(cases, sizes, work_dir, seed=0):
+    """Results of the given cases; the scoring cases run once per size."""
+    work_dir = os.path.abspath(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    units = []
+    for case in cases:
+        if case == 'sweep':
+            units += [('sweep', bench_sweep, (work_dir, seed, script, kind)) for script, kind in SWEEP_SCRIPTS]
+        elif case == 'cv':
+            units.append(('cv', bench_cv, (work_dir, seed)))
+        else:
+            units += [(case, bench_scoring, (work_dir, seed, case, rows)) for rows in sizes]
+
+    results = []
+    for name, bench, args in units:
+        if bench is bench_scoring:
+            print('Generating %d synthetic peptides' % args[3])
+            in_child(dataset, work_dir, work_dir, 'screen', args[3], seed)
+        result = dict(case=name, **in_child(measure, work_dir, bench, *args))
+        print('%-6s %-26s rows: %-8d %8.2f s  peak RSS: %7.1f MB'
+              % (name, result['script'], result['rows'], result['seconds'], result['peak_rss_mb']))
+        results.append(result)
+    return results
+
+
+def result_key(result):
+    return result['case'], result['script'], result['rows']
+
+
+def compare(baseline, current):
+    """Lines comparing the seconds and peak RSS of the cases found in both result files."""
+    old = {result_key(r): r for r in baseline['results']}
+    lines = ['%-6s %-26s %8s %10s %10s %7s %10s %10s'
+             % ('case', 'script', 'rows', 'base s', 'new s', 'speedup', 'base MB', 'new MB')]
+    for r in current['results']:
+        b = old.get(result_key(r))
+        if b is None:
+            continue
+        lines.append('%-6s %-26s %8d %10.2f %10.2f %6.2fx %10.1f %10.1f'
+                     % (r['case'], r['script'], r['rows'], b['seconds'], r['seconds'],
+                        b['seconds'] / r['seconds'], b['peak_rss_mb'], r['peak_rss_mb']))
+    return lines
+
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the training and prediction scripts')
+    commands = parser.add_subparsers(dest='command', required=True)
+    bench = commands.add_parser('run', help='run benchmarks and write the results as JSON')
+    bench.add_argument('--cases', nargs='+', default=list(CASES), choices=CASES)
+    bench.add_argument('--sizes', nargs='+', type=int, default=list(SIZES), help='peptides scored by mbic/mbec')
+    bench.add_argument('--work-dir', default='benchmark_data', help='synthetic data and model artifacts')
+    bench.add_argument('--output', default='benchmark_results.json')
+    bench.add_argument('--seed', type=int, default=0)
+    diff = commands.add_parser('compare', help='compare two result files')
+    diff.add_argument('baseline')
+    diff.add_argument('results')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.results, encoding="utf-8") as f:
+            current = json.load(f)
+        print('\n'.join(compare(baseline, current)))
+        return
+
+    results = run(args.cases, args.sizes, args.work_dir, args.seed)
+    atomic_write_json(args.output, {
+        'format_version': FORMAT_VERSION, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': git_commit(), 'seed': args.seed,
+        'host': {'platform': platform.platform(), 'python': platform.python_version(),
+                 'numpy': np.__version__, 'pandas': pd.__version__, 'scikit-learn': sklearn.__version__,
+                 'cpu_count': os.cpu_count()},
+        'results': results})
+    print('Results written to ' + args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Cross validation of the full MBIC model, the SVM -> SVR cascade: the SVM
+# classifies a peptide as MBIC <= threshold (1) or above (0), and the peptides
+# classified as 1 are routed to the SVR, which predicts their MBIC. The SVR is
+# trained on the training peptides with MBIC <= threshold.
+#
+# The scaled and PCA transformed peptides only depend on the feature sets, the
+# PCA counts and the threshold, so their squared distance matrices are computed
+# once and every fold slices its RBF kernels out of them (see kernel_cache.py).
+# Folds are spread over a pool of worker processes, and each fold reports the
+# SVM MCC, the routing confusion (MBIC <= threshold against routed to the SVR)
+# and the RMSE of the SVR on the peptides routed to it. A CascadeResult keeps
+# them per fold and is written once as JSON.
+#
+# Several thresholds are evaluated in one pass: they share the folds, the SVM
+# transform and the SVM kernels of every fold, and threshold_table() turns
+# their results into one threshold vs RMSE/MCC table.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import multiprocessing
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+from sklearn.decomposition import PCA
+from sklearn.svm import SVC, SVR
+from sklearn.metrics import matthews_corrcoef
+from sklearn.model_selection import RepeatedStratifiedKFold
+from checkpoint import atomic_write_json
+from kernel_cache import squared_distances, fold_kernels
+from sweep import limit_blas_threads
+from timing import tracer
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+FORMAT_VERSION = 1
+CONFUSION = ('tn', 'fp', 'fn', 'tp')    # Positive: MBIC <= threshold / routed to the SVR
+
+_worker_state = {}
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def pca_transform(X, n_components, rows=None):
+    """X min-max scaled and projected on n_components principal components, both fitted on rows (all by default)."""
+    fit = X if rows is None else X[rows]
+    with tracer.span('scale'):
+        scaler = MinMaxScaler().fit(fit)
+    with tracer.span('pca'):
+        pca = PCA(n_components=n_components).fit(scaler.transform(fit))
+        return pca.transform(scaler.transform(X))
+
+
+def evaluate_folds(data, thresholds, params, folds):
+    """Per-threshold, per-fold MCC, routing confusion, routed count and RMSE of (fold, train, test) splits.
+
+    Arrays have one row per threshold. The SVM kernels of a fold do not
+    depend on the threshold and are computed once for all of them.
+    """
+    svm_c, svm_g, svr_c, svr_g = params
+    shape = (len(thresholds), len(folds))
+    mcc = np.empty(shape)
+    rmse = np.empty(shape)
+    routed = np.empty(shape, dtype=np.int64)
+    confusion = np.empty(shape + (len(CONFUSION),), dtype=np.int64)
+    labels = [data.labels(t) for t in thresholds]
+
+    for k, (_, train, test) in enumerate(folds):
+        K_train_svm, K_test_svm = fold_kernels(data.distances(thresholds[0])[0], svm_g, train, test)
+        for i, threshold in enumerate(thresholds):
+            label = labels[i]
+            with tracer.span('fit', model='SVC'):
+                svm_fit = SVC(kernel='precomputed', C=svm_c).fit(K_train_svm, label[train])
+            with tracer.span('predict', model='SVC'):
+                y_pred = svm_fit.predict(K_test_svm)
+            mcc[i, k] = matthews_corrcoef(label[test], y_pred)
+            actual = label[test] == 1
+            route = y_pred == 1
+            confusion[i, k] = [np.sum(~actual & ~route), np.sum(~actual & route),
+                               np.sum(actual & ~route), np.sum(actual & route)]
+
+            # The SVR learns the low MBIC training peptides and predicts the routed test peptides
+            train_svr = train[label[train] == 1]
+            test_svr = test[route]
+            routed[i, k] = len(test_svr)
+            if not len(test_svr):
+                rmse[i, k] = np.nan
+                continue
+            K_train, K_test = fold_kernels(data.distances(threshold)[1], svr_g, train_svr, test_svr)
+            with tracer.span('fit', model='SVR'):
+                svr_fit = SVR(kernel='precomputed', C=svr_c).fit(K_train, data.mbic[train_svr])
+            with tracer.span('predict', model='SVR'):
+                y_pred_svr = svr_fit.predict(K_test)
+            rmse[i, k] = np.sqrt(np.mean((data.mbic[test_svr] - y_pred_svr) ** 2))
+
+    return mcc, confusion, routed, rmse
+
+
+def threshold_table(results):
+    """DataFrame of the summary of each CascadeResult, one row per threshold."""
+    rows = []
+    for result in results:
+        summary = result.summary()
+        confusion = summary.pop('confusion')
+        rows.append(dict({'threshold': result.settings['threshold']}, **summary, **confusion))
+    return pd.DataFrame(rows)
+
+
+def rmse_se(rmse, n_splits):
+    """Standard error of the RMSE over the repeat averages, None with fewer than two repeats.
+
+    A fold routing no peptide to the SVR has a NaN RMSE, so each repeat is
+    averaged over its other folds and a repeat with none is left out.
+    """
+    repeats = len(rmse) // n_splits
+    rmse = rmse[:repeats * n_splits].reshape(repeats, n_splits)
+    counts = (~np.isnan(rmse)).sum(axis=1)
+    repeat_avg = np.nansum(rmse, axis=1)[counts > 0] / counts[counts > 0]
+    if len(repeat_avg) < 2:
+        return None
+    return float(np.std(repeat_avg, ddof=1) / np.sqrt(len(repeat_avg)))
+
+
+def _init_worker(data, trace=False):
+    limit_blas_threads()
+    tracer.reset()
+    tracer.enable(trace)
+    _worker_state['data'] = data
+
+
+def _run_folds(task):
+    thresholds, params, folds = task
+    result = evaluate_folds(_worker_state['data'], thresholds, params, folds)
+    return result, tracer.drain() if tracer.enabled else None
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class CascadeData:
+    """SVM and SVR descriptors and MBIC of the training peptides.
+
+    The SVM inputs are scaled and transformed on all peptides, the SVR inputs
+    on the peptides with MBIC <= threshold; every peptide is then transformed
+    with them. Distance matrices are computed on first use and kept.
+    """
+
+    def __init__(self, X_svm, X_svr, mbic, svm_pca_comp, svr_pca_comp):
+        self.X_svm = np.asarray(X_svm, dtype=np.float64)
+        self.X_svr = np.asarray(X_svr, dtype=np.float64)
+        self.mbic = np.asarray(mbic, dtype=np.float64)
+        self.svm_pca_comp = svm_pca_comp
+        self.svr_pca_comp = svr_pca_comp
+        self._svm_distances = None
+        self._svr_distances = {}
+
+    @classmethod
+    def from_table(cls, peptides, svm_features, svr_features, svm_pca_comp, svr_pca_comp):
+        """Inputs of a training DataFrame with an MBIC column."""
+        return cls(peptides[list(svm_features)].to_numpy(dtype=np.float64),
+                   peptides[list(svr_features)].to_numpy(dtype=np.float64),
+                   peptides['MBIC'].to_numpy(), svm_pca_comp, svr_pca_comp)
+
+    def labels(self, threshold):
+        """SVM labels, 1 for MBIC <= threshold."""
+        return (self.mbic <= threshold).astype(np.int64)
+
+    def distances(self, threshold):
+        """Squared distance matrices (SVM, SVR) between all peptides."""
+        if self._svm_distances is None:
+            self._svm_distances = squared_distances(pca_transform(self.X_svm, self.svm_pca_comp))
+        if threshold not in self._svr_distances:
+            X = pca_transform(self.X_svr, self.svr_pca_comp, self.mbic <= threshold)
+            self._svr_distances[threshold] = squared_distances(X)
+        return self._svm_distances, self._svr_distances[threshold]
+
+
+class CascadeResult:
+    """Per-fold scores of one cascade cross validation, folds in split order."""
+
+    def __init__(self, settings, mcc, confusion, routed, rmse, n_splits):
+        self.settings = settings
+        self.mcc = mcc
+        self.confusion = confusion
+        self.routed = routed
+        self.rmse = rmse
+        self.n_splits = n_splits
+
+    def __len__(self):
+        return len(self.rmse)
+
+    def summary(self):
+        """Fold averages, the standard error of the RMSE over repeat averages and the summed confusion."""
+        return {'folds': len(self), 'rmse_mean': float(np.nanmean(self.rmse)),
+                'rmse_se': rmse_se(self.rmse, self.n_splits),
+                'mcc_mean': float(np.mean(self.mcc)), 'routed_mean': float(np.mean(self.routed)),
+                'confusion': dict(zip(CONFUSION, (int(v) for v in self.confusion.sum(axis=0))))}
+
+    def to_dict(self):
+        return {'format_version': FORMAT_VERSION, 'settings': self.settings, 'summary': self.summary(),
+                'folds': [{'fold': k, 'repeat': k // self.n_splits, 'mcc': float(self.mcc[k]),
+                           'rmse': None if np.isnan(self.rmse[k]) else float(self.rmse[k]),
+                           'routed': int(self.routed[k]),
+                           'confusion': dict(zip(CONFUSION, (int(v) for v in self.confusion[k])))}
+                          for k in range(len(self))]}
+
+    def save(self, filename):
+        with tracer.span('write'):
+            atomic_write_json(filename, self.to_dict())
+
+
+class CascadeEvaluator:
+    """Repeated stratified cross validation of the cascade over a CascadeData.
+
+    Folds are stratified on the SVM labels and, with a cv_seed, the same at
+    every evaluation. evaluate_thresholds() scores several thresholds on the
+    same folds, stratified on the MBIC ranges between the thresholds. With
+    workers > 1 the folds run over a pool of worker processes, each of which
+    receives the data once; use as a context manager or close() it.
+    """
+
+    def __init__(self, data, n_splits=5, n_repeats=20, cv_seed=None, workers=1):
+        self.data = data
+        self.n_splits = n_splits
+        self.n_repeats = n_repeats
+        self.cv_seed = cv_seed
+        self.workers = max(1, workers or 1)
+        self.pool = None
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                             initargs=(data, tracer.enabled))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def splits(self, thresholds):
+        """(fold, train, test) index arrays of every fold, stratified on the number of thresholds >= MBIC."""
+        rskf = RepeatedStratifiedKFold(n_splits=self.n_splits, n_repeats=self.n_repeats, random_state=self.cv_seed)
+        for threshold in thresholds:
+            if len(np.unique(self.data.labels(threshold))) < 2:
+                raise ValueError('Threshold %s puts every peptide in one SVM class' % threshold)
+        strata = (self.data.mbic[:, None] <= np.asarray(thresholds, dtype=np.float64)[None, :]).sum(axis=1)
+        return [(k, train, test) for k, (train, test) in enumerate(rskf.split(np.zeros((len(strata), 1)), strata))]
+
+    def _evaluate(self, thresholds, params, folds):
+        if self.pool is None:
+            return evaluate_folds(self.data, thresholds, params, folds)
+        size = -(-len(folds) // self.workers)
+        tasks = [(thresholds, params, folds[i:i + size]) for i in range(0, len(folds), size)]
+        parts = []
+        for part, trace in self.pool.imap(_run_folds, tasks):
+            if trace is not None:
+                tracer.merge(trace)
+            parts.append(part)
+        return tuple(np.concatenate(arrays, axis=1) for arrays in zip(*parts))
+
+    def _settings(self, threshold, params):
+        return {'threshold': threshold, 'svm_c': params[0], 'svm_g': params[1], 'svr_c': params[2],
+                'svr_g': params[3], 'svm_pca_comp': self.data.svm_pca_comp, 'svr_pca_comp': self.data.svr_pca_comp,
+                'n_splits': self.n_splits, 'n_repeats': self.n_repeats, 'cv_seed': self.cv_seed}
+
+    def evaluate(self, svm_c, svm_g, svr_c, svr_g, threshold=64, early_stop=False, early_stop_se=1.0,
+                 early_stop_min_repeats=3):
+        """CascadeResult of the cross validation of one cascade.
+
+        With early_stop the evaluation stops after the first whole repeat,
+        from early_stop_min_repeats on, at which the standard error of the
+        repeat average RMSE is below early_stop_se. Repeats then run a few at
+        a time, the result is the same as evaluating them one by one.
+        """
+        params = (svm_c, svm_g, svr_c, svr_g)
+        thresholds = (threshold,)
+        folds = self.splits(thresholds)
+        ns = self.n_splits
+        if not early_stop:
+            arrays = self._evaluate(thresholds, params, folds)
+        else:
+            arrays = None
+            repeats = 0
+            step = max(early_stop_min_repeats, 1)
+            while repeats < self.n_repeats:
+                new = self._evaluate(thresholds, params, folds[repeats * ns:(repeats + step) * ns])
+                arrays = new if arrays is None else tuple(np.concatenate(a, axis=1) for a in zip(arrays, new))
+                stop = self._stop_repeat(arrays[3][0], repeats, early_stop_se, early_stop_min_repeats)
+                repeats = min(repeats + step, self.n_repeats)
+                if stop is not None:
+                    arrays = tuple(a[:, :stop * ns] for a in arrays)
+                    break
+                step = self.workers
+
+        settings = self._settings(threshold, params)
+        settings.update(early_stop=early_stop, early_stop_se=early_stop_se)
+        return CascadeResult(settings, *(a[0] for a in arrays), n_splits=ns)
+
+    def evaluate_thresholds(self, svm_c, svm_g, svr_c, svr_g, thresholds):
+        """CascadeResult of each threshold, all cross validated in one pass over the same folds."""
+        params = (svm_c, svm_g, svr_c, svr_g)
+        thresholds = tuple(thresholds)
+        arrays = self._evaluate(thresholds, params, self.splits(thresholds))
+        results = []
+        for i, threshold in enumerate(thresholds):
+            settings = self._settings(threshold, params)
+            settings['thresholds'] = list(thresholds)
+            results.append(CascadeResult(settings, *(a[i] for a in arrays), n_splits=self.n_splits))
+        return results
+
+    def _stop_repeat(self, rmse, first, early_stop_se, early_stop_min_repeats):
+        """First repeat count after the repeats before `first` at which the early stopping rule holds."""
+        ns = self.n_splits
+        for repeats in range(max(first + 1, early_stop_min_repeats), len(rmse) // ns + 1):
+            se = rmse_se(rmse[:repeats * ns], ns)
+            if se is not None and se < early_stop_se:
+                return repeats
+        return None
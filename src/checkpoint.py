@@ -0,0 +1,82 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Durable checkpoints for long forward selection runs. The checkpoint holds the
+# features selected so far and the scores of the candidates already evaluated
+# in the current step. It is rewritten atomically (temporary file, fsync,
+# rename) so a crash or preemption leaves either the old or the new state.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import os
+import json
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def atomic_write_json(filename, obj):
+    """Write obj as JSON to filename so readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(filename))
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding="utf-8") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def write_step_score(filename, nf, score):
+    """Record the score of selection step nf in a tab separated score file.
+
+    The lines of step nf and later are replaced, so a step redone after a
+    resume from a checkpoint does not leave a second line for it.
+    """
+    lines = []
+    if os.path.exists(filename):
+        with open(filename, encoding="utf-8") as f:
+            lines = [line for line in f if line.strip() and int(line.split('\t', 1)[0]) < nf]
+    lines.append('%s\t%s\n' % (nf, score))
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(tmp_filename, filename)
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class Checkpoint:
+    """Forward selection state stored in a JSON file.
+
+    config describes the run (data file, grid, CV settings). Resuming from a
+    checkpoint written with a different config raises a ValueError instead of
+    silently mixing scores of two different sweeps.
+    """
+
+    def __init__(self, filename, config=None):
+        self.filename = filename
+        self.config = config or {}
+
+    def load(self):
+        """Return (feat_list, scores) or None when there is no checkpoint.
+
+        scores maps the candidate features already evaluated in the current
+        step to their score.
+        """
+        if not os.path.exists(self.filename):
+            return None
+        with open(self.filename, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get('config') != json.loads(json.dumps(self.config)):
+            raise ValueError('Checkpoint %s was written with a different configuration, '
+                             'remove it to start a new run' % self.filename)
+        return state['feat_list'], state['scores']
+
+    def save(self, feat_list, scores):
+        atomic_write_json(self.filename, {'config': self.config,
+                                          'feat_list': list(feat_list),
+                                          'scores': dict(scores)})
@@ -0,0 +1,55 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Classification and ranking stage of the antibiofilm SVM (SVM-with-MERCI.ipynb).
+# The decision function of the fitted classifier is computed once over the
+# feature matrix, chunk by chunk, and the positives are selected and sorted by
+# decision value with array operations. Motif occurrence counts are read from
+# the MERCI locator output in one pass.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+from collections import Counter
+import numpy as np
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def decision_values(model, X, chunk_size=50000):
+    """Decision function of a binary classifier over the rows of X."""
+    X = np.asarray(X)
+    if X.shape[0] == 0:
+        return np.empty(0)
+    return np.concatenate([np.ravel(model.decision_function(X[start:start + chunk_size]))
+                           for start in range(0, X.shape[0], chunk_size)])
+
+
+def classify_and_rank(model, X, chunk_size=50000):
+    """Indices and decision values of the rows classified positive, best first.
+
+    A row is positive when the model predicts its second class, i.e. when its
+    decision value is above zero. Rows with equal decision values keep their
+    input order.
+    """
+    dec = decision_values(model, X, chunk_size)
+    positive = np.flatnonzero(dec > 0)
+    order = positive[np.argsort(-dec[positive], kind='stable')]
+    return order, dec[order]
+
+
+def rank_peptides(peptides, model, X, chunk_size=50000, column='Decision Fn'):
+    """Rows of peptides classified positive, sorted by decision value, with the value added.
+
+    X holds the model features of the rows of peptides, in the same order.
+    """
+    order, dec = classify_and_rank(model, X, chunk_size)
+    ranked = peptides.iloc[order].reset_index(drop=True)
+    ranked[column] = dec
+    return ranked
+
+
+def motif_counts(names, occurrences_filename):
+    """Number of '>name' entries of each peptide in a MERCI occurrences file."""
+    with open(occurrences_filename, "r") as f:
+        counts = Counter(f.read().split())
+    return np.array([counts['>' + str(name)] for name in names])
@@ -0,0 +1,232 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Binary columnar store of a descriptor CSV, so scripts do not parse the wide
+# CSV on every run. A store is a directory with a manifest.json (format
+# version, row count, column names in CSV order and the source file), one
+# features.npy holding every numeric column as a column-major float64 matrix,
+# so each column is a contiguous array, and one .npy per text column (Name,
+# Seq, ...). Opening a store memory-maps the arrays, a column is a view of the
+# file and a set of columns is read without touching the others.
+#
+# Scripts take either a CSV or a store wherever they read descriptors: see
+# read_table() here and read_columns() in batch_predict.py.
+#
+# Usage: python feature_store.py import <descriptors.csv> <store_dir> [--chunk-size N]
+#        python feature_store.py info <store_dir>
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import os
+import json
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+from checkpoint import atomic_write_json
+from timing import tracer
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+FEATURES = 'features.npy'
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def is_store(path):
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def read_table(source, columns=None):
+    """DataFrame of a feature store or, as a fallback, of a CSV file."""
+    with tracer.span('load'):
+        if is_store(source):
+            return FeatureStore(source).frame(columns)
+        df = pd.read_csv(source)
+        return df if columns is None else df[list(columns)]
+
+
+def _text_filename(column, suffix=''):
+    # Column names may hold characters that are not allowed in file names
+    return 'text_%s%s.npy' % (''.join(c if c.isalnum() else '_%02x' % ord(c) for c in column), suffix)
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class FeatureStore:
+    """Memory-mapped columnar store of a descriptor table.
+
+    Column names are the ones pandas gives the CSV columns (a repeated 'PI'
+    becomes 'PI.1'). Numeric columns are stored as float64 and integer columns
+    are read back as integers, text columns are strings.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError('Feature store %s has format version %s, this code reads version %d'
+                             % (path, manifest.get('format_version'), FORMAT_VERSION))
+        self.path = path
+        self.manifest = manifest
+        self.columns = manifest['columns']
+        self.numeric = manifest['numeric']
+        self.text = manifest['text']
+        self.integer = set(manifest['integer'])
+        self.index = {name: j for j, name in enumerate(self.numeric)}
+        self.values = np.load(os.path.join(path, FEATURES), mmap_mode='r')
+        if self.values.shape != (manifest['rows'], len(self.numeric)):
+            raise ValueError('Feature store %s: %s has shape %s, manifest says %s'
+                             % (path, FEATURES, self.values.shape, (manifest['rows'], len(self.numeric))))
+        self._text = {}
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    def column(self, name):
+        """One column, a view of the mapped file for numeric columns."""
+        if name in self.index:
+            return self.values[:, self.index[name]]
+        if name not in self.text:
+            raise KeyError('No column %r in feature store %s' % (name, self.path))
+        if name not in self._text:
+            self._text[name] = np.load(os.path.join(self.path, _text_filename(name)), mmap_mode='r')
+        return self._text[name]
+
+    def _text_values(self, name, start, stop):
+        """Object array of a text column with NaN for the missing values, as pandas reads them."""
+        values = self.column(name)[start:stop].astype(object)
+        if name in self.manifest['missing']:
+            missing = np.load(os.path.join(self.path, _text_filename(name, '.missing')), mmap_mode='r')
+            values[missing[start:stop]] = np.nan
+        return values
+
+    def matrix(self, names, start=0, stop=None):
+        """float64 (rows, len(names)) matrix of numeric columns.
+
+        A run of adjacent columns is a view of the mapped file, other
+        selections copy only the selected columns.
+        """
+        idx = [self.index[name] for name in names]
+        if idx and idx == list(range(idx[0], idx[0] + len(idx))):
+            return self.values[start:stop, idx[0]:idx[0] + len(idx)]
+        return self.values[start:stop, idx]
+
+    def frame(self, columns=None, start=0, stop=None):
+        """DataFrame of the given columns (all by default) for rows [start, stop)."""
+        columns = self.columns if columns is None else list(columns)
+        missing = [c for c in columns if c not in self.index and c not in self.text]
+        if missing:
+            raise ValueError('%s is missing %d column(s): %s' % (self.path, len(missing), ', '.join(missing)))
+        numeric = [c for c in columns if c in self.index and c not in self.integer]
+        parts = [pd.DataFrame(self.matrix(numeric, start, stop), columns=numeric)]
+        other = {}
+        for c in columns:
+            if c in self.integer:
+                other[c] = self.column(c)[start:stop].astype(np.int64)
+            elif c not in self.index:
+                other[c] = self._text_values(c, start, stop)
+        if other:
+            parts.append(pd.DataFrame(other))
+        return pd.concat(parts, axis=1)[columns]
+
+    def iter_frames(self, columns, chunk_size=50000, start=0, stop=None):
+        """Yield DataFrames of chunk_size rows of the given columns."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for begin in range(start, stop, chunk_size):
+            yield self.frame(columns, begin, min(begin + chunk_size, stop))
+
+    @staticmethod
+    def build(csv_filename, path, chunk_size=50000):
+        """Import a CSV into a new store at path, replacing an existing one.
+
+        Columns whose values all parse as numbers are stored as float64, the
+        others as text. The CSV is read once, chunk_size rows at a time.
+        """
+        tmp_path = path.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        columns = pd.read_csv(csv_filename, nrows=0).columns.tolist()
+        numeric = text = integer = None
+        texts = {}
+        rows = 0
+
+        # Rows are appended to a row-major scratch file, then transposed
+        scratch = os.path.join(tmp_path, 'rows.f64')
+        with open(scratch, 'wb') as out:
+            for chunk in pd.read_csv(csv_filename, chunksize=chunk_size, low_memory=False):
+                if numeric is None:
+                    numeric = [c for c in columns if pd.api.types.is_numeric_dtype(chunk[c])]
+                    text = [c for c in columns if c not in numeric]
+                    texts = {c: [] for c in text}
+                    integer = set(numeric)
+                integer &= set(c for c in numeric if pd.api.types.is_integer_dtype(chunk[c]))
+                try:
+                    block = chunk[numeric].to_numpy(dtype=np.float64)
+                except ValueError as e:
+                    raise ValueError('%s: a numeric column holds text after row %d (%s)'
+                                     % (csv_filename, rows, e))
+                out.write(np.ascontiguousarray(block).tobytes())
+                for c in text:
+                    texts[c].extend(None if pd.isna(v) else str(v) for v in chunk[c])
+                rows += len(chunk)
+        if numeric is None:
+            numeric, text, integer = [], columns, set()
+
+        values = np.lib.format.open_memmap(os.path.join(tmp_path, FEATURES), mode='w+', dtype=np.float64,
+                                           shape=(rows, len(numeric)), fortran_order=True)
+        if rows and numeric:
+            source = np.memmap(scratch, dtype=np.float64, mode='r', shape=(rows, len(numeric)))
+            step = max(1, (64 * 2**20) // (8 * rows))  # About 64 MB of columns at a time
+            for j in range(0, len(numeric), step):
+                values[:, j:j + step] = source[:, j:j + step]
+            del source
+        values.flush()
+        del values
+        os.remove(scratch)
+        missing = []
+        for c in text:
+            values = texts.get(c, [])
+            np.save(os.path.join(tmp_path, _text_filename(c)), np.array(['' if v is None else v for v in values], dtype=str))
+            if any(v is None for v in values):
+                missing.append(c)
+                np.save(os.path.join(tmp_path, _text_filename(c, '.missing')), np.array([v is None for v in values]))
+
+        stat = os.stat(csv_filename)
+        atomic_write_json(os.path.join(tmp_path, MANIFEST), {
+            'format_version': FORMAT_VERSION, 'rows': rows, 'columns': columns,
+            'numeric': numeric, 'integer': [c for c in numeric if c in integer], 'text': text, 'missing': missing,
+            'source': {'filename': os.path.abspath(csv_filename), 'size': stat.st_size, 'mtime': stat.st_mtime}})
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+        return FeatureStore(path)
+
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(description='Columnar feature store of a descriptor CSV')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('import', help='convert a CSV into a store')
+    build.add_argument('csv')
+    build.add_argument('store')
+    build.add_argument('--chunk-size', type=int, default=50000)
+    info = commands.add_parser('info', help='print the layout of a store')
+    info.add_argument('store')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        store = FeatureStore.build(args.csv, args.store, args.chunk_size)
+    else:
+        store = FeatureStore(args.store)
+    print('Rows: %d  Numeric columns: %d  Text columns: %s'
+          % (len(store), len(store.numeric), ', '.join(store.text) or '-'))
+    print('Source: %s' % store.manifest['source']['filename'])
+
+if __name__ == "__main__":
+    main()
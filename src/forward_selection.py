@@ -0,0 +1,136 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Shared forward selection engine used by the MBIC and MBEC training scripts.
+# The descriptor matrix is loaded once into a contiguous NumPy array with a
+# feature name -> column index map, and each candidate feature subset is built
+# as a column gather instead of copying and dropping DataFrame columns. A sparse
+# descriptor matrix is kept in CSC form and only the gathered columns are made
+# dense.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import numpy as np
+from scipy import sparse
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class FeatureMatrix:
+    """Column-indexed view of the descriptor matrix.
+
+    Values are stored column-major so gathering a subset of features copies
+    whole contiguous columns. Sparse values are stored as a CSC matrix.
+    """
+
+    def __init__(self, values, names):
+        if sparse.issparse(values):
+            self.values = sparse.csc_matrix(values, dtype=np.float64)
+        else:
+            self.values = np.asfortranarray(values, dtype=np.float64)
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        if len(self.index) != len(self.names):
+            raise ValueError('Duplicate feature names in matrix')
+        if self.values.shape[1] != len(self.names):
+            raise ValueError('Expected %d feature names, got %d' % (self.values.shape[1], len(self.names)))
+
+    @classmethod
+    def from_dataframe(cls, peptides):
+        return cls(peptides.to_numpy(dtype=np.float64), peptides.columns.values.tolist())
+
+    @classmethod
+    def from_descriptors(cls, descriptors):
+        """Sparse matrix of SparseDescriptors."""
+        return cls(descriptors.values, descriptors.names)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def indices(self, feat_list):
+        return [self.index[f] for f in feat_list]
+
+    def take(self, columns):
+        """Return the dense (rows, len(columns)) sub-matrix for column indices."""
+        if sparse.issparse(self.values):
+            return self.values[:, columns].toarray()
+        return self.values[:, columns]
+
+    def select(self, feat_list):
+        """Return the sub-matrix for a list of feature names."""
+        return self.take(self.indices(feat_list))
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def forward_selection(matrix, score_candidates, num_features, maximize, feat_list=None, on_step=None,
+                      checkpoint=None, batch_size=None, progress=None, cost=None, prescreen=None):
+    """Greedy forward selection over the columns of a FeatureMatrix.
+
+    score_candidates(subsets, nf) scores every candidate at selection step nf,
+    where each subset is the list of column indices of the current features
+    plus one remaining column. The best scoring candidate (highest if maximize,
+    lowest otherwise) is appended each step and on_step(nf, feat_list, score)
+    is called with the updated feature list. Selection starts from feat_list
+    when given and returns the final list.
+
+    With a Checkpoint, candidates are scored batch_size at a time and the state
+    is saved after every batch; a run restarted with the same checkpoint
+    resumes from the saved features and skips the candidates already scored.
+    on_step runs before the step is checkpointed, so a crash in between
+    redoes the step and on_step has to tolerate being called again for it
+    (see checkpoint.write_step_score).
+
+    With a timing.Progress, its total is set at every step to the work done so
+    far plus the work of the candidates left in this and the later steps,
+    where cost(nf) is the work of scoring one candidate at step nf (1 by
+    default). score_candidates advances it.
+
+    With a prescreen (see prescreen.CandidateFilter), prescreen(selected,
+    candidates, nf) cuts the remaining columns down to the ones worth scoring
+    before each step, and only those are scored and picked from.
+    """
+    selected = matrix.indices(feat_list or [])
+    done = {}
+    if checkpoint is not None:
+        state = checkpoint.load()
+        if state is not None:
+            selected = matrix.indices(state[0])
+            done = {matrix.index[name]: score for name, score in state[1].items()}
+    pick = np.argmax if maximize else np.argmin
+    cost = cost or (lambda n: 1)
+
+    for nf in range(len(selected) + 1, num_features + 1):
+        chosen = set(selected)
+        candidates = [j for j in range(matrix.shape[1]) if j not in chosen]
+        remaining = len(candidates)
+        if prescreen is not None and candidates:
+            candidates = prescreen(selected, candidates, nf)
+        if not candidates:
+            break
+
+        todo = [j for j in candidates if j not in done]
+        if progress is not None:
+            # One column fewer at each later step, at most as many candidates as this step
+            progress.total = progress.done + len(todo) * cost(nf) + sum(
+                max(min(len(candidates), remaining - (s - nf)), 0) * cost(s) for s in range(nf + 1, num_features + 1))
+        step = batch_size if checkpoint is not None and batch_size else max(len(todo), 1)
+        for b in range(0, len(todo), step):
+            batch = todo[b:b + step]
+            batch_scores = score_candidates([selected + [l_num] for l_num in batch], nf)
+            done.update(zip(batch, (float(v) for v in batch_scores)))
+            if checkpoint is not None:
+                checkpoint.save([matrix.names[j] for j in selected],
+                                {matrix.names[j]: v for j, v in done.items()})
+
+        scores = np.array([done[j] for j in candidates])
+        idx = pick(scores)
+        selected.append(candidates[idx])
+        done = {}
+        if on_step is not None:
+            on_step(nf, [matrix.names[j] for j in selected], scores[idx])
+        if checkpoint is not None:
+            checkpoint.save([matrix.names[j] for j in selected], {})
+
+    return [matrix.names[j] for j in selected]
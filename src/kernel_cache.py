@@ -0,0 +1,110 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# RBF Gram matrix cache for the hyperparameter sweeps. The squared distance
+# matrix of a transformed feature set depends neither on C nor on gamma, so it
+# is computed once and every (C, gamma, fold) fit slices its train/test rows
+# out of it and exponentiates them for a kernel='precomputed' SVC/SVR.
+# Entries are evicted least recently used first once the cache exceeds its
+# memory bound.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+from timing import tracer
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def squared_distances(X, Y=None):
+    """Pairwise squared euclidean distances between the rows of X and Y."""
+    X = np.asarray(X, dtype=np.float64)
+    Y = X if Y is None else np.asarray(Y, dtype=np.float64)
+    D = (X * X).sum(axis=1)[:, None] + (Y * Y).sum(axis=1)[None, :] - 2 * (X @ Y.T)
+    np.maximum(D, 0, out=D)
+    if Y is X:
+        np.fill_diagonal(D, 0)
+    return D
+
+
+def rbf_from_distances(D, gamma):
+    return np.exp(-gamma * D)
+
+
+def fold_kernels(D, gamma, train_index, test_index):
+    """Train (n_train x n_train) and test (n_test x n_train) RBF kernels."""
+    with tracer.span('kernel'):
+        K_train = rbf_from_distances(D[np.ix_(train_index, train_index)], gamma)
+        K_test = rbf_from_distances(D[np.ix_(test_index, train_index)], gamma)
+    return K_train, K_test
+
+
+def array_key(*parts):
+    """Digest of arrays and plain values, used as a cache key."""
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            h.update(str(part.shape).encode())
+            h.update(np.ascontiguousarray(part).tobytes())
+        elif sparse.issparse(part):
+            part = sparse.csr_matrix(part, copy=True)
+            part.sum_duplicates()
+            h.update(('sparse' + str(part.shape)).encode())
+            for a in (part.data, part.indices, part.indptr):
+                h.update(np.ascontiguousarray(a).tobytes())
+        else:
+            h.update(repr(part).encode())
+    return h.hexdigest()
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class GramCache:
+    """LRU cache of squared distance matrices bounded by max_bytes."""
+
+    def __init__(self, max_bytes=512 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        D = self._entries.get(key)
+        if D is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return D
+
+    def put(self, key, D):
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key).nbytes
+        if D.nbytes > self.max_bytes:
+            return
+        self._entries[key] = D
+        self.nbytes += D.nbytes
+        while self.nbytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self.nbytes -= old.nbytes
+
+    def distances(self, key, transform):
+        """Squared distances of transform() rows, computed on a cache miss."""
+        D = self.get(key)
+        if D is None:
+            X = transform()
+            with tracer.span('kernel'):
+                D = squared_distances(X)
+            self.put(key, D)
+        return D
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
@@ -5,15 +5,61 @@
 # A python script that builds a model with the features found during forward 
 # selection and the optimized hyperparameters. 
 # Model predicts the mbec value of each given test peptide
+# The fitted model is saved as an artifact on the first run and loaded afterwards,
+# it is refit only when the hyperparameters, features or training data change
 # ------------------------------------------------------------------------------
 #                               Libraries
 # ------------------------------------------------------------------------------
 import pandas as pd
-import numpy as np
 import json
 from sklearn import preprocessing
 from sklearn.svm import SVR
 from sklearn.decomposition import PCA
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from model_artifact import ModelArtifact, load_or_fit, training_key
+from batch_predict import CSVAppender, read_columns
+from sparse_features import SparseDescriptors
+from feature_store import read_table
+from timing import tracer
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def train(params):
+
+    # Training peptides
+    training_peptides = read_table(params['training_filename'])
+    feat_dict = params['features']
+
+    # Filter out all features not chosen by forward selection
+    labels = training_peptides.columns.values.tolist()
+    for l in labels:
+        if l == 'MBEC(uM)':
+            continue
+        if l not in feat_dict:
+            training_peptides = training_peptides.drop(columns=[l])
+
+    # Prepare training peptides 
+    min_max_scaler = preprocessing.MinMaxScaler()
+    y = training_peptides['MBEC(uM)'].to_numpy()                        # Convert response variable to array
+    training_peptides = training_peptides.drop(columns=['MBEC(uM)'])    # Drop MBEC from training features
+    print('Training Peptides Shape: ', training_peptides.shape)
+    with tracer.span('scale'):
+        X_norm = min_max_scaler.fit_transform(training_peptides)        # Scale training data
+
+    pca = PCA(n_components=params['pca_comp'])
+    with tracer.span('pca'):
+        X_trans = pca.fit_transform(X_norm)     # Perform PCA on training data
+
+    # Build SVR model and train
+    SVC_rbf = SVR(kernel='rbf', C=params['C'], gamma=params['gamma'])
+    with tracer.span('fit'):
+        rbf_fit = SVC_rbf.fit(X_trans, y)
+
+    return ModelArtifact.from_pipeline('SVR', training_peptides.columns, params, min_max_scaler, pca, rbf_fit)
 
 # ------------------------------------------------------------------------------
 #                               Variables
@@ -21,7 +67,11 @@ from sklearn.decomposition import PCA
 training_filename = '../../data/mbec_training_data.csv'
 test_filename = '../../data/test_peptide_data.csv'
 fs_filename = 'forward_selection_features.json'    # Features chosen using Forward Selection
+artifact_path = 'mbec_model'                        # Fitted model, delete to force a refit
 pred_filename = './mbec_predictions.csv'
+chunk_size = 50000                                  # Test peptides scored at a time
+sparse_input = False                                # Hold the test descriptors as CSR chunks
+trace_filename = None                               # JSON trace of the stage timings, None disables
 
 # Optimized hyperparameters
 num_feats = 12
@@ -35,26 +85,7 @@ g = 20
 
 def main():
 
-    # Training peptides
-    training_peptides = pd.read_csv(training_filename)
-    s = training_peptides.shape
-
-    # Load forward selection features
-    with open(fs_filename) as f:
-        feat_dict = json.load(f)
-
-    feat_dict = feat_dict[0:num_feats]
-
-    # Filter out all features not chosen by forward selection
-    labels = training_peptides.columns.values.tolist()
-    for l in labels:
-        if l == 'MBEC(uM)':
-            continue
-        if l not in feat_dict:
-            training_peptides = training_peptides.drop(columns=[l])
-
-    # Test peptides
-    test_peptides = pd.read_csv(test_filename)
+    tracer.enable(trace_filename is not None)
 
     # Load forward selection features
     with open(fs_filename) as f:
@@ -62,44 +93,33 @@ def main():
 
     feat_dict = feat_dict[0:num_feats]
 
-    names = test_peptides['Name'].tolist()
-    dec_fuc = test_peptides['Decision Fn'].tolist()
-
-    # Filter out features all features not chosed by forward selection
-    labels = test_peptides.columns.values.tolist()
-    for l in labels:
-        if l not in feat_dict:
-            test_peptides = test_peptides.drop(columns=[l])
-
-    rows, cols = test_peptides.shape
-    mbec_predictions = np.zeros((3, rows))  # numpy array to store mbec predictions
-
-    # Prepare training peptides 
-    min_max_scaler = preprocessing.MinMaxScaler()
-    y = training_peptides['MBEC(uM)'].to_numpy()                        # Convert response variable to array
-    training_peptides = training_peptides.drop(columns=['MBEC(uM)'])    # Drop MBEC from training features
-    print('Training Peptides Shape: ', training_peptides.shape)
-    X_norm = min_max_scaler.fit_transform(training_peptides)            # Scale training data
-
-    pca = PCA(n_components=pca_comp)
-    X_trans = pca.fit_transform(X_norm)     # Perform PCA on training data
-
-    # Prepare test peptides
-    print('Test Peptides Shape: ', test_peptides.shape)
-    X_norm_test = min_max_scaler.transform(test_peptides)
-    X_trans_tp = pca.transform(X_norm_test)
-
-    # Build SVR model and train
-    SVC_rbf = SVR(kernel='rbf', C=c, gamma=g)
-    rbf_fit = SVC_rbf.fit(X_trans, y)
-
-    # Predict test peptides
-    y_test_pred = rbf_fit.predict(X_trans_tp)
-
-    # Save MBEC predictions
-    pred_results = list(zip(names, dec_fuc, y_test_pred))
-    df_pred_results = pd.DataFrame(pred_results, columns = ['Names', 'Decision fn', 'Predicted MBEC']) 
-    df_pred_results.to_csv(pred_filename, sep=',',index=False) 
+    # Load the fitted model, refit it when the hyperparameters, features or training data changed
+    training = read_table(training_filename)
+    params = {'training_filename': training_filename, 'features': feat_dict,
+              'pca_comp': pca_comp, 'C': c, 'gamma': g,
+              'training_key': training_key(training, feat_dict, 'MBEC(uM)')}
+    model = load_or_fit(artifact_path, params, lambda: train(params))
+
+    # Test peptides are streamed in chunks holding only the name, decision function and
+    # model features, the model refuses inputs without the features it was trained on
+    columns = ['Name', 'Decision Fn'] + model.feature_names
+    out = CSVAppender(pred_filename, ['Names', 'Decision fn', 'Predicted MBEC'])
+    if sparse_input:
+        chunks = SparseDescriptors.iter_csv(test_filename, ['Name', 'Decision Fn'], model.feature_names, chunk_size)
+    else:
+        chunks = read_columns(test_filename, columns, chunk_size)
+    for chunk in chunks:
+
+        # Predict test peptides
+        y_test_pred = model.predict(model.features(chunk))
+
+        # Save MBEC predictions
+        out.write(pd.DataFrame({'Names': chunk['Name'].to_numpy(),
+                                'Decision fn': chunk['Decision Fn'].to_numpy(),
+                                'Predicted MBEC': y_test_pred}))
+
+    print('Test Peptides: ', out.rows)
+    tracer.report(trace_filename, script=os.path.basename(__file__), test_filename=test_filename)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
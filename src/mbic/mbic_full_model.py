@@ -5,6 +5,8 @@
 # A python script that uses the optimized hyperparameters found for both 
 # the SVM and the SVR to create a prediction model
 # Script prints the average RMSE of the full model when run with cross validation
+# and writes the RMSE, SVM MCC and routing of every fold to full_model_results.json
+# With a list of thresholds it compares them in one run and writes a threshold table
 # 
 # NOTE: Given the small number of training samples available, the average RMSE 
 # outputted will vary by about +- 5
@@ -12,33 +14,16 @@
 # ------------------------------------------------------------------------------
 #                               Libraries
 # ------------------------------------------------------------------------------
-import numpy as np
-import pandas as pd
 import json
+import os
+import sys
 import warnings
-from sklearn import preprocessing
-from sklearn.decomposition import PCA
-from sklearn.utils.validation import column_or_1d
-from sklearn.svm import SVC
-from sklearn.svm import SVR
-from sklearn.metrics import mean_squared_error
-from sklearn.model_selection import RepeatedStratifiedKFold
 warnings.filterwarnings("ignore")
 
-# ------------------------------------------------------------------------------
-#                               Functions
-# ------------------------------------------------------------------------------
-def seperatePeptides(peptides, threshold):
-
-    columns = ['MBIC']
-    
-    filterMBIC = (peptides[columns] <= threshold).all(axis=1)  
-    lower_peptides = peptides[filterMBIC]
-
-    filterMBIC = (peptides[columns] > threshold).all(axis=1)  
-    upper_peptides = peptides[filterMBIC]
-    
-    return lower_peptides, upper_peptides
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from feature_store import read_table
+from cascade import CascadeData, CascadeEvaluator, threshold_table
+from timing import tracer
 
 # ------------------------------------------------------------------------------
 #                               Variables
@@ -46,7 +31,11 @@ def seperatePeptides(peptides, threshold):
 training_filename = '../../data/mbic_training_data.csv'
 svm_features_filename = 'mbic_svm_forward_selection_features.json'
 svr_features_filename = 'mbic_svr_forward_selection_features.json'
-svr_svm_results = 'full_model_results.txt'
+svr_svm_results = 'full_model_results.json'   # Per-fold RMSE, MCC and routing of the cross validation
+threshold_table_filename = 'full_model_thresholds.csv'  # Threshold vs RMSE/MCC table of a thresholds run
+
+mbic_threshold = 64     # MBIC (uM) splitting the SVM classes, the SVR learns the peptides at or below it
+thresholds = None       # Thresholds compared in one run on the same folds (e.g. [16, 32, 64, 128]), None runs mbic_threshold
 
 # Optimized Hyperparameters
 svm_c = 10
@@ -59,129 +48,67 @@ svr_g = 40
 svr_pca_comp = 8
 svr_num_feat = 9
 
+num_workers = os.cpu_count()    # Processes the cross validation folds are spread over
+cv_seed = 0                     # Seed of the cross validation splits, None draws new splits every run
+
+# Early stopping of the cross validation (off by default): stop after a whole
+# repeat once the standard error of the average RMSE drops below early_stop_se.
+# On the training data the standard error is about 3 after 10-20 repeats and
+# swings widely over the first few, so early_stop_min_repeats guards against
+# stopping on a lucky start
+n_splits = 5
+n_repeats = 20
+early_stop = False
+early_stop_se = 3.0
+early_stop_min_repeats = 10
+
+trace_filename = None   # JSON trace of the stage timings (e.g. 'full_model_trace.json'), None disables
+
 # ------------------------------------------------------------------------------
 #                               Main
 # ------------------------------------------------------------------------------
 def main():
 
-    # Prepare peptides for SVM
+    tracer.enable(trace_filename is not None)
+
     with open(svm_features_filename) as f:
         svm_feat_dict = json.load(f)
         svm_feat_dict = svm_feat_dict[0:svm_num_feat]
-        
-    peptides_svm = pd.read_csv(training_filename)
-    peptides_svm.loc[(peptides_svm['MBIC'] > 64), 'MBIC'] = 0  
-    peptides_svm.loc[(peptides_svm['MBIC'] != 0), 'MBIC'] = 1
-
-    # Filter out columns based on feat list
-    labels = peptides_svm.columns.values.tolist()
-    for l in labels:
-        if l == 'MBIC':
-            continue
-        if l not in svm_feat_dict:
-            peptides_svm = peptides_svm.drop(columns=[l])
-
-    y_svm = peptides_svm['MBIC'].to_numpy()
-    peptides_svm = peptides_svm.drop(columns=['MBIC'])
-
-    min_max_scaler = preprocessing.MinMaxScaler()
-    X_norm_svm = min_max_scaler.fit_transform(peptides_svm)
-    pca_svm = PCA(n_components=svm_pca_comp)
-    X_trans_svm = pca_svm.fit_transform(X_norm_svm) 
-    SVC_rbf = SVC(kernel='rbf', C=svm_c, gamma=svm_g)
-
-    # Prepare peptides for SVR
+
     with open(svr_features_filename) as f:
         svr_feat_dict = json.load(f)
         svr_feat_dict = svr_feat_dict[0:svr_num_feat]
-        
-    peptides_svr = pd.read_csv(training_filename)
-    peptides_svr, _ = seperatePeptides(peptides_svr, 64)
-        
-    # Filter out columns based on feat list
-    labels = peptides_svr.columns.values.tolist()
-    for l in labels:
-        if l == 'MBIC':
-            continue
-        if l not in svr_feat_dict:
-            peptides_svr = peptides_svr.drop(columns=[l])
-
-    y_svr = peptides_svr['MBIC'].to_numpy()
-    peptides_svr = peptides_svr.drop(columns=['MBIC'])
-
-    min_max_scaler_svr = preprocessing.MinMaxScaler()
-    X_norm_svr = min_max_scaler_svr.fit_transform(peptides_svr)
-    pca_svr = PCA(n_components=svr_pca_comp)
-    X_trans_svr = pca_svr.fit_transform(X_norm_svr) 
-    SVR_rbf = SVR(kernel='rbf', C=svr_c, gamma=svr_g)
-
-    # Prepare test set of petides used by svr after training
-    peptides_test_svr = pd.read_csv(training_filename)
-
-    # Filter out columns based on feat list
-    labels = peptides_test_svr.columns.values.tolist()
-    for l in labels:
-        if l == 'MBIC':
-            continue
-        if l not in svr_feat_dict:
-            peptides_test_svr = peptides_test_svr.drop(columns=[l])
-
-    y_svr2 = peptides_test_svr['MBIC'].to_numpy()
-    peptides_test_svr = peptides_test_svr.drop(columns=['MBIC'])
-
-    # Apply svr transformations on test set of peptides for svr
-    X_norm_test_svr = min_max_scaler_svr.transform(peptides_test_svr)
-    X_trans_test_svr = pca_svr.transform(X_norm_test_svr)
-        
-    # Cross validation applied to full model
-    rskf = RepeatedStratifiedKFold(n_splits=5, n_repeats = 20)
-    RMSE = []
-    cnt = 1
-    for train_index, test_index in rskf.split(X_trans_svm, y_svm):  
-        X_train, X_test = X_trans_svm[train_index], X_trans_svm[test_index]
-        y_train, y_test = y_svm[train_index], y_svm[test_index]
-        y_train = y_train.reshape(-1,1)
-        y_train = column_or_1d(y_train, warn=False)
-        svm_fit = SVC_rbf.fit(X_train, y_train)
-        y_pred = svm_fit.predict(X_test)
-        
-        train_index_svr = []
-        test_index_svr = []
-        y_train_svr = []
-        y_test_svr = []
-        for i in range(0, len(y_train)):
-            if(y_train[i] == 0):
-                continue
-            else:
-                train_index_svr.append(train_index[i])
-                
-        X_train_svr = X_trans_svr[train_index_svr]
-        y_train_svr = y_svr[train_index_svr]
-        svr_fit = SVR_rbf.fit(X_train_svr, y_train_svr)
-        
-        y_train_svr = []
-        for i in range(0, len(y_pred)):
-            if(y_pred[i] == 0):
-                continue
-            else:
-                test_index_svr.append(test_index[i])
-        
-        X_test_svr = X_trans_test_svr[test_index_svr]
-        y_test_svr = y_svr2[test_index_svr]
-        y_pred_svr = SVR_rbf.predict(X_test_svr)
-        
-        rmse = np.sqrt(mean_squared_error(y_test_svr, y_pred_svr))
-
-        cnt = cnt + 1
-        
-        with open (svr_svm_results, 'a', encoding="utf-8") as sfile:
-            sfile.write(str(rmse) + '\n')
-        
-        RMSE.append(rmse)
-            
-    rmse_avg = np.average(RMSE)
-            
-    print('RMSE average: ' + str(rmse_avg))
+
+    # Only the MBIC and the columns of the two feature sets are read
+    columns = list(dict.fromkeys(['MBIC'] + svm_feat_dict + svr_feat_dict))
+    peptides = read_table(training_filename, columns)
+    data = CascadeData.from_table(peptides, svm_feat_dict, svr_feat_dict, svm_pca_comp, svr_pca_comp)
+
+    # Cross validation applied to full model, the folds run in parallel
+    with CascadeEvaluator(data, n_splits=n_splits, n_repeats=n_repeats, cv_seed=cv_seed,
+                          workers=num_workers) as evaluator:
+        if thresholds is not None:
+            results = evaluator.evaluate_thresholds(svm_c, svm_g, svr_c, svr_g, thresholds)
+        else:
+            results = [evaluator.evaluate(svm_c, svm_g, svr_c, svr_g, threshold=mbic_threshold,
+                                          early_stop=early_stop, early_stop_se=early_stop_se,
+                                          early_stop_min_repeats=early_stop_min_repeats)]
+
+    if thresholds is not None:
+        table = threshold_table(results)
+        table.to_csv(threshold_table_filename, index=False)
+        print(table.to_string(index=False))
+        print('Threshold table written to ' + threshold_table_filename)
+    else:
+        result = results[0]
+        result.save(svr_svm_results)
+        summary = result.summary()
+        print('Folds run: %d of %d' % (len(result), n_splits * n_repeats))
+        print('RMSE average: ' + str(summary['rmse_mean']))
+        print('SVM MCC average: ' + str(summary['mcc_mean']))
+        print('Routing (MBIC <= %s / routed to SVR): tp %d fn %d fp %d tn %d'
+              % ((mbic_threshold,) + tuple(summary['confusion'][c] for c in ('tp', 'fn', 'fp', 'tn'))))
+    tracer.report(trace_filename, script=os.path.basename(__file__), folds=len(results[0]), num_workers=num_workers)
 
 if __name__ == "__main__":
     main()
@@ -11,19 +11,29 @@
 #                               Libraries
 # ------------------------------------------------------------------------------
 import numpy as np
-import pandas as pd
 import json
+import os
 import sys
-import copy
 import warnings
 from sklearn import preprocessing
-from sklearn.decomposition import PCA
 from sklearn.utils.validation import column_or_1d
 from sklearn.svm import SVR
 from sklearn.metrics import mean_squared_error
 from sklearn.model_selection import RepeatedKFold
 warnings.filterwarnings("ignore")
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from forward_selection import FeatureMatrix, forward_selection
+from sweep import SweepExecutor
+from kernel_cache import GramCache, array_key, fold_kernels
+from pca_prefix import PrefixCache
+from checkpoint import Checkpoint, write_step_score
+from score_cache import ScoreCache
+from sparse_features import SparseDescriptors
+from feature_store import read_table
+from timing import tracer
+from prescreen import CandidateFilter
+
 # ------------------------------------------------------------------------------
 #                               Functions
 # ------------------------------------------------------------------------------
@@ -47,101 +57,140 @@ svr_filename = 'mbic_svr_fs_rmse.txt'
 svr_fs_features_filename = 'mbic_svr_forward_selection_features.json'
 
 num_features = 200
+mbic_threshold = 64             # MBIC (uM) splitting the SVM classes, the SVR learns the peptides at or below it
 C = [0.001, 0.01, 0.1, 1, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 100, 1000]
 gamma = [0.001, 0.01, 0.1, 1, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 100]
 
+num_workers = os.cpu_count()    # Processes used for the hyperparameter sweep
+queue_filename = None           # Shared SQLite work queue of a distributed sweep (work_queue.py), None sweeps here
+cv_seed = 0                     # Seed of the cross validation splits
+n_splits = 5
+n_repeats = 20
+race = False                    # Drop hopeless grid cells after a few repeats
+race_z = 3.0                    # Standard errors behind the best cell to drop a cell
+race_check = False              # Also run every step exhaustively and compare
+search = 'grid'                 # Hyperparameter search: 'grid' (every cell), 'coarse' or 'bayes' (search.py)
+search_budget = 32              # Grid cells a 'coarse' or 'bayes' search scores per candidate feature
+search_check = False            # Also run every step exhaustively and report the best scores side by side
+search_report_filename = 'mbic_svr_search_report.txt'
+checkpoint_filename = 'mbic_svr_checkpoint.json'   # Resume point, delete to start over
+checkpoint_batch = 16           # Candidates scored between checkpoints
+race_report_filename = 'mbic_svr_race_report.txt'
+score_cache_filename = 'mbic_svr_scores.sqlite'   # Scores reused across sweeps, None disables
+score_cache_bytes = 1024 * 2**20
+sparse_matrix = False           # Keep the descriptor matrix in sparse form
+gram_cache = GramCache(max_bytes=512 * 2**20)  # Distance matrices kept per worker
+pca_cache = PrefixCache()                       # One PCA per feature subset per worker
+trace_filename = None           # JSON trace of the stage timings (e.g. 'mbic_svr_trace.json'), None disables
+prescreen_top = None            # Candidates swept per step after a cheap ranking (prescreen.py), None sweeps all
+prescreen_method = 'f'          # Ranking: 'f' (partial F statistic given the selected features) or 'mi'
+prescreen_max_mode = 0.95       # Skip candidates with one value in more than this share of the rows
+prescreen_log_filename = 'mbic_svr_prescreen_log.jsonl'   # Kept and skipped candidates of each step
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def score_folds(X, y, n, c, g, seed, folds):
+
+    # Normalize features and apply PCA, the RBF distances only depend on the
+    # feature set and the number of components
+    def transform():
+        pcs = pca_cache.prefix(array_key(X),
+                               tracer.timed('scale', lambda: preprocessing.MinMaxScaler().fit_transform(X)))
+        return pcs.transform(n)
+
+    D = gram_cache.distances(array_key(X, n), transform)
+
+    SVR_rbf = SVR(kernel='precomputed', C=c)
+    RMSE = []
+    rskf = RepeatedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=seed)
+
+    # Cross validation on the cached Gram matrix, only folds [start, stop)
+    splits = list(rskf.split(D))[folds[0]:folds[1]]
+    for train_index, test_index in splits:
+        K_train, K_test = fold_kernels(D, g, train_index, test_index)
+        y_train, y_test = y[train_index], y[test_index]
+        y_train = y_train.reshape(-1,1)
+        y_train = column_or_1d(y_train, warn=False)
+        with tracer.span('fit'):
+            rbf_fit = SVR_rbf.fit(K_train, y_train)
+
+        with tracer.span('predict'):
+            y_pred = rbf_fit.predict(K_test)
+
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+        RMSE.append(rmse)
+
+    return np.array(RMSE)
+
+def save_step(nf, feat_list, rmse):
+
+    # Dump RMSE and current features found from forward selection
+    write_step_score(svr_filename, nf, np.around(rmse, 3))
+
+    with open(svr_fs_features_filename, 'w') as f:
+        json.dump(feat_list, f) 
+
 # ------------------------------------------------------------------------------
 #                               Main
 # ------------------------------------------------------------------------------
 def main():
 
     feat_list = []
-
-    # Forward selection loop
-    for nf in range(len(feat_list) + 1, num_features + 1):
-
-        peptides = pd.read_csv(training_filename)
-
-        # Get lower valued peptides
-        peptides, _ = seperatePeptides(peptides, 64)
-
-        y = peptides['MBIC'].to_numpy()
-
-        peptides = peptides.drop(columns=['MBIC'])
-        peptides = peptides.drop(columns=['Name'])
-        peptides = peptides.drop(columns=['Pathogen'])
-        peptides = peptides.drop(columns=['Type'])
-        peptides = peptides.drop(columns=['Seq'])
-        labels = peptides.columns.values.tolist()
-
-        feat_RMSE = []
-        top_feat_list = []
-
-        # Loop to populate list of features every iteration
-        for l_num, l in enumerate(labels):
-            small_feat_list = copy.deepcopy(feat_list)
-            if l in feat_list:
-                continue
-            small_feat_list.append(l)
-            peptides_small = peptides.copy()
-            for f in labels:
-                if f not in small_feat_list:
-                    peptides_small = peptides_small.drop(columns=[f])
-
-            num_feat = peptides_small.shape
-
-            # Normalize features
-            min_max_scaler = preprocessing.MinMaxScaler()
-            X_norm = min_max_scaler.fit_transform(peptides_small)
-
-            pca_features = []
-
-            for j in range(1, num_feat[1]+ 1):
-                pca_features.append(j)
-
-            avg_RMSE = []
-
-            # Loops through each hyperparameter combination
-            for n in pca_features:
-                pca = PCA(n_components=n)
-                for c in C:
-                    for g in gamma:
-                        sys.stdout.write('Feature Loop: %s Feat num: %s PCA comp: %s c: %s \r' % (nf,l_num,n,c))
-                        sys.stdout.flush()
-                        X_trans = pca.fit_transform(X_norm)    
-                        SVR_rbf = SVR(kernel='rbf', C=c, gamma=g)
-                        RMSE = []
-                        rskf = RepeatedKFold(n_splits=5, n_repeats = 20)
-
-                        # Cross validation
-                        for train_index, test_index in rskf.split(X_trans, y):
-                            X_train, X_test = X_trans[train_index], X_trans[test_index]
-                            y_train, y_test = y[train_index], y[test_index]
-                            y_train = y_train.reshape(-1,1)
-                            y_train = column_or_1d(y_train, warn=False)
-                            rbf_fit = SVR_rbf.fit(X_train, y_train)
-
-                            y_pred = rbf_fit.predict(X_test)
-                    
-                            rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-                            RMSE.append(rmse)
-
-                        rmse_avg = np.mean(RMSE)
-                        avg_RMSE.append(rmse_avg)
-
-            # Take minimum RMSE across all runs, select this feature, append to found list
-            feat_RMSE.append(np.min(avg_RMSE))
-            top_feat_list.append(copy.deepcopy(small_feat_list))
-           
-        idx = np.argmin(feat_RMSE)
-        feat_list = copy.deepcopy(top_feat_list[idx])
-
-        # Dump RMSE and current features found from forward selection
-        with open (svr_filename, 'a', encoding="utf-8") as f:
-                    f.write(str(nf) + '\t' + str(np.around(feat_RMSE[idx], 3)) + '\n')
-
-        with open(svr_fs_features_filename, 'w') as f:
-            json.dump(feat_list, f) 
+    tracer.enable(trace_filename is not None)
+
+    peptides = read_table(training_filename)
+
+    # Get lower valued peptides
+    peptides, _ = seperatePeptides(peptides, mbic_threshold)
+
+    y = peptides['MBIC'].to_numpy()
+
+    peptides = peptides.drop(columns=['MBIC', 'Name', 'Pathogen', 'Type', 'Seq'])
+    if sparse_matrix:
+        matrix = FeatureMatrix.from_descriptors(SparseDescriptors.from_dataframe(peptides))
+    else:
+        matrix = FeatureMatrix.from_dataframe(peptides)
+
+    # Selection state is checkpointed so an interrupted run resumes where it stopped
+    checkpoint = Checkpoint(checkpoint_filename, config={
+        'training_filename': training_filename, 'mbic_threshold': mbic_threshold, 'C': C, 'gamma': gamma,
+        'cv_seed': cv_seed, 'n_splits': n_splits, 'n_repeats': n_repeats, 'race': race, 'race_z': race_z,
+        'search': search, 'search_budget': search_budget, 'prescreen_top': prescreen_top,
+        'prescreen_method': prescreen_method, 'prescreen_max_mode': prescreen_max_mode})
+
+    # Only the best ranked candidates of each step go to the sweep
+    candidate_filter = None
+    if prescreen_top is not None:
+        candidate_filter = CandidateFilter(matrix, y, prescreen_top, method=prescreen_method,
+                                           classification=False, max_mode=prescreen_max_mode,
+                                           log_filename=prescreen_log_filename)
+
+    score_cache = None
+    if score_cache_filename is not None:
+        score_cache = ScoreCache(score_cache_filename, max_bytes=score_cache_bytes)
+
+    # Forward selection loop, each candidate feature keeps the minimum RMSE of its
+    # hyperparameter sweep and each step keeps the best candidate
+    with SweepExecutor(score_folds, matrix, y, C, gamma, maximize=False,
+                       cv_seed=cv_seed, workers=num_workers,
+                       n_splits=n_splits, n_repeats=n_repeats,
+                       race=race, race_z=race_z, race_check=race_check,
+                       report_filename=race_report_filename,
+                       search=search, search_budget=search_budget, search_check=search_check,
+                       search_report_filename=search_report_filename,
+                       queue_filename=queue_filename,
+                       score_cache=score_cache,
+                       cache_tag='SVR rbf RMSE MinMaxScaler PCA RepeatedKFold n_splits=%d' % n_splits) as sweep:
+        forward_selection(matrix, sweep.score_candidates, num_features, maximize=False,
+                          feat_list=feat_list, on_step=save_step,
+                          checkpoint=checkpoint, batch_size=checkpoint_batch,
+                          progress=sweep.progress, cost=sweep.candidate_cells,
+                          prescreen=candidate_filter)
+
+    if score_cache is not None:
+        score_cache.close()
+    tracer.report(trace_filename, script=os.path.basename(__file__), num_workers=num_workers)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
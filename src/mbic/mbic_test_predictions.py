@@ -2,19 +2,29 @@
 # Department of Computer Science and Engineering, Santa Clara University
 # Author: Taylor Downey
 
-# If SVM model decides peptide <=64uM then the SVR model is used to predict MBIC
+# If SVM model decides peptide <= mbic_threshold (64uM) then the SVR model is used to predict MBIC
 # Hyperparameters for both models have already been tuned on the training set using cross-validation
+# The fitted models are saved as artifacts on the first run and loaded afterwards,
+# they are refit only when the hyperparameters, feature lists or training data change
 # ------------------------------------------------------------------------------
 #                               Libraries
 # ------------------------------------------------------------------------------
 import pandas as pd
-import numpy as np
 from sklearn import preprocessing
 from sklearn.svm import SVR
 from sklearn.svm import SVC
 import json
+import os
+import sys
 from sklearn.decomposition import PCA
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from model_artifact import ModelArtifact, load_or_fit, training_key
+from batch_predict import CSVAppender, read_columns
+from sparse_features import SparseDescriptors
+from feature_store import read_table
+from timing import tracer
+
 # ------------------------------------------------------------------------------
 #                               Functions
 # ------------------------------------------------------------------------------
@@ -30,39 +40,11 @@ def seperatePeptides(peptides, threshold):
     
     return lower_peptides, upper_peptides
 
-# ------------------------------------------------------------------------------
-#                               Variables
-# ------------------------------------------------------------------------------
-training_filename = '../../data/mbic_training_data.csv'
-test_filename = '../../data/test_peptide_data.csv'
-svm_features_filename = 'mbic_svm_forward_selection_features.json'
-svr_features_filename = 'mbic_svr_forward_selection_features.json'
-pred_filename = './mbic_predictions.csv'
-split = 0.760   # Where to break peptides into class 0 and class 1
-
-# Hyperparameters
-svm_num_feats = 9
-svm_pca_comp = 6
-svm_c = 10
-svm_g = 1000
-
-svr_num_feats = 9
-svr_pca_comp = 8
-svr_c = 45
-svr_g = 40
+def train_svm(params):
 
-# ------------------------------------------------------------------------------
-#                               Main
-# ------------------------------------------------------------------------------
-def main():
-    
-    # Prepare training peptides for SVM
-    with open(svm_features_filename) as f:
-        svm_feat_dict = json.load(f)
-        svm_feat_dict = svm_feat_dict[0:svm_num_feats]
-        
-    peptides_svm = pd.read_csv(training_filename)
-    peptides_svm.loc[(peptides_svm['MBIC'] > 64), 'MBIC'] = 0  
+    svm_feat_dict = params['features']
+    peptides_svm = read_table(params['training_filename'])
+    peptides_svm.loc[(peptides_svm['MBIC'] > params['threshold']), 'MBIC'] = 0  
     peptides_svm.loc[(peptides_svm['MBIC'] != 0), 'MBIC'] = 1
 
     # Filter out columns based on feat list
@@ -78,20 +60,24 @@ def main():
 
     # Prepare training peptides for SVM model
     min_max_scaler_svm = preprocessing.MinMaxScaler()
-    X_norm_svm = min_max_scaler_svm.fit_transform(peptides_svm)
-    pca_svm = PCA(n_components=svm_pca_comp)
-    X_trans_svm = pca_svm.fit_transform(X_norm_svm) 
-    SVC_rbf = SVC(kernel='rbf', C=svm_c, gamma=svm_g)
+    with tracer.span('scale'):
+        X_norm_svm = min_max_scaler_svm.fit_transform(peptides_svm)
+    pca_svm = PCA(n_components=params['pca_comp'])
+    with tracer.span('pca'):
+        X_trans_svm = pca_svm.fit_transform(X_norm_svm) 
+    SVC_rbf = SVC(kernel='rbf', C=params['C'], gamma=params['gamma'])
     print('Training SVM Peptides Shape: ', peptides_svm.shape)
-    svm_fit = SVC_rbf.fit(X_trans_svm, y_svm)   # Train SVM model 
+    with tracer.span('fit'):
+        svm_fit = SVC_rbf.fit(X_trans_svm, y_svm)   # Train SVM model 
 
-    # Prepare peptides for SVR
-    with open(svr_features_filename) as f:
-        svr_feat_dict = json.load(f)
-        svr_feat_dict = svr_feat_dict[0:svr_num_feats]
-        
-    peptides_svr = pd.read_csv(training_filename)
-    peptides_svr, _ = seperatePeptides(peptides_svr, 64)
+    return ModelArtifact.from_pipeline('SVC', peptides_svm.columns, params,
+                                       min_max_scaler_svm, pca_svm, svm_fit)
+
+def train_svr(params):
+
+    svr_feat_dict = params['features']
+    peptides_svr = read_table(params['training_filename'])
+    peptides_svr, _ = seperatePeptides(peptides_svr, params['threshold'])
         
     # Filter out columns based on feat list
     labels = peptides_svr.columns.values.tolist()
@@ -105,66 +91,97 @@ def main():
     peptides_svr = peptides_svr.drop(columns=['MBIC'])
 
     min_max_scaler_svr = preprocessing.MinMaxScaler()
-    X_norm_svr = min_max_scaler_svr.fit_transform(peptides_svr)
-    pca_svr = PCA(n_components=svr_pca_comp)
-    X_trans_svr = pca_svr.fit_transform(X_norm_svr) 
-    SVR_rbf = SVR(kernel='rbf', C=svr_c, gamma=svr_g)
+    with tracer.span('scale'):
+        X_norm_svr = min_max_scaler_svr.fit_transform(peptides_svr)
+    pca_svr = PCA(n_components=params['pca_comp'])
+    with tracer.span('pca'):
+        X_trans_svr = pca_svr.fit_transform(X_norm_svr) 
+    SVR_rbf = SVR(kernel='rbf', C=params['C'], gamma=params['gamma'])
     print('Training SVR Peptides Shape: ', peptides_svr.shape)
-    svr_fit = SVR_rbf.fit(X_trans_svr, y_svr)   # Train SVR model 
-
+    with tracer.span('fit'):
+        svr_fit = SVR_rbf.fit(X_trans_svr, y_svr)   # Train SVR model 
 
-    # Test peptides for SVM
-    test_peptides_svm = pd.read_csv(test_filename)
+    return ModelArtifact.from_pipeline('SVR', peptides_svr.columns, params,
+                                       min_max_scaler_svr, pca_svr, svr_fit)
 
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+training_filename = '../../data/mbic_training_data.csv'
+test_filename = '../../data/test_peptide_data.csv'
+svm_features_filename = 'mbic_svm_forward_selection_features.json'
+svr_features_filename = 'mbic_svr_forward_selection_features.json'
+svm_artifact_path = 'mbic_svm_model'    # Fitted models, delete to force a refit
+svr_artifact_path = 'mbic_svr_model'
+pred_filename = './mbic_predictions.csv'
+chunk_size = 50000  # Test peptides scored at a time
+sparse_input = False    # Hold the test descriptors as CSR chunks
+trace_filename = None   # JSON trace of the stage timings (e.g. 'mbic_predictions_trace.json'), None disables
+mbic_threshold = 64     # MBIC (uM) splitting the SVM classes, the SVR learns the peptides at or below it
 
-    # Filter out columns based on popular feature list
-    labels = test_peptides_svm.columns.values.tolist()
-    for l in labels:
-        if l not in svm_feat_dict:
-            test_peptides_svm = test_peptides_svm.drop(columns=[l])
-
-    # Prepare test peptides
-    print('Test SVM Peptides Shape: ', test_peptides_svm.shape)
-    X_norm_test_svm = min_max_scaler_svm.transform(test_peptides_svm)
-    X_trans_tp_svm = pca_svm.transform(X_norm_test_svm)
-
-    # Test peptides for SVR
-    test_peptides_svr = pd.read_csv(test_filename)
-    names = test_peptides_svr['Name'].tolist()
-    dec_fuc = test_peptides_svr['Decision Fn'].tolist()
-
-    # Filter out columns based on popular feature list
-    labels = test_peptides_svr.columns.values.tolist()
-    for l in labels:
-        if l not in svr_feat_dict:
-            test_peptides_svr = test_peptides_svr.drop(columns=[l])
-
-    # Prepare test peptides
-    print('Test SVR Peptides Shape: ', test_peptides_svr.shape)
-    X_norm_test_svr = min_max_scaler_svr.transform(test_peptides_svr)
-    X_trans_tp_svr = pca_svr.transform(X_norm_test_svr)
-
-    # Train SVM model and then predict which bucket test peptides fall into
-    test_peptide_classes = svm_fit.predict(X_trans_tp_svm)
+# Hyperparameters
+svm_num_feats = 9
+svm_pca_comp = 6
+svm_c = 10
+svm_g = 1000
 
-    bucket0 = []
-    for i,c in enumerate(test_peptide_classes):
-        if c==1:
-            bucket0.append(i)
+svr_num_feats = 9
+svr_pca_comp = 8
+svr_c = 45
+svr_g = 40
 
-    X_trans_tp_svr_small = X_trans_tp_svr[bucket0]
-    test_peptide_mbic = svr_fit.predict(X_trans_tp_svr_small)
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
 
-    mbic_names = []
-    dec_funcs = []
-    for j in bucket0:
-        mbic_names.append(names[j])
-        dec_funcs.append(dec_fuc[j])
+    tracer.enable(trace_filename is not None)
 
-    # Save MBIC predictions
-    pred_results = list(zip(mbic_names, dec_funcs, test_peptide_mbic))
-    df_pred_results = pd.DataFrame(pred_results, columns = ['Names', 'Decision Fn', 'Predicted MBIC Value']) 
-    df_pred_results.to_csv(pred_filename, sep=',',index=False) 
+    # Features chosen using forward selection
+    with open(svm_features_filename) as f:
+        svm_feat_dict = json.load(f)[0:svm_num_feats]
+    with open(svr_features_filename) as f:
+        svr_feat_dict = json.load(f)[0:svr_num_feats]
+
+    # The digest of the training data refits the models when the training file changes
+    training = read_table(training_filename)
+    svm_params = {'training_filename': training_filename, 'features': svm_feat_dict, 'threshold': mbic_threshold,
+                  'pca_comp': svm_pca_comp, 'C': svm_c, 'gamma': svm_g,
+                  'training_key': training_key(training, svm_feat_dict, 'MBIC')}
+    svr_params = {'training_filename': training_filename, 'features': svr_feat_dict, 'threshold': mbic_threshold,
+                  'pca_comp': svr_pca_comp, 'C': svr_c, 'gamma': svr_g,
+                  'training_key': training_key(training, svr_feat_dict, 'MBIC')}
+    svm_model = load_or_fit(svm_artifact_path, svm_params, lambda: train_svm(svm_params))
+    svr_model = load_or_fit(svr_artifact_path, svr_params, lambda: train_svr(svr_params))
+
+    # Test peptides are streamed in chunks holding only the name, decision function and
+    # model features, the models refuse inputs without the features they were trained on
+    columns = ['Name', 'Decision Fn'] + svm_model.feature_names + svr_model.feature_names
+    out = CSVAppender(pred_filename, ['Names', 'Decision Fn', 'Predicted MBIC Value'])
+    total = 0
+    if sparse_input:
+        chunks = SparseDescriptors.iter_csv(test_filename, columns[:2], columns[2:], chunk_size)
+    else:
+        chunks = read_columns(test_filename, columns, chunk_size)
+    for chunk in chunks:
+        total += len(chunk)
+
+        # Predict which bucket test peptides fall into, the SVR predicts the MBIC of bucket 1
+        test_peptide_classes = svm_model.predict(svm_model.features(chunk))
+        if sparse_input:
+            bucket0 = chunk.take(test_peptide_classes == 1)
+        else:
+            bucket0 = chunk[test_peptide_classes == 1]
+        test_peptide_mbic = svr_model.predict(svr_model.features(bucket0))
+
+        # Save MBIC predictions
+        out.write(pd.DataFrame({'Names': bucket0['Name'].to_numpy(),
+                                'Decision Fn': bucket0['Decision Fn'].to_numpy(),
+                                'Predicted MBIC Value': test_peptide_mbic}))
+
+    print('Test Peptides: ', total)
+    print('Predicted MBIC <= %s: ' % mbic_threshold, out.rows)
+    tracer.report(trace_filename, script=os.path.basename(__file__), test_filename=test_filename)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
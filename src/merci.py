@@ -0,0 +1,601 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# In-process versions of the MERCI motif miner (MERCI-U.pl) and motif locator
+# (MERCI_motif_locator.pl).
+# Motifs are read from a MERCI motif file, where each line after 'Motifs:' is a
+# list of elements: residues, classes of a classification hierarchy
+# (KOOLMAN-ROHM, BETTS-RUSSELL, RASMOL or a user hierarchy file) and 'gap'
+# (.{0,maxgaplength}). A motif occurs in a sequence when its regular expression
+# matches anywhere in it, as with the Perl locator.
+#
+# All motifs are compiled into one prefix tree that is matched against a whole
+# batch of sequences at once: every tree node holds, for the sequences still
+# alive, a bitset of the positions where its prefix can end, and a child node
+# is one vectorized shift-and-mask step away from its parent.
+# Prefixes shared by several motifs are matched once and sequences drop out of
+# a subtree as soon as its prefix stops matching.
+#
+# The miner walks the same refinement search as MERCI-U, in the same order, and
+# finds the same motifs. The positive support of every candidate is a packed
+# bitset (a Python int), so DAG pruning is a bitwise AND and the frequency a
+# popcount, and a refinement only extends the match state of the candidate it
+# refines on the sequences that candidate occurs in, instead of re-running a
+# regular expression over every sequence.
+#
+# Usage: python merci.py mine -p posfile -n negfile [-k 10|ALL] [-fp 1] [-fn 0] [-o motifs] [-l 10000]
+#                             [-c NONE] [-s 10000] [-g 0] [-gl 1] [-para 0]
+#        python merci.py locate -i motifs -p posfile [-n negfile] [-c NONE] [-gl 1] [-s 10000] [-o counts.csv]
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import re
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from peptide_features import read_fasta
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+RESIDUES = 'ACDEFGHIKLMNPQRSTUVWY'
+MAX_LEVELS = 10000  # Refinement levels explored by MERCI-U
+
+# MERCI-U options, as labelled in the summary of a motif file, and their defaults
+MINE_OPTIONS = (('p', ' -p    ', -1), ('n', ' -n    ', -1), ('k', ' -k \t  ', 10), ('fp', ' -fp   ', 1),
+                ('fn', ' -fn   ', 0), ('o', ' -o    ', 'motifs'), ('l', ' -l    ', 10000),
+                ('s', ' -s    ', 10000), ('c', ' -c    ', 'NONE'), ('g', ' -g    ', 0),
+                ('gl', ' -gl   ', 1), ('para', ' -para ', 0))
+
+# Classes of the built-in hierarchies, their tree (minimal refinements) and the
+# extra parents of the DAG hierarchies, as defined in MERCI-U.pl
+HIERARCHIES = {
+    'NONE': {
+        'classes': {},
+        'refinements': {'root': list('ACDEFGHIKLMNPQRSTVWY')},
+        'dag_parents': {},
+    },
+    'KOOLMAN-ROHM': {
+        'classes': {'aliphatic': 'AGILV', 'sulfur': 'CM', 'aromatic': 'FYW', 'neutral': 'STNQ',
+                    'acidic': 'DE', 'basic': 'RHK'},
+        'refinements': {'root': ['aliphatic', 'sulfur', 'aromatic', 'neutral', 'acidic', 'basic', 'P'],
+                        'aliphatic': ['A', 'G', 'I', 'L', 'V'], 'sulfur': ['C', 'M'],
+                        'aromatic': ['F', 'Y', 'W'], 'neutral': ['S', 'T', 'N', 'Q'],
+                        'acidic': ['D', 'E'], 'basic': ['R', 'H', 'K']},
+        'dag_parents': {},
+    },
+    'BETTS-RUSSELL': {
+        'classes': {'polar': 'HKRDEYWTCSNQ', 'charged': 'DERHK', 'negative': 'DE', 'positive': 'RHK',
+                    'small': 'AGCSPNDTV', 'tiny': 'AGCS', 'hydrophobic': 'HFWYILVMKTAGC',
+                    'aromatic': 'HFWY', 'aliphatic': 'ILV'},
+        'refinements': {'root': ['polar', 'hydrophobic', 'small'], 'polar': ['charged', 'Q'],
+                        'charged': ['positive', 'negative'], 'positive': ['R'], 'negative': ['E'],
+                        'hydrophobic': ['aromatic', 'aliphatic', 'M', 'K'],
+                        'aromatic': ['F', 'Y', 'W', 'H'], 'aliphatic': ['I', 'L'],
+                        'small': ['tiny', 'P', 'N', 'D', 'T', 'V'], 'tiny': ['A', 'C', 'G', 'S']},
+        'dag_parents': {'A': ['hydrophobic'], 'C': ['hydrophobic', 'polar'], 'D': ['negative'],
+                        'G': ['hydrophobic'], 'H': ['positive'], 'K': ['positive'], 'N': ['polar'],
+                        'S': ['polar'], 'T': ['hydrophobic', 'polar'], 'V': ['aliphatic'],
+                        'W': ['polar'], 'Y': ['polar']},
+    },
+    'RASMOL': {
+        'classes': {'charged': 'DERHK', 'acidic': 'DE', 'basic': 'RHK', 'neutral': 'ANCQGILMFPSTWYV',
+                    'cyclic': 'HFWYP', 'acyclic': 'ARNDCEQGILKMSTV', 'aromatic': 'HFWY',
+                    'aliphatic': 'AGILV', 'surface': 'RNDEQGHKPSTY', 'buried': 'ACILMFWV',
+                    'hydrophobic': 'AGILMFPWYV', 'polar': 'RNDCEQHKST', 'small': 'AGS',
+                    'medium': 'NDCPTV', 'large': 'REQHILKMFWY'},
+        'refinements': {'root': ['neutral', 'acyclic', 'hydrophobic', 'large', 'cyclic', 'surface',
+                                 'polar', 'medium'],
+                        'neutral': ['buried'], 'acyclic': ['small'], 'hydrophobic': ['aliphatic'],
+                        'large': ['I', 'L', 'M'], 'cyclic': ['aromatic'], 'surface': ['G', 'Y'],
+                        'polar': ['charged', 'Q', 'S'], 'medium': ['N', 'D', 'C', 'P', 'T', 'V'],
+                        'aliphatic': ['A'], 'aromatic': ['F', 'W'], 'charged': ['acidic', 'basic'],
+                        'basic': ['R', 'H', 'K'], 'acidic': ['E']},
+        'dag_parents': {'A': ['buried', 'small'], 'C': ['buried', 'polar', 'acyclic'], 'D': ['acidic'],
+                        'E': ['large'], 'F': ['buried', 'hydrophobic'], 'G': ['aliphatic', 'small'],
+                        'H': ['aromatic'], 'I': ['aliphatic', 'buried', 'hydrophobic'], 'K': ['acyclic'],
+                        'L': ['aliphatic', 'buried', 'hydrophobic'],
+                        'M': ['acyclic', 'buried', 'hydrophobic'],
+                        'N': ['neutral', 'surface', 'acyclic', 'polar'],
+                        'P': ['neutral', 'surface', 'hydrophobic', 'cyclic'],
+                        'Q': ['neutral', 'surface', 'large', 'acyclic'], 'R': ['acyclic'],
+                        'S': ['surface', 'small'], 'T': ['neutral', 'surface', 'acyclic', 'polar'],
+                        'V': ['buried', 'aliphatic'], 'W': ['buried', 'hydrophobic'],
+                        'Y': ['neutral', 'hydrophobic', 'aromatic'], 'small': ['neutral'],
+                        'aliphatic': ['neutral', 'acyclic'], 'aromatic': ['large'],
+                        'charged': ['surface'], 'basic': ['large'], 'acidic': ['acyclic']},
+    },
+}
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def load_user_hierarchy(filename):
+    """Classes, tree and DAG parents of a MERCI classification file (see the MERCI manual)."""
+    with open(filename) as f:
+        lines = [line.rstrip('\n') for line in f]
+    section = None
+    hierarchy = {'classes': {}, 'refinements': {}, 'dag_parents': {}}
+    for line in lines:
+        if section is None and 'Definitions' in line:
+            section = 'classes'
+            continue
+        if section == 'classes' and '=' not in line:
+            section = 'wait_tree'
+        if section == 'wait_tree' and 'Tree structure' in line:
+            section = 'refinements'
+            continue
+        if section == 'refinements' and '=' not in line:
+            section = 'wait_dag'
+        if section == 'wait_dag' and 'DAG parents' in line:
+            section = 'dag_parents'
+            continue
+        if section in ('classes', 'refinements', 'dag_parents') and '=' in line:
+            m = re.search(r'(\S+)\s*=\s*(.+)', line)
+            if m is None:
+                raise ValueError('Wrong line format in hierarchy file: %s' % line)
+            values = m.group(2).replace(' ', '')
+            if section == 'classes':
+                hierarchy['classes'][m.group(1)] = values.replace(',', '')
+            else:
+                hierarchy[section][m.group(1)] = values.split(',')
+    return hierarchy
+
+
+def get_hierarchy(name):
+    """A built-in hierarchy by name or a user hierarchy read from a file."""
+    if name in HIERARCHIES:
+        return HIERARCHIES[name]
+    return load_user_hierarchy(name)
+
+
+def element_regex(element, hierarchy, max_gap_length=1):
+    """Regular expression of one motif element, as the MERCI scripts build it."""
+    if element == 'gap':
+        if max_gap_length == 0:
+            raise ValueError('Motif found with gap, but maximal gap length is set to zero')
+        return '.{0,%d}' % max_gap_length
+    if element in hierarchy['classes']:
+        return '[%s]' % hierarchy['classes'][element]
+    if element in RESIDUES:
+        return element
+    raise ValueError('No string representation for motif element %r' % element)
+
+
+def motif_regex(motif, hierarchy, max_gap_length=1):
+    return ''.join(element_regex(e, hierarchy, max_gap_length) for e in motif)
+
+
+def read_motifs(filename):
+    """Motifs (lists of elements) listed after the 'Motifs:' line of a MERCI motif file."""
+    with open(filename) as f:
+        lines = f.read().split('\n')
+    for i, line in enumerate(lines):
+        if 'Motifs:' in line:
+            body = lines[i + 1:]
+            break
+    else:
+        raise ValueError('No Motifs: line in %s' % filename)
+    # Like the Perl locator, a final newline does not start another motif
+    if body and body[-1] == '':
+        body = body[:-1]
+    return [line.split() for line in body]
+
+
+def _pack(bits):
+    """Pack the columns of a boolean matrix into uint64 words, column j in bit j % 64 of word j // 64."""
+    n, m = bits.shape
+    words = max(1, -(-m // 64))
+    padded = np.zeros((n, words * 64), dtype=bool)
+    padded[:, :m] = bits
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8').astype(np.uint64)
+
+
+def _shift(S):
+    """Move every bit of packed rows one position up."""
+    out = S << np.uint64(1)
+    if S.shape[1] > 1:
+        out[:, 1:] |= S[:, :-1] >> np.uint64(63)
+    return out
+
+
+def _to_bitset(rows):
+    """Python int with bit i set for every row index i."""
+    if len(rows) == 0:
+        return 0
+    flags = np.zeros(int(rows[-1]) + 1, dtype=bool)
+    flags[rows] = True
+    return int.from_bytes(np.packbits(flags, bitorder='little').tobytes(), 'little')
+
+
+def _from_bitset(bits, n):
+    """Sorted row indices of the set bits of a Python int over n rows."""
+    data = np.frombuffer(bits.to_bytes(-(-n // 8), 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(data, count=n, bitorder='little'))
+
+
+def read_sequences(filename, string_length=10000):
+    """Sequences and header lines of a FASTA file, read like MERCI-U reads them.
+
+    Sequence lines are stripped and joined, and each sequence is cut to
+    string_length characters.
+    """
+    sequences, headers = [], []
+    sequence = ''
+    with open(filename) as f:
+        for line in f:
+            if line.startswith('>'):
+                if sequence:
+                    sequences.append(sequence[:string_length])
+                sequence = ''
+                headers.append(line.rstrip('\n'))
+            else:
+                sequence += line.strip()
+    sequences.append(sequence[:string_length])
+    return sequences, headers
+
+
+def write_motif_file(filename, motifs, options):
+    """Write motifs in the MERCI-U output format.
+
+    options maps MERCI-U option names (p, n, k, fp, fn, o, l, s, c, g, gl, para)
+    to the values printed in the summary at the top of the file, options left
+    out are printed with their MERCI-U default.
+    """
+    with open(filename, 'w', newline='\n') as f:
+        f.write('MERCI - Summary of options:\n')
+        for name, label, default in MINE_OPTIONS:
+            f.write('%s%s\n' % (label, options.get(name, default)))
+        f.write('\n\nMotifs:\n')
+        for motif in motifs:
+            f.write(''.join(' ' + e for e in motif) + '\n')
+
+
+def encode_sequences(sequences, string_length=10000):
+    """Byte matrix of sequences, zero padded, and their lengths.
+
+    Sequences are stripped of surrounding whitespace and cut to string_length
+    characters like the MERCI scripts do.
+    """
+    seqs = [str(s).strip()[:string_length].encode('latin-1') for s in sequences]
+    lengths = np.array([len(s) for s in seqs], dtype=np.int64)
+    codes = np.zeros((len(seqs), int(lengths.max(initial=0))), dtype=np.uint8)
+    for i, s in enumerate(seqs):
+        codes[i, :len(s)] = np.frombuffer(s, dtype=np.uint8)
+    return codes, lengths
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class MotifLocator:
+    """All motifs of a MERCI motif file compiled into one prefix tree matcher."""
+
+    def __init__(self, motifs, hierarchy='NONE', max_gap_length=1, string_length=10000):
+        self.motifs = [list(m) for m in motifs]
+        self.hierarchy = get_hierarchy(hierarchy) if isinstance(hierarchy, str) else hierarchy
+        self.max_gap_length = int(max_gap_length)
+        self.string_length = int(string_length)
+
+        # One membership table over byte values per element, from its regular expression
+        self._tables = {}
+        for e in set(e for motif in self.motifs for e in motif):
+            rx = re.compile(element_regex(e, self.hierarchy, self.max_gap_length))
+            if e != 'gap':
+                self._tables[e] = np.array([rx.fullmatch(chr(b)) is not None for b in range(256)])
+
+        # Prefix tree, node 0 is the empty prefix
+        self._children = [{}]
+        self._terminals = [[]]
+        for m, motif in enumerate(self.motifs):
+            node = 0
+            for e in motif:
+                child = self._children[node].get(e)
+                if child is None:
+                    child = len(self._children)
+                    self._children[node][e] = child
+                    self._children.append({})
+                    self._terminals.append([])
+                node = child
+            self._terminals[node].append(m)
+
+    @classmethod
+    def from_file(cls, filename, hierarchy='NONE', max_gap_length=1, string_length=10000):
+        return cls(read_motifs(filename), hierarchy, max_gap_length, string_length)
+
+    def __len__(self):
+        return len(self.motifs)
+
+    def _step(self, S, element, masks, valid):
+        """End positions after matching one more element from end positions S."""
+        if element != 'gap':
+            return _shift(S) & masks[element]
+        out = S.copy()
+        for _ in range(self.max_gap_length):
+            S = _shift(S)
+            out |= S
+        return out & valid
+
+    def _hits(self, codes, lengths):
+        """Yield (motif, rows) for the rows of a batch each motif occurs in."""
+        # Bit j of a row is position j of the sequence, an element mask has bit
+        # j + 1 set when residue j belongs to the element
+        n, width = codes.shape
+        valid = _pack(np.arange(width + 1)[None, :] <= lengths[:, None])
+        element_masks = {}
+        for element, table in self._tables.items():
+            element_masks[element] = _pack(np.hstack((np.zeros((n, 1), dtype=bool), table[codes])))
+
+        stack = [(0, np.arange(n), valid)]
+        while stack:
+            node, rows, S = stack.pop()
+            found = (S != 0).any(axis=1)
+            for m in self._terminals[node]:
+                yield m, rows[found]
+            if not found.all():
+                rows, S = rows[found], S[found]
+            if len(rows) == 0 or not self._children[node]:
+                continue
+            masks = {e: element_masks[e][rows] for e in self._children[node] if e != 'gap'}
+            node_valid = valid[rows]
+            for element, child in self._children[node].items():
+                stack.append((child, rows, self._step(S, element, masks, node_valid)))
+
+    def occurrences(self, sequences, chunk_size=10000):
+        """Sparse boolean (sequences x motifs) matrix of motif occurrences."""
+        codes, lengths = encode_sequences(sequences, self.string_length)
+        # Sequences of similar length are matched together to limit padding
+        order = np.argsort(lengths, kind='stable')
+        rows, cols = [], []
+        for start in range(0, len(order), chunk_size):
+            batch = order[start:start + chunk_size]
+            width = int(lengths[batch].max(initial=0))
+            for m, hit in self._hits(codes[batch, :width], lengths[batch]):
+                rows.append(batch[hit])
+                cols.append(np.full(len(hit), m))
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+        return sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)),
+                                 shape=(len(lengths), len(self.motifs)))
+
+    def counts(self, sequences, chunk_size=10000):
+        """Number of motifs occurring in each sequence."""
+        return np.asarray(self.occurrences(sequences, chunk_size).sum(axis=1)).ravel()
+
+
+class MotifMiner:
+    """MERCI-U: motifs frequent in the positive and infrequent in the negative sequences.
+
+    A motif is reported when it occurs in at least min_freq positives and at
+    most max_freq negatives. k is the number of motifs wanted or 'ALL'; as in
+    MERCI-U the minimal frequency is raised as better motifs are found and all
+    motifs tied with the k-th most frequent one are kept. Motifs have at most
+    max_length elements, among which at most max_gaps gaps of up to
+    max_gap_length residues. parallel restricts the search to one first level
+    element of the hierarchy ('0' searches everything).
+    """
+
+    def __init__(self, positives, negatives, k=10, min_freq=1, max_freq=0, max_length=10000,
+                 hierarchy='NONE', max_gaps=0, max_gap_length=1, string_length=10000, parallel='0'):
+        self.k = k if k == 'ALL' else int(k)
+        self.min_freq = int(min_freq)
+        self.max_freq = int(max_freq)
+        self.max_length = int(max_length)
+        self.max_gaps = int(max_gaps)
+        self.max_gap_length = int(max_gap_length)
+        self.string_length = int(string_length)
+        self.hierarchy = get_hierarchy(hierarchy) if isinstance(hierarchy, str) else hierarchy
+
+        self.refinements = dict(self.hierarchy['refinements'])
+        self.root_elements = self.refinements['root']
+        if str(parallel) != '0':
+            self.refinements['root'] = [parallel]
+        self.dag_parents = self.hierarchy['dag_parents']
+
+        # Regular expressions of the elements, they name the supports of the candidates
+        elements = set(RESIDUES) | set(self.hierarchy['classes']) | set(self.dag_parents)
+        elements |= set(e for refs in self.refinements.values() for e in refs)
+        elements |= set(e for parents in self.dag_parents.values() for e in parents)
+        elements.discard('root')
+        self._strings = {e: element_regex(e, self.hierarchy) for e in elements}
+        self._strings['gap'] = '.{0,%d}' % self.max_gap_length
+        self._tables = {}
+        for e in elements:
+            rx = re.compile(self._strings[e])
+            self._tables[e] = np.array([rx.fullmatch(chr(b)) is not None for b in range(256)])
+
+        self._pos = self._encode(positives)
+        self._neg = self._encode(negatives)
+        self.motifs = None
+
+    def _encode(self, sequences):
+        """Element masks of a sequence set, laid out like in MotifLocator._hits()."""
+        codes, lengths = encode_sequences(sequences, self.string_length)
+        n, width = codes.shape
+        masks = {e: _pack(np.hstack((np.zeros((n, 1), dtype=bool), table[codes])))
+                 for e, table in self._tables.items()}
+        valid = _pack(np.arange(width + 1)[None, :] <= lengths[:, None])
+        return {'n': n, 'masks': masks, 'valid': valid}
+
+    def _key(self, motif):
+        return ''.join(self._strings[e] for e in motif)
+
+    def _advance(self, state, element, data, rows=None):
+        """Match state (rows, end positions) after one more element, restricted to rows.
+
+        Only the rows where the extended prefix still occurs are kept.
+        """
+        state_rows, S = state
+        if rows is not None and len(rows) != len(state_rows):
+            index = np.searchsorted(state_rows, rows)
+            state_rows, S = rows, S[index]
+        if element == 'gap':
+            out = S.copy()
+            for _ in range(self.max_gap_length):
+                S = _shift(S)
+                out |= S
+            return state_rows, out & data['valid'][state_rows]
+        S = _shift(S) & data['masks'][element][state_rows]
+        found = S.any(axis=1)
+        return state_rows[found], S[found]
+
+    def _walk(self, motif, data):
+        state = (np.arange(data['n']), data['valid'])
+        for e in motif:
+            state = self._advance(state, e, data)
+        return state
+
+    def _prune(self, motif, frequent, examples):
+        """Positives left to check once the DAG parents of the last element are applied.
+
+        Every pattern with the last element replaced by one of its DAG parents
+        must be frequent, and the candidate can only occur where they all do.
+        """
+        parents = self.dag_parents.get(motif[-1])
+        if len(motif) > 1 and parents is not None:
+            prefix = self._key(motif[:-1])
+            for parent in parents:
+                support = frequent.get(prefix + self._strings[parent])
+                if support is None:
+                    return 0
+                examples &= support
+        return examples
+
+    def _add_pattern(self, motif, frequency):
+        if self.k == 'ALL':
+            self.motifs.append(motif)
+            return
+        self._topk.setdefault(frequency, []).append(motif)
+        # Raise the minimal frequency to that of the k-th most frequent motif
+        count = 0
+        for f in sorted(self._topk, reverse=True):
+            count += len(self._topk[f])
+            if count >= self.k:
+                self._min_freq = f
+                break
+
+    def _mine(self, motif, prefix, examples, rows, level, frequent, parent_monotone):
+        """Check one candidate and recurse into its refinements, as MERCI-U's mine().
+
+        prefix is the match state of the positives and negatives before the last
+        element, examples the bitset of positives the candidate can occur in
+        (rows as indices) and frequent the supports of the frequent patterns
+        its DAG parents are looked up in.
+        """
+        pruned = self._prune(motif, frequent, examples)
+        if pruned != examples:
+            if pruned.bit_count() < self._min_freq:
+                return
+            rows = _from_bitset(pruned, self._pos['n'])
+        elif len(rows) < self._min_freq:
+            return
+        pos_state = self._advance(prefix[0], motif[-1], self._pos, rows)
+        frequency = len(pos_state[0])
+        if frequency < self._min_freq:
+            return
+        support = _to_bitset(pos_state[0])
+        frequent[self._key(motif)] = support
+
+        # Negatives are only counted until a generalization is infrequent in them
+        neg_state = None
+        negatives = -1
+        if parent_monotone < 1:
+            neg_prefix = prefix[1] if prefix[1] is not None else self._walk(motif[:-1], self._neg)
+            neg_state = self._advance(neg_prefix, motif[-1], self._neg)
+            negatives = len(neg_state[0])
+        monotone = 0
+        if negatives <= self.max_freq:
+            monotone = 1
+            self._add_pattern(motif, frequency)
+
+        level += 1
+        if level > MAX_LEVELS:
+            return
+        # Specializations of the last element share the candidate's frequent patterns
+        for element in self.refinements.get(motif[-1], ()):
+            self._mine(motif[:-1] + [element], prefix, support, pos_state[0], level, frequent, monotone)
+        if len(motif) >= self.max_length:
+            return
+        state = (pos_state, neg_state)
+        gapped = None
+        extended = {}
+        for element in self.root_elements:
+            self._mine(motif + [element], state, support, pos_state[0], level, extended, monotone)
+            if (self.max_gaps > 0 and motif.count('gap') < self.max_gaps
+                    and len(motif) < self.max_length - 1):
+                if gapped is None:
+                    gapped = (self._advance(pos_state, 'gap', self._pos),
+                              None if neg_state is None else self._advance(neg_state, 'gap', self._neg))
+                self._mine(motif + ['gap', element], gapped, support, pos_state[0], level, extended, monotone)
+
+    def mine(self):
+        """Motifs (lists of elements) in the order MERCI-U writes them."""
+        self.motifs = []
+        self._topk = {}
+        self._min_freq = self.min_freq
+        root = (self._walk([], self._pos), self._walk([], self._neg))
+        examples = (1 << self._pos['n']) - 1
+        for element in self.refinements['root']:
+            self._mine([element], root, examples, root[0][0], 1, {}, 0)
+        if self.k != 'ALL':
+            self.motifs = [m for f in sorted(self._topk, reverse=True) if f >= self._min_freq
+                           for m in self._topk[f]]
+        return self.motifs
+
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(description='MERCI motif miner and locator')
+    commands = parser.add_subparsers(dest='command', required=True)
+    mine = commands.add_parser('mine', help='find motifs frequent in the positives and not in the negatives')
+    mine.add_argument('-p', dest='posfile', required=True)
+    mine.add_argument('-n', dest='negfile', required=True)
+    mine.add_argument('-k', dest='k', default='10', help='number of motifs or ALL')
+    mine.add_argument('-fp', dest='minfreq', default='1')
+    mine.add_argument('-fn', dest='maxfreq', default='0')
+    mine.add_argument('-o', dest='outputfile', default='motifs')
+    mine.add_argument('-l', dest='maxlength', default='10000')
+    mine.add_argument('-c', dest='hierarchy', default='NONE')
+    mine.add_argument('-s', dest='stringlength', default='10000')
+    mine.add_argument('-g', dest='maxgaps', default='0')
+    mine.add_argument('-gl', dest='maxgaplength', default='1')
+    mine.add_argument('-para', dest='parallel', default='0')
+    locate = commands.add_parser('locate', help='count motif occurrences per sequence')
+    locate.add_argument('-p', dest='posfile', required=True)
+    locate.add_argument('-n', dest='negfile')
+    locate.add_argument('-i', dest='motiffile', default='motifs')
+    locate.add_argument('-o', dest='outputfile', default=None)
+    locate.add_argument('-c', dest='hierarchy', default='NONE')
+    locate.add_argument('-gl', dest='maxgaplength', type=int, default=1)
+    locate.add_argument('-s', dest='stringlength', type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.command == 'mine':
+        positives, _ = read_sequences(args.posfile, int(args.stringlength))
+        negatives, _ = read_sequences(args.negfile, int(args.stringlength))
+        miner = MotifMiner(positives, negatives, args.k, args.minfreq, args.maxfreq, args.maxlength,
+                           args.hierarchy, args.maxgaps, args.maxgaplength, args.stringlength, args.parallel)
+        start = time.time()
+        motifs = miner.mine()
+        write_motif_file(args.outputfile, motifs, {
+            'p': args.posfile, 'n': args.negfile, 'k': args.k, 'fp': args.minfreq, 'fn': args.maxfreq,
+            'o': args.outputfile, 'l': args.maxlength, 's': args.stringlength, 'c': args.hierarchy,
+            'g': args.maxgaps, 'gl': args.maxgaplength, 'para': args.parallel})
+        print('%d motifs written to %s in %.2f seconds' % (len(motifs), args.outputfile, time.time() - start))
+        return
+
+    locator = MotifLocator.from_file(args.motiffile, args.hierarchy, args.maxgaplength, args.stringlength)
+    names, seqs = read_fasta(args.posfile)
+    if args.negfile:
+        neg_names, neg_seqs = read_fasta(args.negfile)
+        names, seqs = names + neg_names, seqs + neg_seqs
+    counts = pd.DataFrame({'Name': names, 'Motif Count': locator.counts(seqs)})
+    outputfile = args.outputfile or args.motiffile + '.counts.csv'
+    counts.to_csv(outputfile, index=False)
+    print('%d motifs located in %d sequences, counts written to %s' % (len(locator), len(seqs), outputfile))
+
+if __name__ == "__main__":
+    main()
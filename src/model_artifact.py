@@ -0,0 +1,194 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Fitted MinMaxScaler -> PCA -> RBF SVC/SVR pipelines saved to disk so the
+# prediction scripts load a model instead of retraining it on every run.
+# An artifact is a directory holding a manifest.json (format version, model
+# kind, feature names, hyperparameters and array shapes) and one .npy file per
+# fitted array. The arrays are memory-mapped on load and prediction only needs
+# NumPy, so loading takes milliseconds. Inputs can also be sparse (CSR), they
+# are scaled and projected without being densified. The params of an artifact
+# hold a digest of the training data it was fitted on (see training_key), so a
+# training file regenerated under the same name refits the model.
+#
+# Usage: python model_artifact.py <artifact_dir>    (prints the manifest)
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import os
+import sys
+import json
+import shutil
+import numpy as np
+from scipy import sparse
+from kernel_cache import squared_distances, array_key
+from checkpoint import atomic_write_json
+from sparse_features import SparseDescriptors, scale_columns
+from timing import tracer
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+FORMAT_VERSION = 1
+MODEL_KINDS = ('SVC', 'SVR')
+ARRAY_NAMES = ('scale', 'min', 'mean', 'components', 'support_vectors', 'dual_coef', 'intercept', 'classes')
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class ModelArtifact:
+    """A fitted scaler + PCA + RBF SVC/SVR pipeline over named features.
+
+    feature_names are the input columns in the order the pipeline was fitted
+    on and params the hyperparameters of the fit, including the RBF gamma.
+    """
+
+    def __init__(self, kind, feature_names, params, arrays):
+        if kind not in MODEL_KINDS:
+            raise ValueError('Unknown model kind %r, expected one of %s' % (kind, MODEL_KINDS))
+        self.kind = kind
+        self.feature_names = list(feature_names)
+        self.params = dict(params)
+        self.arrays = arrays
+        self.gamma = float(self.params['gamma'])
+
+    @classmethod
+    def from_pipeline(cls, kind, feature_names, params, scaler, pca, model):
+        """Artifact of a fitted MinMaxScaler, PCA and SVC/SVR(kernel='rbf')."""
+        if model.kernel != 'rbf':
+            raise ValueError('Only rbf models can be saved, got kernel %r' % model.kernel)
+        if kind == 'SVC' and len(model.classes_) != 2:
+            raise ValueError('Only binary SVC models can be saved')
+        arrays = {
+            'scale': scaler.scale_, 'min': scaler.min_,
+            'mean': pca.mean_, 'components': pca.components_,
+            'support_vectors': model.support_vectors_,
+            'dual_coef': model.dual_coef_.ravel(), 'intercept': np.ravel(model.intercept_),
+            'classes': getattr(model, 'classes_', np.empty(0)),
+        }
+        arrays = {name: np.ascontiguousarray(a, dtype=np.float64) for name, a in arrays.items()}
+        return cls(kind, feature_names, params, arrays)
+
+    def save(self, path):
+        """Write the artifact directory, replacing an existing one."""
+        tmp_path = path.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        shapes = {}
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_path, name + '.npy'), self.arrays[name])
+            shapes[name] = list(self.arrays[name].shape)
+        atomic_write_json(os.path.join(tmp_path, 'manifest.json'), {
+            'format_version': FORMAT_VERSION, 'kind': self.kind,
+            'feature_names': self.feature_names, 'params': self.params, 'shapes': shapes})
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Read an artifact directory, memory-mapping its arrays by default."""
+        with open(os.path.join(path, 'manifest.json'), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError('Artifact %s has format version %s, this code reads version %d'
+                             % (path, manifest.get('format_version'), FORMAT_VERSION))
+        arrays = {}
+        for name in ARRAY_NAMES:
+            a = np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None)
+            if list(a.shape) != manifest['shapes'][name]:
+                raise ValueError('Artifact %s: %s.npy has shape %s, manifest says %s'
+                                 % (path, name, a.shape, manifest['shapes'][name]))
+            arrays[name] = a
+        return cls(manifest['kind'], manifest['feature_names'], manifest['params'], arrays)
+
+    def check_schema(self, columns):
+        """Raise a ValueError unless every feature of the artifact is in columns."""
+        columns = set(columns)
+        missing = [name for name in self.feature_names if name not in columns]
+        if missing:
+            raise ValueError('Input is missing %d feature(s) the model was trained on: %s'
+                             % (len(missing), ', '.join(missing)))
+
+    def features(self, data):
+        """Feature matrix of a DataFrame, or CSR matrix of SparseDescriptors, columns in the order of the fit."""
+        with tracer.span('select'):
+            if isinstance(data, SparseDescriptors):
+                self.check_schema(data.names)
+                return data.select(self.feature_names)
+            self.check_schema(data.columns)
+            return data[self.feature_names].to_numpy(dtype=np.float64)
+
+    def transform(self, X):
+        """Scaled and PCA projected rows of X, a dense or sparse matrix."""
+        a = self.arrays
+        if sparse.issparse(X):
+            # The MinMax offset would fill in the zeros, it is projected on its own
+            offset = (a['min'] - a['mean']) @ a['components'].T
+            with tracer.span('scale'):
+                X = scale_columns(X, a['scale'])
+            with tracer.span('pca'):
+                return np.asarray(X @ a['components'].T) + offset
+        # Row-major input so results do not depend on how the caller laid out X
+        with tracer.span('scale'):
+            X = np.ascontiguousarray(X, dtype=np.float64) * a['scale'] + a['min']
+        with tracer.span('pca'):
+            return (X - a['mean']) @ a['components'].T
+
+    def decision_function(self, X, chunk_size=65536):
+        """SVC decision function or SVR prediction of the rows of X."""
+        a = self.arrays
+        X = self.transform(X)
+        out = np.empty(X.shape[0])
+        with tracer.span('predict', model=self.kind, rows=X.shape[0]):
+            for start in range(0, X.shape[0], chunk_size):
+                K = np.exp(-self.gamma * squared_distances(X[start:start + chunk_size], a['support_vectors']))
+                # A row-wise sum, unlike a BLAS product, gives a row the same value in any chunk
+                out[start:start + chunk_size] = (K * a['dual_coef']).sum(axis=1) + a['intercept'][0]
+        return out
+
+    def predict(self, X):
+        dec = self.decision_function(X)
+        if self.kind == 'SVR':
+            return dec
+        classes = self.arrays['classes']
+        return np.where(dec > 0, classes[1], classes[0])
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def training_key(peptides, features, response):
+    """Digest of the feature columns and response of a training table, in table order."""
+    columns = [f for f in peptides.columns if f in set(features)]
+    return array_key(peptides[columns].to_numpy(dtype=np.float64), peptides[response].to_numpy(dtype=np.float64),
+                     columns)
+
+
+def load_or_fit(path, params, fit):
+    """Load the artifact at path if it was fitted with params, else fit() and save it."""
+    if os.path.exists(path):
+        artifact = ModelArtifact.load(path)
+        if artifact.params == json.loads(json.dumps(params)):
+            return artifact
+        print('Hyperparameters, features or training data changed, refitting ' + path)
+    artifact = fit()
+    artifact.save(path)
+    return artifact
+
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
+
+    if len(sys.argv) != 2:
+        print('Usage: python model_artifact.py <artifact_dir>')
+        sys.exit(1)
+
+    artifact = ModelArtifact.load(sys.argv[1])
+    print('Kind:      ' + artifact.kind)
+    print('Features:  ' + ', '.join(artifact.feature_names))
+    print('Params:    ' + json.dumps(artifact.params))
+    print('Support vectors: %d' % artifact.arrays['support_vectors'].shape[0])
+
+if __name__ == "__main__":
+    main()
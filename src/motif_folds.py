@@ -0,0 +1,82 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Motif count features for cross-validation without mining every fold.
+# MERCI selects the motifs of its search space that occur in at least min_freq
+# positive and at most max_freq negative training sequences (or the k most
+# frequent of them), so the selection only depends on the motif counts of the
+# training rows. Motifs are mined once over all sequences with max_freq raised
+# by the largest number of negatives a fold holds out, which yields every motif
+# any fold can select, and located once into a sparse occurrence matrix. The
+# motifs of a fold are then picked from the counts of its training rows and
+# the train and test features are sums over the masked matrix, with no
+# information from the test rows of the fold.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import numpy as np
+from merci import MotifLocator, MotifMiner
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class MotifFoldCache:
+    """Per fold MERCI motif selection and counts from one mining and locating pass.
+
+    sequences and labels (1 for positives) are the rows the folds index into,
+    folds a list of (train_index, test_index) pairs. The remaining arguments
+    are the MERCI-U options of MotifMiner.
+    """
+
+    def __init__(self, sequences, labels, folds, k='ALL', min_freq=1, max_freq=0, max_length=10000,
+                 hierarchy='NONE', max_gaps=0, max_gap_length=1, string_length=10000):
+        self.sequences = [str(s) for s in sequences]
+        self.positive = np.asarray(labels) == 1
+        self.folds = [(np.asarray(train), np.asarray(test)) for train, test in folds]
+        self.k = k if k == 'ALL' else int(k)
+        self.min_freq = int(min_freq)
+        self.max_freq = int(max_freq)
+
+        # A fold can select motifs occurring in up to this many more negatives overall
+        self.margin = max([int(np.sum(~self.positive[test])) for _, test in self.folds], default=0)
+        positives = [s for s, p in zip(self.sequences, self.positive) if p]
+        negatives = [s for s, p in zip(self.sequences, self.positive) if not p]
+        miner = MotifMiner(positives, negatives, 'ALL', self.min_freq, self.max_freq + self.margin, max_length,
+                           hierarchy, max_gaps, max_gap_length, string_length)
+        self.motifs = miner.mine()
+        self.locator = MotifLocator(self.motifs, hierarchy, max_gap_length, string_length)
+        self.occurrences = self.locator.occurrences(self.sequences)
+        self._selected = {}
+
+    def select(self, train_index):
+        """Boolean mask of the candidate motifs MERCI selects on the given training rows."""
+        train_index = np.asarray(train_index)
+        held_out = int(np.sum(~self.positive)) - int(np.sum(~self.positive[train_index]))
+        if held_out > self.margin:
+            raise ValueError('Training rows leave out %d negatives, the candidates only cover %d'
+                             % (held_out, self.margin))
+        occ = self.occurrences[train_index]
+        positive = self.positive[train_index]
+        pos = np.asarray(occ.T @ positive.astype(np.int64)).ravel()
+        neg = np.asarray(occ.T @ (~positive).astype(np.int64)).ravel()
+        selected = (pos >= self.min_freq) & (neg <= self.max_freq)
+        if self.k != 'ALL' and selected.sum() >= self.k:
+            # Like MERCI-U, every motif as frequent as the k-th most frequent one is kept
+            kth = np.sort(pos[selected])[::-1][self.k - 1]
+            selected &= pos >= kth
+        return selected
+
+    def counts(self, index, selected):
+        """Number of selected motifs occurring in each of the rows."""
+        return np.asarray(self.occurrences[np.asarray(index)] @ selected.astype(np.int64)).ravel()
+
+    def fold_counts(self, fold):
+        """Motif counts of the train and test rows of a fold, motifs selected on its train rows."""
+        train, test = self.folds[fold]
+        if fold not in self._selected:
+            self._selected[fold] = self.select(train)
+        selected = self._selected[fold]
+        return self.counts(train, selected), self.counts(test, selected)
+
+    def selected_motifs(self, selected):
+        return [motif for motif, s in zip(self.motifs, selected) if s]
@@ -0,0 +1,66 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# PCA computed once per feature subset. The projection onto the first n
+# principal components is the first n columns of the full projection, so a
+# single SVD serves every component count of the sweep and each count is
+# handed out as a view without copying.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+from collections import OrderedDict
+import numpy as np
+from timing import tracer
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class PCAPrefix:
+    """All principal component scores of X from one SVD.
+
+    transform(n) matches PCA(n_components=n).fit_transform(X) up to the sign
+    of each component.
+    """
+
+    def __init__(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        with tracer.span('pca'):
+            self.mean = X.mean(axis=0)
+            U, S, Vt = np.linalg.svd(X - self.mean, full_matrices=False)
+        self.components = Vt
+        self.singular_values = S
+        self.scores = U * S
+
+    @property
+    def max_components(self):
+        return self.scores.shape[1]
+
+    def transform(self, n):
+        """Projection of the fitted rows on the first n components (a view)."""
+        if not 1 <= n <= self.max_components:
+            raise ValueError('n must be between 1 and %d, got %d' % (self.max_components, n))
+        return self.scores[:, :n]
+
+    def project(self, X, n):
+        """Projection of new rows on the first n components."""
+        return (np.asarray(X, dtype=np.float64) - self.mean) @ self.components[:n].T
+
+
+class PrefixCache:
+    """Small LRU of PCAPrefix objects keyed by feature subset."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def prefix(self, key, transform):
+        """PCAPrefix of transform() rows, computed on a cache miss."""
+        pcs = self._entries.get(key)
+        if pcs is None:
+            pcs = PCAPrefix(transform())
+            self._entries[key] = pcs
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return pcs
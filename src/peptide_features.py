@@ -0,0 +1,282 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Vectorized peptide featurizer that reproduces the descriptor columns found in
+# the training and screening CSVs (SeqL, MwWt, Aromaticity, PI, amino acid
+# composition, dipeptide composition and the CTD blocks) directly from sequences.
+# Sequences are encoded as integer arrays and every descriptor is computed for a
+# whole batch at once with NumPy, so large databases can be featurized without
+# going through an external per-peptide tool.
+#
+# Usage: python peptide_features.py <input.fasta|input.csv> <output.csv>
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import sys
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+AA_LETTERS = 'ARNDCEQGHILKMFPSTWYV'
+
+# Average residue masses and isoelectric point tables (Biopython ProtParam)
+AA_WEIGHTS = {'A': 89.0932, 'R': 174.201, 'N': 132.1179, 'D': 133.1027,
+              'C': 121.1582, 'E': 147.1293, 'Q': 146.1445, 'G': 75.0666,
+              'H': 155.1546, 'I': 131.1729, 'L': 131.1729, 'K': 146.1876,
+              'M': 149.2113, 'F': 165.1891, 'P': 115.1305, 'S': 105.0926,
+              'T': 119.1192, 'W': 204.2252, 'Y': 181.1885, 'V': 117.1463}
+WATER_WEIGHT = 18.0153
+
+POSITIVE_PKS = {'K': 10.0, 'R': 12.0, 'H': 5.98}
+NEGATIVE_PKS = {'D': 4.05, 'E': 4.45, 'C': 9.0, 'Y': 10.0}
+NTERM_PK = 7.5
+CTERM_PK = 3.55
+NTERM_PKS = {'A': 7.59, 'M': 7.0, 'S': 6.93, 'P': 8.36, 'T': 6.82, 'V': 7.44, 'E': 7.7}
+CTERM_PKS = {'D': 4.55, 'E': 4.75}
+
+# CTD property groups, in the order the columns appear in the CSVs. As in the
+# original descriptor tool a residue belongs to the first group listing it, and
+# residues listed in no group (C for _NormalizedVDWV, GASTD for _Polarity) are
+# left out of the composition, transition and distribution counts.
+CTD_PROPERTIES = [
+    ('_Polarizability', ('GASDT', 'CPNVEQIL', 'KMHFRYW')),
+    ('_SolventAccessibility', ('ALFCGIVW', 'RKQEND', 'MPSTHY')),
+    ('_SecondaryStr', ('EALMQKRH', 'VIYCWFT', 'GNPSD')),
+    ('_Charge', ('KR', 'ANCQGHILMFPSTWYV', 'DE')),
+    ('_Polarity', ('LIFWCMVY', 'CPNVEQIL', 'KMHFRYW')),
+    ('_NormalizedVDWV', ('GASTPD', 'NVEQIL', 'MHKFRYW')),
+    ('_Hydrophobicity', ('RKEDQN', 'GASTPHY', 'CLVIMFW')),
+]
+DISTRIBUTION_QUANTILES = [('001', 0.0), ('025', 0.25), ('050', 0.5), ('075', 0.75), ('100', 1.0)]
+
+# The dipeptide headers in the CSVs are transposed with respect to the residue
+# pair they count: column 'RA' holds the frequency of 'AR'. The value order
+# follows the pair order (AA, AR, AN, ...) and the headers read AA, RA, NA, ...
+# The dipeptide 'PI' clashes with the isoelectric point and is read by pandas
+# as 'PI.1', which is the name the selected feature lists use.
+DIPEPTIDE_COLUMNS = [a + b for b in AA_LETTERS for a in AA_LETTERS]
+DIPEPTIDE_COLUMNS = ['PI.1' if name == 'PI' else name for name in DIPEPTIDE_COLUMNS]
+
+CTD_COLUMNS = ([prop + 'C' + str(g) for prop, _ in CTD_PROPERTIES for g in (1, 2, 3)] +
+               [prop + 'T' + t for prop, _ in CTD_PROPERTIES for t in ('12', '13', '23')] +
+               [prop + 'D' + str(g) + q for prop, _ in CTD_PROPERTIES
+                for g in (1, 2, 3) for q, _ in DISTRIBUTION_QUANTILES])
+
+FEATURE_COLUMNS = (['SeqL', 'MwWt', 'Aromaticity', 'PI'] + list(AA_LETTERS) +
+                   DIPEPTIDE_COLUMNS + CTD_COLUMNS)
+
+# Unknown residues (X) were featurized as alanine in the existing CSVs
+_CODE_TABLE = np.full(256, 255, dtype=np.uint8)
+for _i, _aa in enumerate(AA_LETTERS):
+    _CODE_TABLE[ord(_aa)] = _i
+_CODE_TABLE[ord('X')] = AA_LETTERS.index('A')
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def _lookup(table):
+    return np.array([table.get(aa, 0.0) for aa in AA_LETTERS])
+
+
+def _group_lookup(groups):
+    lut = np.full(len(AA_LETTERS), 3, dtype=np.int64)
+    for g in reversed(range(len(groups))):
+        for aa in groups[g]:
+            lut[AA_LETTERS.index(aa)] = g
+    return lut
+
+
+def read_fasta(path):
+    """Return (names, sequences) read from a FASTA file."""
+    names = []
+    seqs = []
+    chunks = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('>'):
+                if names:
+                    seqs.append(''.join(chunks))
+                names.append(line[1:].split()[0] if len(line) > 1 else '')
+                chunks = []
+            else:
+                chunks.append(line)
+    if names:
+        seqs.append(''.join(chunks))
+    return names, seqs
+
+
+def encode_sequences(sequences):
+    """Encode sequences as one flat array of residue codes plus lengths.
+
+    Residues are numbered in AA_LETTERS order and X is read as alanine. Any
+    other non-standard residue raises a ValueError.
+    """
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    if np.any(lengths == 0):
+        raise ValueError('Empty sequence at index %d' % int(np.argmax(lengths == 0)))
+    flat = np.frombuffer(''.join(sequences).encode('ascii'), dtype=np.uint8)
+    codes = _CODE_TABLE[flat]
+    bad = codes == 255
+    if bad.any():
+        seq_idx = int(np.searchsorted(np.cumsum(lengths), np.argmax(bad), side='right'))
+        raise ValueError('Non-standard residue in sequence %d: %s' % (seq_idx, sequences[seq_idx]))
+    return codes.astype(np.int64), lengths
+
+
+def _isoelectric_point(counts, first, last):
+    # Same bisection as Bio.SeqUtils.IsoelectricPoint.pi, run for all peptides
+    n = counts.shape[0]
+    pos_pk = np.array([POSITIVE_PKS[aa] for aa in POSITIVE_PKS])
+    neg_pk = np.array([NEGATIVE_PKS[aa] for aa in NEGATIVE_PKS])
+    pos_cnt = counts[:, [AA_LETTERS.index(aa) for aa in POSITIVE_PKS]]
+    neg_cnt = counts[:, [AA_LETTERS.index(aa) for aa in NEGATIVE_PKS]]
+    nterm_pk = _lookup(NTERM_PKS)[first]
+    nterm_pk[nterm_pk == 0] = NTERM_PK
+    cterm_pk = _lookup(CTERM_PKS)[last]
+    cterm_pk[cterm_pk == 0] = CTERM_PK
+
+    ph = np.full(n, 7.775)
+    lo = np.full(n, 4.05)
+    hi = np.full(n, 12.0)
+    active = np.ones(n, dtype=bool)
+    while active.any():
+        p = ph[active]
+        charge = (1.0 / (10 ** (p - nterm_pk[active]) + 1.0)
+                  + (pos_cnt[active] / (10 ** (p[:, None] - pos_pk) + 1.0)).sum(axis=1)
+                  - 1.0 / (10 ** (cterm_pk[active] - p) + 1.0)
+                  - (neg_cnt[active] / (10 ** (neg_pk - p[:, None]) + 1.0)).sum(axis=1))
+        up = charge > 0.0
+        lo_a = np.where(up, p, lo[active])
+        hi_a = np.where(up, hi[active], p)
+        lo[active] = lo_a
+        hi[active] = hi_a
+        ph[active] = (lo_a + hi_a) / 2
+        active[active] = (hi_a - lo_a) > 0.0001
+    return ph
+
+
+def _featurize_batch(sequences):
+    codes, lengths = encode_sequences(sequences)
+    n = len(sequences)
+    total = codes.shape[0]
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    seq_id = np.repeat(np.arange(n), lengths)
+    pos = np.arange(total) - starts[seq_id]
+    len_f = lengths.astype(np.float64)
+    pair_den = np.maximum(len_f - 1, 1)
+
+    # Physico-chemical properties
+    counts = np.bincount(seq_id * 20 + codes, minlength=n * 20).reshape(n, 20).astype(np.float64)
+    mw = counts @ _lookup(AA_WEIGHTS) - (len_f - 1) * WATER_WEIGHT
+    aromaticity = counts[:, [AA_LETTERS.index(aa) for aa in 'FWY']].sum(axis=1) / len_f
+    pi = _isoelectric_point(counts, codes[starts], codes[starts + lengths - 1])
+
+    # Amino acid composition
+    aac = np.round(counts / len_f[:, None] * 100, 3)
+
+    # Dipeptide composition. Occurrences are counted like str.count, so a run
+    # of identical residues only contributes every second overlapping pair.
+    has_next = pos < (lengths[seq_id] - 1)
+    left = np.flatnonzero(has_next)
+    a = codes[left]
+    b = codes[left + 1]
+    new_run = np.ones(total, dtype=bool)
+    new_run[1:] = (codes[1:] != codes[:-1]) | (pos[1:] == 0)
+    run_start = np.maximum.accumulate(np.where(new_run, np.arange(total), 0))
+    keep = (a != b) | (((left - run_start[left]) % 2) == 0)
+    dpc = np.bincount(seq_id[left[keep]] * 400 + a[keep] * 20 + b[keep],
+                      minlength=n * 400).reshape(n, 400)
+    dpc = np.round(dpc / pair_den[:, None] * 100, 2)
+
+    # Composition, transition and distribution of each property
+    comp = []
+    trans = []
+    dist = []
+    for _, groups in CTD_PROPERTIES:
+        g = _group_lookup(groups)[codes]
+        g_counts = np.bincount(seq_id * 4 + g, minlength=n * 4).reshape(n, 4)[:, :3]
+        comp.append(np.round(g_counts / len_f[:, None], 3))
+
+        ga = g[left]
+        gb = g[left + 1]
+        t_code = np.minimum(ga, gb) * 4 + np.maximum(ga, gb)
+        t_counts = np.bincount(seq_id[left] * 16 + t_code, minlength=n * 16).reshape(n, 16)
+        trans.append(np.round(t_counts[:, [1, 2, 6]] / pair_den[:, None], 3))
+
+        for grp in range(3):
+            mask = g == grp
+            rank = np.cumsum(mask)
+            rank = rank - np.concatenate(([0], rank))[starts][seq_id]
+            num = g_counts[:, grp]
+            hits = np.flatnonzero(mask)
+            for _, q in DISTRIBUTION_QUANTILES:
+                if q == 0.0:
+                    target = np.ones(n, dtype=np.int64)
+                else:
+                    target = np.floor(num * q).astype(np.int64)
+                    target[target == 0] = num[target == 0]
+                sel = hits[rank[hits] == target[seq_id[hits]]]
+                col = np.zeros(n)
+                col[seq_id[sel]] = (pos[sel] + 1) / len_f[seq_id[sel]] * 100
+                dist.append(np.round(col, 3)[:, None])
+
+    return np.hstack([len_f[:, None], mw[:, None], aromaticity[:, None], pi[:, None],
+                      aac, dpc] + comp + trans + dist)
+
+
+def featurize(sequences, names=None, chunk_size=100000):
+    """Compute the descriptor columns for a list of peptide sequences.
+
+    Returns a DataFrame with Name and Seq followed by FEATURE_COLUMNS, in the
+    same order and with the same rounding as the training CSVs. Sequences are
+    processed in chunks of chunk_size to bound memory.
+    """
+    sequences = [s.strip().upper() for s in sequences]
+    if names is None:
+        names = ['seq' + str(i) for i in range(len(sequences))]
+    blocks = [_featurize_batch(sequences[i:i + chunk_size])
+              for i in range(0, len(sequences), chunk_size)]
+    values = np.vstack(blocks) if blocks else np.zeros((0, len(FEATURE_COLUMNS)))
+    df = pd.DataFrame(values, columns=FEATURE_COLUMNS)
+    df['SeqL'] = df['SeqL'].astype(np.int64)
+    df.insert(0, 'Seq', sequences)
+    df.insert(0, 'Name', list(names))
+    return df
+
+
+def featurize_fasta(path, chunk_size=100000):
+    names, seqs = read_fasta(path)
+    return featurize(seqs, names, chunk_size)
+
+
+def featurize_csv(path, seq_column='Seq', name_column='Name', chunk_size=100000):
+    peptides = pd.read_csv(path, usecols=[name_column, seq_column])
+    return featurize(peptides[seq_column].tolist(), peptides[name_column].tolist(), chunk_size)
+
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
+
+    if len(sys.argv) != 3:
+        print('Usage: python peptide_features.py <input.fasta|input.csv> <output.csv>')
+        sys.exit(1)
+
+    in_filename, out_filename = sys.argv[1], sys.argv[2]
+    if in_filename.lower().endswith('.csv'):
+        peptides = featurize_csv(in_filename)
+    else:
+        peptides = featurize_fasta(in_filename)
+    print('Featurized Peptides Shape: ', peptides.shape)
+
+    # Write the dipeptide header as 'PI' like the existing data files
+    header = ['PI' if l == 'PI.1' else l for l in peptides.columns]
+    peptides.to_csv(out_filename, sep=',', index=False, header=header)
+
+if __name__ == "__main__":
+    main()
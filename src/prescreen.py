@@ -0,0 +1,184 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Cheap pre-screening of the candidates of a forward selection step. Before the
+# SVM/SVR sweep scores the remaining descriptors, all of them are ranked at
+# once by how much they add to the features already selected, and only the top
+# candidates go on to the sweep:
+#
+#   f    partial F statistic: the squared correlation of the candidate with the
+#        response once both are residualized on the selected features (and an
+#        intercept) by least squares
+#   mi   mutual information between the residualized candidate and the
+#        response (residualized too for regression)
+#
+# Candidates with one value in nearly all rows (most dipeptide frequencies of
+# short peptides are zero) are skipped before ranking. Each step writes one
+# JSON line with the kept and skipped candidates and their scores to a log,
+# replacing the lines of that step and later ones left by a run resumed from a
+# checkpoint.
+#
+# A sparse (CSC) descriptor matrix is never made dense as a whole: the mode
+# fractions and partial F statistics are computed on its nonzeros. The mutual
+# information ranks the candidates a chunk of columns at a time, for dense and
+# sparse matrices alike so both rank the same.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import os
+import json
+import numpy as np
+from scipy import sparse
+from sklearn.feature_selection import mutual_info_classif, mutual_info_regression
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+METHODS = ('f', 'mi')
+MI_CHUNK = 1024     # Columns residualized at a time for the mutual information
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def mode_fraction(X):
+    """Share of the rows holding the most common value, per column of X (dense or sparse)."""
+    if sparse.issparse(X):
+        return _sparse_mode_fraction(X)
+    n, m = X.shape
+    S = np.sort(X, axis=0)
+    # Runs of equal values in each sorted column, numbered per column and offset by column
+    runs = np.cumsum(np.vstack([np.ones((1, m), dtype=bool), S[1:] != S[:-1]]), axis=0) - 1
+    counts = np.bincount((runs + np.arange(m) * n).ravel(order='F'), minlength=n * m)
+    return counts.reshape(m, n).max(axis=1) / n
+
+
+def _sparse_mode_fraction(X):
+    X = sparse.csc_matrix(X, copy=True)
+    X.sum_duplicates()
+    X.eliminate_zeros()
+    n, m = X.shape
+    counts = np.diff(X.indptr)
+    # Runs of equal nonzero values within each column, the zeros of a column are one more value
+    cols = np.repeat(np.arange(m), counts)
+    order = np.lexsort((X.data, cols))
+    values, cols = X.data[order], cols[order]
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = (values[1:] != values[:-1]) | (cols[1:] != cols[:-1])
+    most = np.zeros(m, dtype=np.int64)
+    np.maximum.at(most, cols[starts], np.bincount(np.cumsum(starts) - 1))
+    return np.maximum(most, n - counts) / n
+
+
+def intercept_basis(Z, n):
+    """Orthonormal basis of the columns of Z and an intercept."""
+    Q, _ = np.linalg.qr(np.column_stack([np.ones(n), Z]))
+    return Q
+
+
+def residualize(A, Z):
+    """Columns of A minus their least squares fit on the columns of Z and an intercept."""
+    if sparse.issparse(A):
+        A = A.toarray()
+    Q = intercept_basis(Z, A.shape[0])
+    return A - Q @ (Q.T @ A)
+
+
+def partial_f(X, y, Z):
+    """Partial F statistic of each column of X (dense or sparse) for y given the columns of Z."""
+    r_y = residualize(y.reshape(-1, 1), Z).ravel()
+    if sparse.issparse(X):
+        # The residuals of X are not formed: r_y is orthogonal to the basis Q, so
+        # R.T r_y = X.T r_y, and |R_j|^2 = |X_j|^2 - |Q.T X_j|^2
+        X = sparse.csc_matrix(X)
+        XtQ = X.T @ intercept_basis(Z, X.shape[0])
+        ss_x = np.asarray(X.multiply(X).sum(axis=0)).ravel()
+        ss_r = ss_x - (XtQ * XtQ).sum(axis=1)
+        # Columns (nearly) in the span of Z lose all their digits in the subtraction
+        ss_r[ss_r <= 1e-10 * ss_x] = 0
+        dot = X.T @ r_y
+    else:
+        R = residualize(X, Z)
+        ss_r = (R * R).sum(axis=0)
+        dot = R.T @ r_y
+    norm = np.sqrt(ss_r * (r_y @ r_y))
+    corr = np.divide(dot, norm, out=np.zeros(X.shape[1]), where=norm > 1e-12)
+    dof = max(X.shape[0] - Z.shape[1] - 2, 1)
+    r2 = np.minimum(corr * corr, 1 - 1e-12)
+    return r2 / (1 - r2) * dof
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class CandidateFilter:
+    """Keeps the top candidates of each forward selection step.
+
+    Called as prescreen(selected, candidates, nf) by forward_selection() with
+    column indices of a FeatureMatrix, returns the kept candidates in their
+    original order. classification selects the mutual information estimator
+    and leaves y unresidualized for it. Columns whose most common value fills
+    more than max_mode of the rows are skipped whatever their rank.
+    """
+
+    def __init__(self, matrix, y, top, method='f', classification=False, max_mode=0.95,
+                 log_filename=None, seed=0):
+        if method not in METHODS:
+            raise ValueError('Unknown pre-screening method %r, expected one of %s' % (method, METHODS))
+        self.matrix = matrix
+        self.y = np.asarray(y, dtype=np.float64)
+        self.top = top
+        self.method = method
+        self.classification = classification
+        self.max_mode = max_mode
+        self.log_filename = log_filename
+        self.seed = seed
+        self.sparse = sparse.issparse(matrix.values)
+        if self.sparse:
+            self.modes = mode_fraction(matrix.values)
+        else:
+            self.modes = mode_fraction(matrix.take(list(range(matrix.shape[1]))))
+
+    def scores(self, selected, candidates):
+        """Ranking score of each candidate given the selected columns (larger is better)."""
+        candidates = list(candidates)
+        X = self.matrix.values[:, candidates] if self.sparse else self.matrix.take(candidates)
+        Z = self.matrix.take(list(selected)) if selected else np.empty((X.shape[0], 0))
+        if self.method == 'f':
+            return partial_f(X, self.y, Z)
+        if self.classification:
+            estimator, target = mutual_info_classif, self.y.astype(int)
+        else:
+            estimator, target = mutual_info_regression, residualize(self.y.reshape(-1, 1), Z).ravel()
+        # Dense matrices are chunked too, the estimator's tie breaking noise depends on the chunk
+        return np.concatenate([estimator(residualize(X[:, i:i + MI_CHUNK], Z), target, random_state=self.seed)
+                               for i in range(0, X.shape[1], MI_CHUNK)])
+
+    def __call__(self, selected, candidates, nf):
+        candidates = list(candidates)
+        varied = [j for j in candidates if self.modes[j] <= self.max_mode]
+        constant = [j for j in candidates if self.modes[j] > self.max_mode]
+        scores = dict(zip(varied, self.scores(selected, varied))) if varied else {}
+
+        # Stable ordering so equal scores keep the column order
+        ranked = sorted(varied, key=lambda j: -scores[j])
+        kept = set(ranked[:self.top])
+        if self.log_filename is not None:
+            names = self.matrix.names
+            entry = {'step': nf, 'method': self.method, 'candidates': len(candidates), 'kept': len(kept),
+                     'selected': [names[j] for j in selected],
+                     'kept_features': {names[j]: float(scores[j]) for j in ranked[:self.top]},
+                     'skipped_rank': {names[j]: float(scores[j]) for j in ranked[self.top:]},
+                     'skipped_constant': {names[j]: float(self.modes[j]) for j in constant}}
+            self._log(entry)
+        return [j for j in candidates if j in kept]
+
+    def _log(self, entry):
+        # A resumed run redoes the step it stopped in, drop the records of that step and later
+        lines = []
+        if os.path.exists(self.log_filename):
+            with open(self.log_filename, encoding="utf-8") as f:
+                lines = [line for line in f if line.strip() and json.loads(line)['step'] < entry['step']]
+        lines.append(json.dumps(entry) + '\n')
+        tmp_filename = self.log_filename + '.tmp'
+        with open(tmp_filename, 'w', encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(tmp_filename, self.log_filename)
@@ -0,0 +1,142 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Content addressed on-disk cache of cross validation scores. A grid cell is
+# keyed by a hash of the dataset content, the model/CV description, the feature
+# subset, the PCA count, C, gamma and the CV seed, and stores the scores of its
+# first folds. Repeated CV with a fixed seed draws the same splits for the first
+# repeats whatever the total number of repeats, so a later sweep with more
+# repeats only computes the folds it is missing.
+# The cache is a SQLite file that is evicted least recently used first once it
+# grows beyond its size bound.
+#
+# Usage: python score_cache.py stats|clear <cache.sqlite>
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import sys
+import time
+import hashlib
+import sqlite3
+import numpy as np
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class ScoreCache:
+    """Fold scores of grid cells stored in a SQLite file bounded by max_bytes."""
+
+    def __init__(self, filename, max_bytes=1024 * 2**20):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.partial = 0
+        self.misses = 0
+        self._pending = []
+        self.db = sqlite3.connect(filename)
+        self.db.execute('CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, folds BLOB, '
+                        'nbytes INTEGER, last_used REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS scores_last_used ON scores (last_used)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)')
+        self.db.commit()
+
+    @staticmethod
+    def key(*parts):
+        h = hashlib.sha1()
+        for part in parts:
+            h.update(repr(part).encode())
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: fold scores} for the keys present in the cache."""
+        found = {}
+        unique = list(set(keys))
+        now = time.time()
+        for i in range(0, len(unique), 500):
+            chunk = unique[i:i + 500]
+            rows = self.db.execute('SELECT key, folds FROM scores WHERE key IN (%s)' % ','.join('?' * len(chunk)),
+                                   chunk).fetchall()
+            for key, folds in rows:
+                found[key] = np.frombuffer(folds, dtype=np.float64)
+            self.db.executemany('UPDATE scores SET last_used = ? WHERE key = ?', [(now, k) for k, _ in rows])
+        return found
+
+    def put(self, key, folds):
+        """Queue the fold scores of a cell, written on flush()."""
+        self._pending.append((key, np.asarray(folds, dtype=np.float64).tobytes()))
+
+    def record(self, hits=0, partial=0, misses=0):
+        self.hits += hits
+        self.partial += partial
+        self.misses += misses
+        for name, value in (('hits', hits), ('partial', partial), ('misses', misses)):
+            self.db.execute('INSERT INTO stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?',
+                            (name, value, value))
+
+    def flush(self):
+        now = time.time()
+        self.db.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)',
+                            [(k, v, len(v), now) for k, v in self._pending])
+        self._pending = []
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(nbytes), 0) FROM scores').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the cache is back to 90% of its bound
+        excess = total - int(0.9 * self.max_bytes)
+        dropped = 0
+        rows = self.db.execute('SELECT key, nbytes FROM scores ORDER BY last_used').fetchall()
+        victims = []
+        for key, nbytes in rows:
+            if dropped >= excess:
+                break
+            victims.append((key,))
+            dropped += nbytes
+        self.db.executemany('DELETE FROM scores WHERE key = ?', victims)
+
+    def stats(self):
+        entries, nbytes = self.db.execute('SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM scores').fetchone()
+        totals = dict(self.db.execute('SELECT name, value FROM stats').fetchall())
+        return {'entries': entries, 'bytes': nbytes, 'max_bytes': self.max_bytes,
+                'hits': totals.get('hits', 0), 'partial': totals.get('partial', 0),
+                'misses': totals.get('misses', 0)}
+
+    def clear(self):
+        self.db.execute('DELETE FROM scores')
+        self.db.execute('DELETE FROM stats')
+        self.db.commit()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
+
+    if len(sys.argv) != 3 or sys.argv[1] not in ('stats', 'clear'):
+        print('Usage: python score_cache.py stats|clear <cache.sqlite>')
+        sys.exit(1)
+
+    cache = ScoreCache(sys.argv[2])
+    if sys.argv[1] == 'clear':
+        cache.clear()
+        print('Cleared ' + sys.argv[2])
+        return
+
+    s = cache.stats()
+    lookups = s['hits'] + s['partial'] + s['misses']
+    print('Entries:  %d' % s['entries'])
+    print('Size:     %.1f MB' % (s['bytes'] / 2**20))
+    print('Lookups:  %d' % lookups)
+    print('Hits:     %d (%.1f%%)' % (s['hits'], 100.0 * s['hits'] / max(lookups, 1)))
+    print('Partial:  %d (%.1f%%)' % (s['partial'], 100.0 * s['partial'] / max(lookups, 1)))
+    print('Misses:   %d (%.1f%%)' % (s['misses'], 100.0 * s['misses'] / max(lookups, 1)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Single pass screening of a peptide file with both the MBIC and the MBEC model.
+# Each chunk of the screening file is parsed once, with only the union of the
+# columns the three models need, and goes through the SVM -> SVR MBIC cascade
+# and the MBEC SVR in memory. One CSV holds the joined results: the SVM class,
+# the predicted MBIC of the peptides classified <= the MBIC threshold the models
+# were fitted with (64uM by default) and the predicted MBEC.
+#
+# With --workers the file is split into line-aligned shards scored by a pool
+# of processes. With --top-k only the best k peptides by --rank-by are kept:
+# each worker holds a bounded heap of its best hits and the heaps are merged
+# into the exact overall top k, so memory is bounded by k. With --sparse the
+# descriptors of each chunk are held as a CSR matrix. With --trace the stage
+# timings of every worker are collected into one JSON trace (see timing.py).
+#
+# The fitted models are the artifacts saved by mbic_test_predictions.py and
+# mbec_test.py, run those once to create them.
+#
+# Usage: python screen.py [<screening.csv> [<output.csv>]] [--workers N]
+#                         [--top-k K] [--rank-by 'Decision Fn'|'Predicted MBIC'|'Predicted MBEC'] [--sparse]
+#                         [--trace trace.json]
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import os
+import shutil
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+from model_artifact import ModelArtifact
+from batch_predict import CSVAppender, TopK, read_shard, shard_ranges
+from sparse_features import SparseDescriptors
+from timing import tracer
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+test_filename = '../data/test_peptide_data.csv'
+pred_filename = './screening_predictions.csv'
+svm_artifact_path = 'mbic/mbic_svm_model'
+svr_artifact_path = 'mbic/mbic_svr_model'
+mbec_artifact_path = 'mbec/mbec_model'
+chunk_size = 50000  # Peptides scored at a time
+num_workers = 1
+shards_per_worker = 4
+
+DEFAULT_THRESHOLD = 64  # MBIC threshold of artifacts saved without one
+# Ranking keys and whether larger values rank first
+RANK_KEYS = {'Decision Fn': True, 'Predicted MBIC': False, 'Predicted MBEC': False}
+
+_worker_state = {}
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def _init_worker(screener, trace=False):
+    _worker_state['screener'] = screener
+    tracer.reset()
+    tracer.enable(trace)
+
+
+def _screen_shard(task):
+    """Score one shard, returning (peptides, peptides <= threshold, top k heap, trace).
+
+    Without a top k the results are written to part_filename.
+    """
+    shard, filename, start, end, part_filename, top_k, rank_by, sparse_input = task
+    screener = _worker_state['screener']
+    top = TopK(top_k, rank_by, largest=RANK_KEYS[rank_by]) if top_k else None
+    out = None if top else CSVAppender(part_filename, screener.result_columns)
+    rows = lower = 0
+    for chunk in read_shard(filename, screener.columns, start, end, chunk_size):
+        if sparse_input:
+            with tracer.span('select'):
+                chunk = SparseDescriptors.from_dataframe(chunk, ['Name', 'Decision Fn'])
+        results = screener.score(chunk)
+        if top:
+            # Shard position first so ties go to the peptide earliest in the file
+            top.push(results, order=(shard << 40) + rows)
+        else:
+            out.write(results)
+        rows += len(results)
+        lower += int(results[screener.lower_column].sum())
+    return rows, lower, top.heap if top else None, tracer.drain() if tracer.enabled else None
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class Screener:
+    """The MBIC cascade and the MBEC regressor applied to the same peptides."""
+
+    def __init__(self, svm_model, svr_model, mbec_model):
+        self.svm_model = svm_model
+        self.svr_model = svr_model
+        self.mbec_model = mbec_model
+        models = (svm_model, svr_model, mbec_model)
+        self.feature_names = list(dict.fromkeys(f for m in models for f in m.feature_names))
+        self._index = [[self.feature_names.index(f) for f in m.feature_names] for m in models]
+        self.threshold = svm_model.params.get('threshold', DEFAULT_THRESHOLD)
+        self.lower_column = 'MBIC <= %s' % self.threshold
+        self.result_columns = ['Name', 'Decision Fn', self.lower_column, 'Predicted MBIC', 'Predicted MBEC']
+
+    @classmethod
+    def load(cls, svm_path, svr_path, mbec_path):
+        for path, script in ((svm_path, 'mbic/mbic_test_predictions.py'),
+                             (svr_path, 'mbic/mbic_test_predictions.py'),
+                             (mbec_path, 'mbec/mbec_test.py')):
+            if not os.path.exists(path):
+                raise FileNotFoundError('No model at %s, run %s to fit it' % (path, script))
+        return cls(ModelArtifact.load(svm_path), ModelArtifact.load(svr_path), ModelArtifact.load(mbec_path))
+
+    @property
+    def columns(self):
+        """Input columns read from the screening file."""
+        return ['Name', 'Decision Fn'] + self.feature_names
+
+    def score(self, chunk):
+        """Joined MBIC and MBEC predictions of a chunk of peptides (DataFrame or SparseDescriptors)."""
+        with tracer.span('select'):
+            if isinstance(chunk, SparseDescriptors):
+                X = chunk.select(self.feature_names)
+            else:
+                X = chunk[self.feature_names].to_numpy(dtype=np.float64)
+        svm_index, svr_index, mbec_index = self._index
+
+        # SVM -> SVR cascade, the MBIC is only predicted for peptides classified <= threshold
+        classes = self.svm_model.predict(X[:, svm_index])
+        lower = classes == 1
+        mbic = np.full(X.shape[0], np.nan)
+        mbic[lower] = self.svr_model.predict(X[lower][:, svr_index])
+
+        return pd.DataFrame({'Name': chunk['Name'].to_numpy(),
+                             'Decision Fn': chunk['Decision Fn'].to_numpy(),
+                             self.lower_column: classes.astype(int),
+                             'Predicted MBIC': mbic,
+                             'Predicted MBEC': self.mbec_model.predict(X[:, mbec_index])})
+
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(description='Screen peptides with the MBIC and MBEC models')
+    parser.add_argument('input', nargs='?', default=test_filename)
+    parser.add_argument('output', nargs='?', default=pred_filename)
+    parser.add_argument('--workers', type=int, default=num_workers)
+    parser.add_argument('--top-k', type=int, default=None, help='Only keep the best k peptides')
+    parser.add_argument('--rank-by', default='Decision Fn', choices=sorted(RANK_KEYS))
+    parser.add_argument('--sparse', action='store_true', help='Hold the descriptors of each chunk as a CSR matrix')
+    parser.add_argument('--trace', default=None, help='Write the stage timings to this JSON file')
+    args = parser.parse_args()
+
+    tracer.enable(args.trace is not None)
+
+    screener = Screener.load(svm_artifact_path, svr_artifact_path, mbec_artifact_path)
+
+    # Shards are scored in file order, each writes a part file or returns its top k heap
+    workers = max(1, args.workers)
+    shards = shard_ranges(args.input, workers * shards_per_worker if workers > 1 else 1)
+    tasks = [(i, args.input, start, end, '%s.part%d' % (args.output, i), args.top_k, args.rank_by, args.sparse)
+             for i, (start, end) in enumerate(shards)]
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(screener, tracer.enabled)) as pool:
+            results = pool.map(_screen_shard, tasks, chunksize=1)
+    else:
+        _worker_state['screener'] = screener
+        results = [_screen_shard(task) for task in tasks]
+    for result in results:
+        if result[3] is not None:
+            tracer.merge(result[3])
+
+    if args.top_k:
+        best = TopK.merge([result[2] for result in results], args.top_k, screener.result_columns)
+        best.to_csv(args.output, index=False)
+    else:
+        CSVAppender(args.output, screener.result_columns)
+        with open(args.output, 'ab') as out:
+            for task in tasks:
+                with open(task[4], 'rb') as part:
+                    part.readline()
+                    shutil.copyfileobj(part, out)
+                os.remove(task[4])
+
+    print('Screened Peptides: ', sum(r[0] for r in results))
+    print('Predicted %s: ' % screener.lower_column, sum(r[1] for r in results))
+    if args.top_k:
+        print('Top %d by %s written to %s' % (args.top_k, args.rank_by, args.output))
+    tracer.report(args.trace, script='screen.py', input=args.input, workers=workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Model-based alternatives to the exhaustive C x gamma x PCA grid of the
+# forward selection sweeps. A strategy searches the cells of the same grid
+# with a fixed budget of cells per candidate feature subset, so its scores are
+# directly comparable with (and cached like) those of the exhaustive sweep.
+#
+#   coarse   a coarse lattice of the grid, then a compass search around the best
+#            cell whose step is halved whenever no neighbour improves on it
+#   bayes    a space-filling start, then batches of the cells with the largest
+#            expected improvement under a Gaussian process over log C, log gamma
+#            and the PCA count
+#
+# Strategies are driven by ask() / tell() so the sweep can evaluate the cells
+# proposed for all candidates of a step in one parallel batch.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import warnings
+import itertools
+import numpy as np
+from scipy.stats import norm
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class GridSearchStrategy:
+    """Search state over the cells of a grid given by its axes (PCA counts, C, gamma).
+
+    A cell is a tuple of indices into the axes. Subclasses implement
+    _propose(left), the next cells to evaluate given the cells left in the
+    budget.
+    """
+
+    def __init__(self, axes, maximize, budget=32, seed=0):
+        self.axes = [list(axis) for axis in axes]
+        self.shape = tuple(len(axis) for axis in self.axes)
+        self.maximize = maximize
+        self.budget = budget
+        self.seed = seed
+        self.scores = {}
+        self.best_cell = None
+
+    def value(self, cell):
+        """Axis values (n, c, g) of a cell."""
+        return tuple(axis[i] for axis, i in zip(self.axes, cell))
+
+    @property
+    def best_score(self):
+        return self.scores[self.best_cell]
+
+    def _better(self, a, b):
+        return a > b if self.maximize else a < b
+
+    def ask(self):
+        """Cells to evaluate next, none once the budget is spent or the search converged."""
+        left = min(self.budget, int(np.prod(self.shape))) - len(self.scores)
+        if left <= 0:
+            return []
+        return [cell for cell in self._propose(left) if cell not in self.scores][:left]
+
+    def tell(self, cells, scores):
+        for cell, score in zip(cells, scores):
+            self.scores[cell] = float(score)
+            if self.best_cell is None or self._better(float(score), self.best_score):
+                self.best_cell = cell
+
+
+class CoarseToFine(GridSearchStrategy):
+    """Coarse lattice, then a compass search refining around the best cell."""
+
+    def __init__(self, axes, maximize, budget=32, seed=0, points=(2, 3, 3)):
+        super().__init__(axes, maximize, budget, seed)
+        self.lattice = [np.unique(np.round(np.linspace(0, m - 1, min(p, m))).astype(int))
+                        for m, p in zip(self.shape, points)]
+        # First step half the lattice spacing along each axis
+        self.step = [max(1, (m - 1) // max(len(l) - 1, 1) // 2) if m > 1 else 0
+                     for m, l in zip(self.shape, self.lattice)]
+        self.center = None
+
+    def _neighbours(self):
+        cells = []
+        for axis, h in enumerate(self.step):
+            for sign in (-h, h):
+                cell = list(self.center)
+                cell[axis] += sign
+                if h and 0 <= cell[axis] < self.shape[axis]:
+                    cells.append(tuple(cell))
+        return [cell for cell in cells if cell not in self.scores]
+
+    def _propose(self, left):
+        if self.center is None and not self.scores:
+            return [tuple(int(i) for i in cell) for cell in itertools.product(*self.lattice)]
+        # The center moves to the best cell, the step shrinks while no neighbour beats it
+        if self.center == self.best_cell:
+            self.step = [h // 2 for h in self.step]
+        self.center = self.best_cell
+        while any(self.step):
+            cells = self._neighbours()
+            if cells:
+                return cells
+            self.step = [h // 2 for h in self.step]
+        return []
+
+
+class BayesianSearch(GridSearchStrategy):
+    """Gaussian process expected improvement over the grid cells.
+
+    Cells are placed in the unit cube by log10 C, log10 gamma and the PCA
+    count. The first `initial` cells are spread out by a maximin design, each
+    later round proposes `batch` cells, the best by expected improvement with
+    the predicted score of each proposal taken as observed for the next one.
+    """
+
+    def __init__(self, axes, maximize, budget=32, seed=0, initial=8, batch=4):
+        super().__init__(axes, maximize, budget, seed)
+        self.initial = initial
+        self.batch = batch
+        self.cells = list(itertools.product(*[range(m) for m in self.shape]))
+        coords = [np.asarray(self.axes[0], dtype=np.float64),
+                  np.log10(np.asarray(self.axes[1], dtype=np.float64)),
+                  np.log10(np.asarray(self.axes[2], dtype=np.float64))]
+        coords = [(c - c.min()) / (c.max() - c.min()) if c.max() > c.min() else np.zeros_like(c) for c in coords]
+        self.X = np.array([[coords[a][i] for a, i in enumerate(cell)] for cell in self.cells])
+        self.position = {cell: p for p, cell in enumerate(self.cells)}
+
+    def _maximin(self, k):
+        """k cells, the one nearest the centre of the cube and then each farthest from those chosen."""
+        chosen = [int(np.argmin(((self.X - 0.5) ** 2).sum(axis=1)))]
+        distance = ((self.X - self.X[chosen[0]]) ** 2).sum(axis=1)
+        while len(chosen) < min(k, len(self.cells)):
+            chosen.append(int(np.argmax(distance)))
+            distance = np.minimum(distance, ((self.X - self.X[chosen[-1]]) ** 2).sum(axis=1))
+        return [self.cells[p] for p in chosen]
+
+    def _fit(self, X, y, kernel=None):
+        """GP fitted to (X, y), with the hyperparameters of kernel kept fixed when given."""
+        if kernel is None:
+            kernel = (ConstantKernel(1.0) * Matern(length_scale=[0.3] * X.shape[1], length_scale_bounds=(1e-2, 10.0),
+                                                   nu=2.5)
+                      + WhiteKernel(1e-3, (1e-8, 1e-1)))
+            optimizer = 'fmin_l_bfgs_b'
+        else:
+            optimizer = None
+        gp = GaussianProcessRegressor(kernel=kernel, optimizer=optimizer, normalize_y=True, random_state=self.seed)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return gp.fit(X, y)
+
+    def _propose(self, left):
+        if len(self.scores) < self.initial:
+            return self._maximin(self.initial)
+        evaluated = list(self.scores)
+        X = self.X[[self.position[cell] for cell in evaluated]]
+        sign = 1.0 if self.maximize else -1.0
+        y = sign * np.array([self.scores[cell] for cell in evaluated])
+        gp = self._fit(X, y)
+        open_cells = np.array([p for p, cell in enumerate(self.cells) if cell not in self.scores])
+
+        proposals = []
+        for _ in range(min(self.batch, left, len(open_cells))):
+            mu, sd = gp.predict(self.X[open_cells], return_std=True)
+            gain = mu - y.max()
+            z = gain / np.maximum(sd, 1e-12)
+            ei = np.where(sd > 1e-12, gain * norm.cdf(z) + sd * norm.pdf(z), np.maximum(gain, 0))
+            p = open_cells[int(np.argmax(ei))]
+            proposals.append(self.cells[p])
+            # Kriging believer: the proposal counts as observed at its predicted score
+            X = np.vstack([X, self.X[p]])
+            y = np.append(y, mu[int(np.argmax(ei))])
+            open_cells = open_cells[open_cells != p]
+            gp = self._fit(X, y, gp.kernel_)
+        return proposals
+
+
+SEARCH_STRATEGIES = {'coarse': CoarseToFine, 'bayes': BayesianSearch}
@@ -0,0 +1,147 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Sparse (CSR) storage of the descriptor matrix. Most descriptor columns of
+# short peptides are zero, the 400 dipeptide frequencies above all, so the
+# matrix is kept as a scipy CSR matrix with its column names and the
+# non-descriptor columns (Name, Seq, ...) alongside. Files are converted chunk
+# by chunk, so only chunk_size rows are ever dense while loading, and feature
+# subsets are taken column-wise from the CSR matrix without densifying it.
+#
+# Usage: python sparse_features.py <descriptors.csv> [id columns ...]   (prints the sizes)
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import sys
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from batch_predict import csv_columns, read_columns
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class SparseDescriptors:
+    """CSR descriptor matrix with named columns and per-row id columns.
+
+    ids is a DataFrame with the non-descriptor columns of the rows, read by
+    name with descriptors['Name'] like a DataFrame column.
+    """
+
+    def __init__(self, values, names, ids=None):
+        self.values = sparse.csr_matrix(values, dtype=np.float64)
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        if self.values.shape[1] != len(self.names):
+            raise ValueError('Expected %d feature names, got %d' % (self.values.shape[1], len(self.names)))
+        self.ids = ids.reset_index(drop=True) if ids is not None else pd.DataFrame(index=range(self.values.shape[0]))
+        if len(self.ids) != self.values.shape[0]:
+            raise ValueError('Expected %d id rows, got %d' % (self.values.shape[0], len(self.ids)))
+
+    @classmethod
+    def from_dataframe(cls, df, id_columns=()):
+        """Descriptors of the columns of df not listed in id_columns."""
+        id_columns = list(id_columns)
+        features = df.drop(columns=id_columns)
+        return cls(sparse.csr_matrix(features.to_numpy(dtype=np.float64)), features.columns, df[id_columns])
+
+    @classmethod
+    def iter_csv(cls, filename, id_columns=(), columns=None, chunk_size=50000):
+        """Yield the descriptors of a CSV chunk_size rows at a time.
+
+        columns are the descriptor columns to read, all the columns that are
+        not id columns by default.
+        """
+        id_columns = list(id_columns)
+        if columns is None:
+            columns = [c for c in csv_columns(filename) if c not in id_columns]
+        for chunk in read_columns(filename, id_columns + list(columns), chunk_size):
+            yield cls.from_dataframe(chunk, id_columns)
+
+    @classmethod
+    def read_csv(cls, filename, id_columns=(), columns=None, chunk_size=50000):
+        """Descriptors of a whole CSV, converted chunk_size rows at a time."""
+        parts = list(cls.iter_csv(filename, id_columns, columns, chunk_size))
+        if not parts:
+            names = columns if columns is not None else [c for c in csv_columns(filename) if c not in id_columns]
+            return cls(sparse.csr_matrix((0, len(names))), names, pd.DataFrame(columns=list(id_columns)))
+        return cls.concat(parts)
+
+    @staticmethod
+    def concat(parts):
+        """Rows of several descriptor sets with the same columns, in order."""
+        names = parts[0].names
+        for part in parts[1:]:
+            if part.names != names:
+                raise ValueError('Descriptor sets have different columns')
+        return SparseDescriptors(sparse.vstack([p.values for p in parts], format='csr'), names,
+                                 pd.concat([p.ids for p in parts], ignore_index=True))
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __getitem__(self, column):
+        return self.ids[column]
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        """Bytes held by the CSR arrays."""
+        v = self.values
+        return v.data.nbytes + v.indices.nbytes + v.indptr.nbytes
+
+    @property
+    def density(self):
+        n, m = self.values.shape
+        return self.values.nnz / float(n * m) if n * m else 0.0
+
+    def check_schema(self, names):
+        """Raise a ValueError unless every one of names is a descriptor column."""
+        missing = [name for name in names if name not in self.index]
+        if missing:
+            raise ValueError('Input is missing %d feature(s): %s' % (len(missing), ', '.join(missing)))
+
+    def select(self, names):
+        """CSR sub-matrix of the named columns, in the order given."""
+        self.check_schema(names)
+        return self.values[:, [self.index[name] for name in names]]
+
+    def take(self, rows):
+        """Descriptors of a subset of the rows (indices or a boolean mask)."""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return SparseDescriptors(self.values[rows], self.names, self.ids.iloc[rows])
+
+    def to_dataframe(self, names=None):
+        """Dense DataFrame of the id columns and the named descriptor columns (all by default)."""
+        names = self.names if names is None else list(names)
+        dense = pd.DataFrame(self.select(names).toarray(), columns=names)
+        return pd.concat([self.ids, dense], axis=1)
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def scale_columns(X, scale):
+    """Sparse X with each column multiplied by scale, zeros stay zeros."""
+    return sparse.csr_matrix(X) @ sparse.diags(np.asarray(scale, dtype=np.float64))
+
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
+
+    if len(sys.argv) < 2:
+        print('Usage: python sparse_features.py <descriptors.csv> [id columns ...]')
+        sys.exit(1)
+
+    descriptors = SparseDescriptors.read_csv(sys.argv[1], id_columns=sys.argv[2:])
+    n, m = descriptors.shape
+    print('Rows: %d  Descriptors: %d  Density: %.3f' % (n, m, descriptors.density))
+    print('Dense float64: %.1f MB  CSR: %.1f MB' % (n * m * 8 / 2**20, descriptors.nbytes / 2**20))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Parallel hyperparameter sweep used by the forward selection training scripts.
+# Every (candidate feature, PCA n, C, gamma) cell is a work unit that is spread
+# over a process pool. Cross validation splits are seeded per unit, so a sweep
+# returns the same scores whatever the number of workers.
+#
+# With a ScoreCache, cells already scored by an earlier sweep over the same data
+# and settings are read back instead of refit.
+#
+# In racing mode the cells of a candidate are cross validated a few repeats at
+# a time and cells whose running mean is significantly worse than the current
+# best cell of the candidate are dropped before running the remaining repeats.
+#
+# With search='coarse' or 'bayes' the cells of a candidate are not all scored,
+# a strategy from search.py picks search_budget of them (see search.py).
+#
+# With a queue_filename the units are not computed here but enqueued in a
+# shared work queue and scored by workers on any number of machines, see
+# work_queue.py.
+#
+# The progress line shows the share of the run done and its ETA in grid cells,
+# see forward_selection(). With the tracer enabled (timing.py) the workers
+# record their stage spans and hand them back with each result.
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import os
+import sys
+import inspect
+import multiprocessing
+import numpy as np
+from threadpoolctl import threadpool_limits
+from kernel_cache import array_key
+from timing import Progress, tracer
+from search import SEARCH_STRATEGIES
+from work_queue import WorkQueue
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+BLAS_THREAD_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                    'BLIS_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+CACHE_FLUSH_UNITS = 256     # Computed cells written to the score cache at a time
+
+_worker_state = {}
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def limit_blas_threads():
+    """Pin BLAS/OpenMP to one thread so N workers use N cores, not N * cores."""
+    for var in BLAS_THREAD_VARS:
+        os.environ[var] = '1'
+    threadpool_limits(limits=1)
+
+
+def _init_worker(score_folds, matrix, y, trace=False):
+    limit_blas_threads()
+    # A forked worker starts with a copy of the parent's spans
+    tracer.reset()
+    tracer.enable(trace)
+    _worker_state['score_folds'] = score_folds
+    _worker_state['matrix'] = matrix
+    _worker_state['y'] = y
+
+
+def _run_unit(unit):
+    cols, n, c, g, seed, folds = unit
+    with tracer.span('select'):
+        X = _worker_state['matrix'].take(list(cols))
+    scores = _worker_state['score_folds'](X, _worker_state['y'], n, c, g, seed, folds)
+    return scores, tracer.drain() if tracer.enabled else None
+
+
+def race_schedule(n_repeats, first=2):
+    """Repeat counts after which cells are compared: 2, 4, 8, ... n_repeats."""
+    schedule = []
+    r = max(1, first)
+    while r < n_repeats:
+        schedule.append(r)
+        r *= 2
+    return schedule + [n_repeats]
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class SweepExecutor:
+    """Runs the C x gamma x PCA grid for forward selection candidates.
+
+    score_folds(X, y, n, c, g, seed, folds) returns the scores of folds
+    [start, stop) of the repeated cross validation of one grid cell, where seed
+    fixes the fold splits. With workers=1 the units run in this process,
+    otherwise over a pool of worker processes which each receive the matrix
+    and response once.
+
+    score_cache is an optional ScoreCache and cache_tag a description of the
+    model and CV scheme behind score_folds; both are part of the cache key
+    together with the data content.
+
+    With race=True cells are raced as described above; race_z is the number
+    of standard errors a cell has to trail the best cell by to be dropped.
+    With race_check=True every step is also run exhaustively and the report
+    records whether racing selected the same candidate and cell.
+
+    search is 'grid' (every cell) or a strategy of search.py that scores
+    search_budget cells per candidate. With search_check=True every step is
+    also run exhaustively and search_report_filename records the best score
+    found next to the exhaustive one.
+
+    With a queue_filename the executor coordinates a distributed sweep: it
+    registers the matrix, y and the script defining score_folds as a job of
+    the WorkQueue in that file and waits, polling every queue_poll seconds,
+    for workers (python work_queue.py worker) to score the units it enqueues.
+    """
+
+    def __init__(self, score_folds, matrix, y, C, gamma, maximize, cv_seed=0, workers=1,
+                 n_splits=5, n_repeats=20, race=False, race_z=3.0, race_check=False,
+                 report_filename=None, score_cache=None, cache_tag='', chunksize=None,
+                 search='grid', search_budget=32, search_check=False, search_report_filename=None,
+                 queue_filename=None, queue_poll=1.0):
+        if search != 'grid' and search not in SEARCH_STRATEGIES:
+            raise ValueError('Unknown search %r, expected grid or one of %s' % (search, sorted(SEARCH_STRATEGIES)))
+        if search != 'grid' and race:
+            raise ValueError('Racing only applies to the exhaustive grid, set race=False to search')
+        self.score_folds = score_folds
+        self.matrix = matrix
+        self.y = y
+        self.C = C
+        self.gamma = gamma
+        self.maximize = maximize
+        self.cv_seed = cv_seed
+        self.n_splits = n_splits
+        self.n_repeats = n_repeats
+        self.race = race
+        self.race_z = race_z
+        self.race_check = race_check
+        self.report_filename = report_filename
+        self.search = search
+        self.search_budget = search_budget
+        self.search_check = search_check
+        self.search_report_filename = search_report_filename
+        self.workers = max(1, workers or 1)
+        # Whole C x gamma blocks go to one worker so they share its Gram cache
+        self.chunksize = chunksize or len(C) * len(gamma)
+        self.score_cache = score_cache
+        self.cache_tag = cache_tag
+        self.data_key = None
+        if score_cache is not None:
+            self.data_key = array_key(matrix.values, np.asarray(y), repr(matrix.names))
+        self.best_cells = []
+        self.fits = 0           # Folds fitted, those read from the score cache excluded
+        self.progress = Progress()
+        self.pool = None
+        self.queue = None
+        self.queue_poll = queue_poll
+        if queue_filename is not None:
+            # Workers load the script defining score_folds and use the same CV settings
+            self.queue = WorkQueue(queue_filename)
+            self.job = self.queue.add_job(inspect.getfile(score_folds), score_folds.__name__, matrix, y,
+                                          {'n_splits': n_splits, 'n_repeats': n_repeats})
+        elif self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                             initargs=(score_folds, matrix, y, tracer.enabled))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.queue is not None:
+            self.queue.close()
+            self.queue = None
+
+    def grid(self, cols):
+        """Grid cells (n, c, g) of one feature subset: every PCA n, C and gamma."""
+        max_n = min(len(cols), self.matrix.shape[0])
+        return [(n, c, g) for n in range(1, max_n + 1) for c in self.C for g in self.gamma]
+
+    def candidate_cells(self, n_features):
+        """Grid cells scored for a candidate subset of n_features features, the work unit of the progress."""
+        cells = len(self.grid(range(n_features)))
+        return cells if self.search == 'grid' else min(cells, self.search_budget)
+
+    def _compute(self, units):
+        """Count the folds of the units as fits run and return a generator of their fold scores."""
+        for unit in units:
+            tracer.count('cells computed')
+            tracer.count('fits', unit[5][1] - unit[5][0])
+            self.fits += unit[5][1] - unit[5][0]
+        return self._scores(units)
+
+    def _scores(self, units):
+        if self.queue is not None:
+            yield from self.queue.wait(self.queue.submit(self.job, units), self.queue_poll)
+        elif self.pool is None:
+            for cols, n, c, g, seed, folds in units:
+                with tracer.span('select'):
+                    X = self.matrix.take(list(cols))
+                yield self.score_folds(X, self.y, n, c, g, seed, folds)
+        else:
+            for scores, trace in self.pool.imap(_run_unit, units, chunksize=self.chunksize):
+                if trace is not None:
+                    tracer.merge(trace)
+                yield scores
+
+    def _cache_key(self, unit):
+        cols, n, c, g, seed, _ = unit
+        return self.score_cache.key(self.data_key, self.cache_tag,
+                                    [self.matrix.names[j] for j in cols], n, c, g, seed)
+
+    def map(self, units):
+        """Yield the fold scores of each (cols, n, c, g, seed, folds) unit, in order."""
+        if self.score_cache is None:
+            yield from self._compute(units)
+            return
+
+        # Only the folds missing from the cache are computed
+        keys = [self._cache_key(unit) for unit in units]
+        cached = self.score_cache.get_many(keys)
+        plan = []
+        todo = []
+        hits = partial = 0
+        for unit, key in zip(units, keys):
+            start, stop = unit[5]
+            stored = cached.get(key, np.empty(0))
+            if len(stored) >= stop:
+                plan.append((key, stored, False))
+                hits += 1
+            else:
+                # Folds are stored as a prefix, so the computation resumes after the stored ones
+                todo.append(unit[:5] + ((len(stored), stop),))
+                plan.append((key, stored, True))
+                partial += len(stored) > 0
+        self.score_cache.record(hits=hits, partial=partial, misses=len(units) - hits - partial)
+        self.score_cache.flush()
+
+        # Callers zip the units with this generator and never resume it after the
+        # last unit, so the scores are written before each batch's yield
+        computed = self._compute(todo)
+        unflushed = 0
+        for i, (unit, (key, stored, missing)) in enumerate(zip(units, plan)):
+            start, stop = unit[5]
+            if missing:
+                stored = np.concatenate((stored, np.asarray(next(computed), dtype=np.float64)))
+                self.score_cache.put(key, stored)
+                unflushed += 1
+            if unflushed and (unflushed >= CACHE_FLUSH_UNITS or i == len(units) - 1):
+                self.score_cache.flush()
+                unflushed = 0
+            yield stored[start:stop]
+
+    def _progress(self, nf, unit, cells=1.0):
+        self.progress.add(cells)
+        sys.stdout.write('Feature Loop: %s Feat num: %s PCA comp: %s c: %s %s \r'
+                         % (nf, unit[0][-1], unit[1], unit[2], self.progress.format()))
+        sys.stdout.flush()
+
+    def _exhaustive(self, subsets, nf):
+        folds = (0, self.n_splits * self.n_repeats)
+        units = []
+        owner = []
+        for k, cols in enumerate(subsets):
+            for n, c, g in self.grid(cols):
+                units.append((tuple(cols), n, c, g, self.cv_seed, folds))
+                owner.append(k)
+
+        best = np.full(len(subsets), -np.inf if self.maximize else np.inf)
+        best_cells = [None] * len(subsets)
+        better = np.greater if self.maximize else np.less
+        for k, unit, scores in zip(owner, units, self.map(units)):
+            self._progress(nf, unit)
+            score = np.mean(scores)
+            if better(score, best[k]):
+                best[k] = score
+                best_cells[k] = unit[1:4]
+        return best, best_cells
+
+    def _race(self, subsets, nf):
+        ns = self.n_splits
+        grids = [self.grid(cols) for cols in subsets]
+        repeat_means = [[[] for _ in grid] for grid in grids]
+        alive = [list(range(len(grid))) for grid in grids]
+        fits = self.fits
+        done = 0
+
+        for stop in race_schedule(self.n_repeats):
+            units = []
+            owner = []
+            for k, cols in enumerate(subsets):
+                for i in alive[k]:
+                    n, c, g = grids[k][i]
+                    units.append((tuple(cols), n, c, g, self.cv_seed, (done * ns, stop * ns)))
+                    owner.append((k, i))
+            for (k, i), unit, scores in zip(owner, units, self.map(units)):
+                # A cell counts for the share of the repeats it ran
+                self._progress(nf, unit, (stop - done) / self.n_repeats)
+                repeat_means[k][i].extend(np.mean(np.reshape(scores, (-1, ns)), axis=1))
+            done = stop
+            if done == self.n_repeats:
+                break
+
+            # Paired comparison of each cell with the best cell on the same repeats
+            sign = 1.0 if self.maximize else -1.0
+            for k in range(len(subsets)):
+                means = np.array([repeat_means[k][i] for i in alive[k]]) * sign
+                diff = means - means[np.argmax(means.mean(axis=1))]
+                se = diff.std(axis=1, ddof=1) / np.sqrt(done)
+                keep = diff.mean(axis=1) + self.race_z * se >= 0
+                alive[k] = [i for i, ok in zip(alive[k], keep) if ok]
+
+        best = np.empty(len(subsets))
+        best_cells = []
+        for k in range(len(subsets)):
+            full = np.array([np.mean(repeat_means[k][i]) for i in alive[k]])
+            j = np.argmax(full) if self.maximize else np.argmin(full)
+            best[k] = full[j]
+            best_cells.append(grids[k][alive[k][j]])
+        return best, best_cells, self.fits - fits
+
+    def _search(self, subsets, nf):
+        folds = (0, self.n_splits * self.n_repeats)
+        strategy = SEARCH_STRATEGIES[self.search]
+        searches = []
+        for cols in subsets:
+            ns = range(1, min(len(cols), self.matrix.shape[0]) + 1)
+            searches.append(strategy((ns, self.C, self.gamma), self.maximize, self.search_budget, seed=self.cv_seed))
+
+        # Each round scores the cells every unfinished search asks for in one batch
+        fits = self.fits
+        while True:
+            units = []
+            owner = []
+            for k, (cols, search) in enumerate(zip(subsets, searches)):
+                for cell in search.ask():
+                    n, c, g = search.value(cell)
+                    units.append((tuple(cols), n, c, g, self.cv_seed, folds))
+                    owner.append((k, cell))
+            if not units:
+                break
+            told = [([], []) for _ in subsets]
+            for (k, cell), unit, scores in zip(owner, units, self.map(units)):
+                self._progress(nf, unit)
+                told[k][0].append(cell)
+                told[k][1].append(np.mean(scores))
+            for search, (cells, scores) in zip(searches, told):
+                search.tell(cells, scores)
+
+        best = np.array([search.best_score for search in searches])
+        return best, [search.value(search.best_cell) for search in searches], self.fits - fits
+
+    def score_candidates(self, subsets, nf):
+        """Best grid score of every candidate subset at selection step nf.
+
+        The best (n, c, g) cell of each candidate is kept in best_cells.
+        """
+        # Without a plan from forward_selection() the progress covers this call
+        cells = sum(self.candidate_cells(len(cols)) for cols in subsets)
+        self.progress.total = max(self.progress.total, self.progress.done + cells)
+        if not self.race and self.search == 'grid':
+            best, self.best_cells = self._exhaustive(subsets, nf)
+            return best
+
+        if self.race:
+            best, self.best_cells, fits = self._race(subsets, nf)
+            label, check, report_filename = 'Racing', self.race_check, self.report_filename
+        else:
+            best, self.best_cells, fits = self._search(subsets, nf)
+            label, check, report_filename = 'Search', self.search_check, self.search_report_filename
+        exhaustive_fits = sum(len(self.grid(cols)) for cols in subsets) * self.n_repeats * self.n_splits
+        pick = np.argmax if self.maximize else np.argmin
+        winner = pick(best)
+        line = '%s\tfits: %d/%d\tsaved: %.1f%%\tfeature: %s\tcell: %s\tscore: %.4f' % (
+            nf, fits, exhaustive_fits, 100.0 * (1 - fits / exhaustive_fits),
+            self.matrix.names[subsets[winner][-1]], self.best_cells[winner], best[winner])
+        if check:
+            full, full_cells = self._exhaustive(subsets, nf)
+            full_winner = pick(full)
+            match = full_winner == winner and np.isclose(full[full_winner], best[winner])
+            line += '\texhaustive: %s %s %.4f\tmatch: %s' % (
+                self.matrix.names[subsets[full_winner][-1]], full_cells[full_winner],
+                full[full_winner], match)
+            if not self.race:
+                # How far the search fell short of the grid, over all candidates
+                gap = np.abs(full - best)
+                line += '\tcandidate gap: mean %.4f max %.4f' % (gap.mean(), gap.max())
+        print('\n%s %s' % (label, line))
+        if report_filename is not None:
+            with open(report_filename, 'a', encoding="utf-8") as f:
+                f.write(line + '\n')
+        return best
@@ -0,0 +1,230 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Stage timing and progress for the training and prediction scripts. The
+# process-wide tracer records a span for every stage of the work (load,
+# select, scale, pca, kernel, fit, predict, write) and named counters, and
+# writes them as a JSON trace in the Chrome trace event format, which Perfetto
+# and chrome://tracing open directly, with a per-stage summary alongside.
+# Worker processes hand their spans back to the parent with drain() and
+# merge(), so a trace covers a whole parallel sweep.
+#
+# The tracer is disabled unless a script enables it. A disabled tracer hands
+# out one shared no-op context manager and records nothing.
+#
+# Progress estimates the rate and remaining time of a run of work units, the
+# forward selection sweeps use it for their ETA.
+#
+# Usage: python timing.py <trace.json>    (prints the summary of a trace)
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import contextlib
+from checkpoint import atomic_write_json
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+FORMAT_VERSION = 1
+
+_NO_SPAN = contextlib.nullcontext()
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def format_seconds(seconds):
+    """Duration as h:mm:ss, or m:ss below an hour."""
+    seconds = int(round(seconds))
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return '%d:%02d:%02d' % (h, m, s) if h else '%d:%02d' % (m, s)
+
+
+def summary_lines(summary):
+    """Table of the stages and counters of a trace summary."""
+    lines = ['%-10s %10s %12s %12s %12s' % ('stage', 'count', 'seconds', 'mean ms', 'max ms')]
+    for stage, s in sorted(summary['stages'].items(), key=lambda item: -item[1]['seconds']):
+        lines.append('%-10s %10d %12.3f %12.3f %12.3f' % (stage, s['count'], s['seconds'],
+                                                         1e3 * s['mean_seconds'], 1e3 * s['max_seconds']))
+    for name, value in sorted(summary['counters'].items()):
+        lines.append('%-22s %10d' % (name, value))
+    lines.append('Wall time: %s' % format_seconds(summary['wall_seconds']))
+    return lines
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class _Span:
+    __slots__ = ('tracer', 'stage', 'args', 'start', 'wall')
+
+    def __init__(self, tracer, stage, args):
+        self.tracer = tracer
+        self.stage = stage
+        self.args = args
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._record(self.stage, self.wall, time.perf_counter() - self.start, self.args)
+
+
+class Tracer:
+    """Spans and counters of the stages of one process.
+
+    At most max_events spans are kept as trace events, later spans only
+    update the per-stage totals.
+    """
+
+    def __init__(self, max_events=200000):
+        self.enabled = False
+        self.max_events = max_events
+        self.reset()
+
+    def reset(self):
+        self.events = []
+        self.stats = {}     # stage -> [count, seconds, max seconds]
+        self.counters = {}
+        self.dropped = 0
+        self.started = time.time()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def span(self, stage, **args):
+        """Context manager timing one piece of work of a stage."""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, stage, args)
+
+    def timed(self, stage, f):
+        """f wrapped in a span of stage, f itself when the tracer is disabled."""
+        if not self.enabled:
+            return f
+
+        def wrapper(*args, **kwargs):
+            with self.span(stage):
+                return f(*args, **kwargs)
+        return wrapper
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _record(self, stage, wall, seconds, args):
+        s = self.stats.get(stage)
+        if s is None:
+            s = self.stats[stage] = [0, 0.0, 0.0]
+        s[0] += 1
+        s[1] += seconds
+        s[2] = max(s[2], seconds)
+        if len(self.events) < self.max_events:
+            pid = os.getpid()
+            self.events.append({'name': stage, 'ph': 'X', 'ts': wall * 1e6, 'dur': seconds * 1e6,
+                                'pid': pid, 'tid': pid, 'args': args})
+        else:
+            self.dropped += 1
+
+    def drain(self):
+        """Recorded state handed to merge() in another process, the tracer starts over."""
+        state = (self.events, self.stats, self.counters, self.dropped)
+        started = self.started
+        self.reset()
+        self.started = started
+        return state
+
+    def merge(self, state):
+        events, stats, counters, dropped = state
+        room = max(self.max_events - len(self.events), 0)
+        self.events.extend(events[:room])
+        self.dropped += dropped + max(len(events) - room, 0)
+        for stage, (count, seconds, longest) in stats.items():
+            s = self.stats.setdefault(stage, [0, 0.0, 0.0])
+            s[0] += count
+            s[1] += seconds
+            s[2] = max(s[2], longest)
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Per-stage count and seconds (summed over processes), counters and wall time."""
+        return {'wall_seconds': time.time() - self.started,
+                'stages': {stage: {'count': count, 'seconds': seconds, 'mean_seconds': seconds / count,
+                                   'max_seconds': longest}
+                           for stage, (count, seconds, longest) in self.stats.items()},
+                'counters': dict(self.counters), 'events': len(self.events), 'dropped_events': self.dropped}
+
+    def write(self, filename, **metadata):
+        """Write the trace events and the summary as one JSON file."""
+        atomic_write_json(filename, {'format_version': FORMAT_VERSION, 'metadata': metadata,
+                                     'summary': self.summary(), 'displayTimeUnit': 'ms',
+                                     'traceEvents': self.events})
+
+    def report(self, filename, **metadata):
+        """Write the trace to filename and print its summary, nothing when the tracer is disabled."""
+        if not self.enabled:
+            return
+        self.write(filename, **metadata)
+        print('\n' + '\n'.join(summary_lines(self.summary())))
+        print('Trace written to ' + filename)
+
+
+class Progress:
+    """Rate and estimated remaining time of a run of total work units."""
+
+    def __init__(self, total=0):
+        self.total = total
+        self.done = 0
+        self.start = time.perf_counter()
+
+    def add(self, n=1):
+        self.done += n
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def rate(self):
+        """Units per second so far."""
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Seconds left at the current rate, None before the first unit."""
+        if self.done == 0:
+            return None
+        return max(self.total - self.done, 0) / self.rate
+
+    def format(self):
+        eta = self.eta
+        percent = 100.0 * self.done / self.total if self.total else 0.0
+        return '%.1f%% ETA %s' % (percent, '?' if eta is None else format_seconds(eta))
+
+
+tracer = Tracer()
+
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
+
+    if len(sys.argv) != 2:
+        print('Usage: python timing.py <trace.json>')
+        sys.exit(1)
+
+    with open(sys.argv[1], encoding="utf-8") as f:
+        trace = json.load(f)
+    for key, value in trace['metadata'].items():
+        print('%s: %s' % (key, value))
+    print('\n'.join(summary_lines(trace['summary'])))
+
+if __name__ == "__main__":
+    main()
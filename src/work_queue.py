@@ -0,0 +1,268 @@
+# AntiBiofilm Peptide Research
+# Department of Computer Science and Engineering, Santa Clara University
+
+# Work queue for sweeps distributed over several machines. The queue is a
+# SQLite file on storage shared by the coordinator and the workers, no other
+# service is needed. A sweep running with a queue (SweepExecutor with
+# queue_filename) is the coordinator: it registers a job holding the descriptor
+# matrix, the response and the training script whose score_folds() scores a
+# unit, enqueues the (feature subset, PCA n, C, gamma, fold seed, folds) units
+# of each forward selection step and waits for their scores before picking the
+# step's best candidate.
+#
+# Workers on any machine claim a few units at a time under a lease, renew it
+# before scoring each unit, so the lease only has to outlast one unit, and
+# write the fold scores back. Units whose lease expired (a worker died or lost
+# the storage) are claimed again, a unit failing max_attempts times is marked
+# failed and stops the coordinator. Units are keyed by their content, so a
+# restarted coordinator picks up the scores computed before it stopped.
+#
+# The shared file system must support POSIX locks for SQLite (local disks and
+# most NFSv4 mounts do).
+#
+# Usage: python work_queue.py worker <queue.sqlite> [--processes N] [--batch N] [--lease S] [--idle-exit S]
+#        python work_queue.py status <queue.sqlite>
+# ------------------------------------------------------------------------------
+#                               Libraries
+# ------------------------------------------------------------------------------
+import os
+import json
+import time
+import pickle
+import socket
+import sqlite3
+import argparse
+import traceback
+import importlib.util
+import multiprocessing
+import numpy as np
+from kernel_cache import array_key
+
+# ------------------------------------------------------------------------------
+#                               Variables
+# ------------------------------------------------------------------------------
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+# ------------------------------------------------------------------------------
+#                               Functions
+# ------------------------------------------------------------------------------
+def load_script(path):
+    """Import a training script as a module, without running main()."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def unit_key(unit):
+    cols, n, c, g, seed, folds = unit
+    return json.dumps([list(map(int, cols)), int(n), c, g, seed, list(folds)])
+
+
+def run_worker(filename, batch=4, lease=300.0, idle_exit=None, poll=1.0, max_attempts=3):
+    """Claim and score units until the queue stays empty for idle_exit seconds (forever if None)."""
+    from sweep import limit_blas_threads
+    limit_blas_threads()
+    queue = WorkQueue(filename)
+    worker = '%s:%d' % (socket.gethostname(), os.getpid())
+    jobs = {}
+    idle_since = time.time()
+    done = 0
+    while True:
+        claimed = queue.claim(worker, batch, lease, max_attempts)
+        if not claimed:
+            if idle_exit is not None and time.time() - idle_since > idle_exit:
+                break
+            time.sleep(poll)
+            continue
+        for uid, job, unit in claimed:
+            if job not in jobs:
+                jobs[job] = queue.load_job(job)
+            score_folds, matrix, y = jobs[job]
+            cols, n, c, g, seed, folds = unit
+            # The units still waiting in the batch keep their leases while this one is scored
+            queue.renew(worker, lease)
+            try:
+                scores = score_folds(matrix.take(list(cols)), y, n, c, g, seed, tuple(folds))
+            except Exception:
+                queue.fail(uid, worker, traceback.format_exc(), max_attempts)
+                continue
+            queue.complete(uid, worker, scores)
+            done += 1
+        idle_since = time.time()
+    queue.close()
+    return done
+
+# ------------------------------------------------------------------------------
+#                               Classes
+# ------------------------------------------------------------------------------
+class WorkQueue:
+    """Jobs and their sweep units in a SQLite file."""
+
+    def __init__(self, filename, timeout=60.0):
+        self.filename = filename
+        self.db = sqlite3.connect(filename, timeout=timeout, isolation_level=None)
+        self.db.execute('CREATE TABLE IF NOT EXISTS jobs (job INTEGER PRIMARY KEY, key TEXT UNIQUE, '
+                        'payload BLOB, created REAL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS units (id INTEGER PRIMARY KEY, job INTEGER, key TEXT, '
+                        'state TEXT, worker TEXT, lease_until REAL, attempts INTEGER, result BLOB, '
+                        'error TEXT, UNIQUE (job, key))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS units_state ON units (state, id)')
+
+    def close(self):
+        self.db.close()
+
+    def _write(self):
+        # Claims and submissions take the write lock up front so two workers never claim the same unit
+        self.db.execute('BEGIN IMMEDIATE')
+
+    def add_job(self, script, function, matrix, y, settings):
+        """Register a job, or find the identical one, returning its id.
+
+        A worker loads script, sets the module globals in settings (the CV
+        settings its function reads) and scores units with the function.
+        """
+        script = os.path.abspath(script)
+        key = array_key(matrix.values, np.asarray(y), repr(matrix.names), script, function, sorted(settings.items()))
+        payload = pickle.dumps({'script': script, 'function': function, 'settings': settings,
+                                'matrix': matrix, 'y': y}, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write()
+        try:
+            self.db.execute('INSERT OR IGNORE INTO jobs (key, payload, created) VALUES (?, ?, ?)',
+                            (key, payload, time.time()))
+            job = self.db.execute('SELECT job FROM jobs WHERE key = ?', (key,)).fetchone()[0]
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return job
+
+    def load_job(self, job):
+        """(score function, matrix, y) of a job."""
+        payload = pickle.loads(self.db.execute('SELECT payload FROM jobs WHERE job = ?', (job,)).fetchone()[0])
+        module = load_script(payload['script'])
+        for name, value in payload['settings'].items():
+            setattr(module, name, value)
+        return getattr(module, payload['function']), payload['matrix'], payload['y']
+
+    def submit(self, job, units):
+        """Enqueue units of a job, returning their ids; units already queued keep their state and scores."""
+        keys = [unit_key(unit) for unit in units]
+        self._write()
+        try:
+            self.db.executemany('INSERT OR IGNORE INTO units (job, key, state, attempts) VALUES (?, ?, ?, 0)',
+                                [(job, key, PENDING) for key in keys])
+            ids = {}
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ','.join('?' * len(chunk))
+                ids.update(self.db.execute('SELECT key, id FROM units WHERE job = ? AND key IN (%s)' % marks,
+                                           [job] + chunk).fetchall())
+                # Failed units submitted again get a new set of attempts
+                self.db.execute('UPDATE units SET state = ?, attempts = 0 WHERE job = ? AND state = ? '
+                                'AND key IN (%s)' % marks, [PENDING, job, FAILED] + chunk)
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return [ids[key] for key in keys]
+
+    def claim(self, worker, batch, lease, max_attempts=3):
+        """Lease up to batch pending or expired units, as (id, job, unit) in queue order."""
+        now = time.time()
+        self._write()
+        try:
+            # Units out of attempts whose lease expired are failed rather than claimed again
+            self.db.execute('UPDATE units SET state = ?, error = ? WHERE state = ? AND lease_until < ? '
+                            'AND attempts >= ?', (FAILED, 'lease expired %d times' % max_attempts, LEASED, now,
+                                                  max_attempts))
+            rows = self.db.execute('SELECT id, job, key FROM units WHERE state = ? OR (state = ? AND lease_until < ?) '
+                                   'ORDER BY id LIMIT ?', (PENDING, LEASED, now, batch)).fetchall()
+            self.db.executemany('UPDATE units SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 '
+                                'WHERE id = ?', [(LEASED, worker, now + lease, uid) for uid, _, _ in rows])
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return [(uid, job, json.loads(key)) for uid, job, key in rows]
+
+    def renew(self, worker, lease):
+        """Extend the leases the worker holds."""
+        self.db.execute('UPDATE units SET lease_until = ? WHERE worker = ? AND state = ?',
+                        (time.time() + lease, worker, LEASED))
+
+    def complete(self, uid, worker, scores):
+        # A unit scored twice after a lease expired keeps the first scores, both are the same
+        self.db.execute('UPDATE units SET state = ?, worker = ?, result = ?, error = NULL WHERE id = ? AND state != ?',
+                        (DONE, worker, np.asarray(scores, dtype=np.float64).tobytes(), uid, DONE))
+
+    def fail(self, uid, worker, error, max_attempts=3):
+        self.db.execute('UPDATE units SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ? '
+                        'WHERE id = ? AND worker = ? AND state = ?',
+                        (max_attempts, FAILED, PENDING, error, uid, worker, LEASED))
+
+    def wait(self, ids, poll=1.0):
+        """Yield the fold scores of units in order, waiting for the workers to finish them."""
+        position = 0
+        while position < len(ids):
+            chunk = ids[position:position + 500]
+            rows = dict((uid, (state, result, error)) for uid, state, result, error in self.db.execute(
+                'SELECT id, state, result, error FROM units WHERE id IN (%s)' % ','.join('?' * len(chunk)), chunk))
+            for uid in chunk:
+                state, result, error = rows[uid]
+                if state == FAILED:
+                    raise RuntimeError('Work unit %d failed:\n%s' % (uid, error))
+                if state != DONE:
+                    break
+                position += 1
+                yield np.frombuffer(result, dtype=np.float64)
+            else:
+                continue
+            time.sleep(poll)
+
+    def status(self):
+        """{job: {state: unit count}}."""
+        counts = {}
+        for job, state, count in self.db.execute('SELECT job, state, COUNT(*) FROM units GROUP BY job, state'):
+            counts.setdefault(job, {})[state] = count
+        return counts
+
+# ------------------------------------------------------------------------------
+#                               Main
+# ------------------------------------------------------------------------------
+def main():
+
+    parser = argparse.ArgumentParser(description='Sweep work queue on shared storage')
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help='score queued units')
+    worker.add_argument('queue')
+    worker.add_argument('--processes', type=int, default=1, help='worker processes on this machine')
+    worker.add_argument('--batch', type=int, default=4, help='units claimed at a time')
+    worker.add_argument('--lease', type=float, default=300.0, help='seconds a claim is held without renewal')
+    worker.add_argument('--idle-exit', type=float, default=None, help='exit after this many idle seconds')
+    worker.add_argument('--max-attempts', type=int, default=3)
+    status = commands.add_parser('status', help='print the unit counts of each job')
+    status.add_argument('queue')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        queue = WorkQueue(args.queue)
+        for job, counts in sorted(queue.status().items()):
+            print('Job %d: %s' % (job, '  '.join('%s %d' % item for item in sorted(counts.items()))))
+        return
+
+    kwargs = dict(batch=args.batch, lease=args.lease, idle_exit=args.idle_exit, max_attempts=args.max_attempts)
+    if args.processes == 1:
+        done = run_worker(args.queue, **kwargs)
+    else:
+        with multiprocessing.Pool(args.processes) as pool:
+            results = [pool.apply_async(run_worker, (args.queue,), kwargs) for _ in range(args.processes)]
+            done = sum(result.get() for result in results)
+    print('Units scored: %d' % done)
+
+if __name__ == "__main__":
+    main()